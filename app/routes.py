@@ -12,7 +12,7 @@ import os
 from datetime import datetime
 from src.agent.planning.planner import PlanningAgent
 from src.utils.logger import create_logger, create_output_directory
-from src.llm import LLM
+from src.llm import LLM, get_circuit_breaker_states
 from src.tools.atomic_insights import atomic_insights
 from src.memory.summarizer import summarize_history
 
@@ -193,6 +193,8 @@ async def streaming_query(request: StreamingQueryRequest):
                              logger.warning(f"Planner yielded unexpected type: {type(output)}")
                              yield format_stream_response(qa_id, user_id, conversation_id, "stream", {"content": f"[WARN] Unexpected output from planner: {str(output)[:100]}"}) # Place warning in content.content
                     logger.info(f"Analysis generator finished for qa={qa_id}, conv={conversation_id}.")
+                    # 写入分阶段 LLM 调用统计并关闭本次运行日志
+                    run_logger.finalize()
 
 
                     # Ensure generator finished and we got the summary
@@ -264,8 +266,14 @@ async def data_processing(request: DataProcessingRequest):
             # Pass the raw_data directly to atomic_insights
             # atomic_insights handles the internal LLM calls and processing
             # Consider specifying model_id if not default
-            processed_data = atomic_insights(parsed_data=raw_data)
-            logger.info(f"Finished atomic insights analysis.")
+            store_stats = {}
+            processed_data = atomic_insights(parsed_data=raw_data, store_stats=store_stats)
+            if store_stats:
+                logger.info(f"Finished atomic insights analysis, reused {store_stats['hit']}/{store_stats['total']} "
+                            f"stored results ({store_stats['reuse_ratio']:.1%}), {store_stats['duplicates']} near-duplicates, "
+                            f"stored {store_stats['stored']} new results.")
+            else:
+                logger.info(f"Finished atomic insights analysis.")
 
             # 创建新的结果列表以保留所有原始字段
             final_processed_data = []
@@ -296,7 +304,10 @@ async def data_processing(request: DataProcessingRequest):
         # 返回处理结果 (atomic_insights return value is the content)
         processing_duration = time.time() - request_start_time
         logger.info(f"Data processing completed in {processing_duration:.2f}s for {len(processed_data)} items.")
-        return {"content": processed_data}
+        response = {"content": processed_data}
+        if store_stats:
+            response["store_stats"] = store_stats
+        return response
 
     except Exception as e:
         # 超时或其他错误处理
@@ -319,6 +330,7 @@ async def conversation_summary(request: ConversationSummaryRequest):
             llm_kwargs = {}
             if model_id:
                 llm_kwargs['model'] = model_id
+                llm_kwargs['routing'] = False  # 显式指定的模型不参与路由
                 
             llm = LLM(**llm_kwargs)
             
@@ -343,4 +355,16 @@ async def conversation_summary(request: ConversationSummaryRequest):
         # 一般错误处理
         request_duration = time.time() - request_start_time
         logger.error(f"摘要接口出错，耗时 {request_duration:.2f}s: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=ERROR_CODES["INTERNAL_ERROR_500"])
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=ERROR_CODES["INTERNAL_ERROR_500"])
+
+
+# 健康检查接口：任一模型熔断打开时状态为 degraded
+@router.get('/health')
+async def health():
+    circuit_breakers = get_circuit_breaker_states()
+    degraded = any(state["state"] != "closed" for state in circuit_breakers.values())
+    return {
+        "status": "degraded" if degraded else "ok",
+        "time": datetime.now().isoformat(),
+        "circuit_breakers": circuit_breakers,
+    }
@@ -2,7 +2,14 @@ import os
 import json
 from typing import Dict, List, Any
 from src.llm import LLM
-from src.utils.extract_markdown import extract_structured_data
+from src.utils.structured_output import StructuredOutputError
+
+# generate_data_driven_insight 的输出结构，content 可以是文本或结构化的分析
+INSIGHT_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["content"],
+    "properties": {"content": {}},
+}
 
 class BaseAnalyzer:
     """分析器基类，提供通用功能和属性"""
@@ -55,20 +62,13 @@ class BaseAnalyzer:
         # 构建消息列表
         messages = [{"role": "user", "content": user_message}]
         
-        # 调用LLM生成洞察
-        response = self.llm.generate(messages, system_prompt=system_prompt)
-        
-        # 使用extract_structured_data处理响应
-        result = extract_structured_data(response, 'json')
-        
-        # 如果无法提取有效JSON或没有content字段，则提供默认结构
-        if result is None:
+        # 调用LLM生成洞察，输出按 schema 校验，不合规时修复
+        try:
+            return self.llm.generate_structured(messages, INSIGHT_SCHEMA, system_prompt=system_prompt,
+                                                label=f"analyzer.insight.{analysis_type}", task_class="analysis")
+        except StructuredOutputError:
+            # 修复后仍无法得到 content 字段时提供默认结构
             return {"content": "无法从数据中提取有意义的洞察。"}
-        
-        if "content" not in result:
-            result = {"content": response}
-            
-        return result
     
     def save_result(self, result: Dict[str, Any], filename: str) -> None:
         """保存分析结果到文件
@@ -84,7 +84,9 @@ class GreetingBot:
                 messages=llm_messages,
                 system_prompt=system_prompt,
                 tools=llm_tools_definition,
-                tool_choice="auto" # 让模型决定是否调用工具
+                tool_choice="auto", # 让模型决定是否调用工具
+                label="chat.tool_decision",
+                task_class="chat"
             )
             # 记录完整的模型响应内容
             logger.log_custom(f"ask_tool 响应: {tool_decision_message}")
@@ -127,6 +129,7 @@ class GreetingBot:
                     messages=llm_messages,
                     system_prompt=system_prompt,
                     # 不需要传递 tools 或 tool_choice 给纯文本生成
+                    label="chat.stream"
                 )
 
                 # 流式处理文本响应
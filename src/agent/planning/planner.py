@@ -220,7 +220,9 @@ class PlanningAgent:
             system_prompt=system_prompt,
             tools=self.tools,
             tool_choice="auto", # Let the LLM decide which tools to call
-            temperature=0.0 # For deterministic planning
+            temperature=0.0, # For deterministic planning
+            label="planning.plan_tasks",
+            task_class="planning"
         )
         self.logger.log_custom(f"LLM 响应: {response_message}")
 
@@ -272,7 +274,8 @@ class PlanningAgent:
 
         # 确定要执行的任务
         if structured_query:
-            plan = self.plan_tasks(structured_query)
+            with self.logger.track_llm_usage():
+                plan = self.plan_tasks(structured_query)
             if plan.get("error"):
                 yield {"status": "failure", "error": plan["error"]}
                 return
@@ -286,12 +289,13 @@ class PlanningAgent:
         # 执行分析任务
         for task_name in selected_tasks:
             yield f"[TASK_START] {task_name}"
-            result = execute_tool(
-                tool_name=task_name,
-                tool_arguments_str=json.dumps({"data": result_data}),  # 使用正确的参数名data
-                tool_instances=self.analyzers,
-                logger=self.logger
-            )
+            with self.logger.track_llm_usage():
+                result = execute_tool(
+                    tool_name=task_name,
+                    tool_arguments_str=json.dumps({"data": result_data}),  # 使用正确的参数名data
+                    tool_instances=self.analyzers,
+                    logger=self.logger
+                )
             if result["task_type"] == "error":
                 error_details = result['content'].get('details', '')
                 yield f"[TASK_ERROR] {task_name}: {result['content']['error']} - {error_details}"
@@ -304,13 +308,15 @@ class PlanningAgent:
             yield "[REPORT_START] 生成最终报告"
             final_report_path = os.path.join(self.reports_dir, "final_report.html")
             # 恢复：传递空列表，让报告生成器自己加载文件
-            self.report_generator.generate_report([], final_report_path)
+            with self.logger.track_llm_usage():
+                self.report_generator.generate_report([], final_report_path)
             yield f"[REPORT_DONE] {final_report_path}"
 
         yield {
             "status": "success",
             "message": "分析完成",
-            "final_report_path": final_report_path if generate_report_flag else None
+            "final_report_path": final_report_path if generate_report_flag else None,
+            "llm_usage": self.logger.llm_usage.totals()
         }
 
 
@@ -18,8 +18,9 @@ class QueryRewriter:
         response = self.llm.generate(
             messages=messages,
             system_prompt=QUERY_REWRITE_SYSTEM_PROMPT, 
-            model='deepseek-v3-online',
-            json_output=True
+            json_output=True,
+            label="query_rewrite.rewrite",
+            task_class="search"
         )
 
         background = response['background']
@@ -42,9 +43,9 @@ class QueryRewriter:
         response = self.llm.generate(
             messages=messages,
             system_prompt=KEYWORD_GEN_SYSTEM_PROMPT, # 使用导入的常量
-            model='deepseek-v3-online',
-            # model='deepseek-v3',
-            json_output=True
+            json_output=True,
+            label="query_rewrite.keywords",
+            task_class="search"
         )
         
         _ = response['xiaohongshu'] 
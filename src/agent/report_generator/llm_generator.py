@@ -311,11 +311,12 @@ class ReportLLMGenerator:
         
         print(f"报告已生成: {output_path}")
     
-    def _generate_with_stream(self, prompt: str):
+    def _generate_with_stream(self, prompt: str, label: Optional[str] = None):
         """辅助方法：根据当前流式状态生成内容
         
         Args:
             prompt: 提示词
+            label: LLM 调用阶段标签，用于计量汇总
             
         Returns:
             str或生成器: 根据流式状态返回字符串或内容生成器
@@ -333,7 +334,7 @@ class ReportLLMGenerator:
         try:
             # 直接使用非流式模式，新版API不支持直接设置stream属性
             # 传递包装好的 llm_messages 列表给 messages 参数
-            return self.llm.generate(messages=llm_messages)
+            return self.llm.generate(messages=llm_messages, label=label, task_class="report")
         except Exception as e:
             if self.logger:
                 self.logger.log_error(f"生成内容失败: {str(e)}")
@@ -409,7 +410,7 @@ class ReportLLMGenerator:
         请生成完整的HTML代码片段，不要包含<html>、<head>或<body>标签。
         """
         
-        return self._generate_with_stream(prompt)
+        return self._generate_with_stream(prompt, label="report.executive_summary")
     
     def generate_brand_comparison(self, brand_mentions_data: Dict) -> str:
         """生成品牌对比分析模块
@@ -480,7 +481,7 @@ class ReportLLMGenerator:
         请生成完整的HTML代码片段，包含必要的CSS样式和ECharts.js的图表配置。不要包含<html>、<head>或<body>标签。
         """
         
-        return self._generate_with_stream(prompt)
+        return self._generate_with_stream(prompt, label="report.brand_comparison")
     
     def generate_brand_sentiment(self, brand_sentiment_data: Dict) -> str:
         """生成品牌情感分析模块
@@ -538,7 +539,7 @@ class ReportLLMGenerator:
         请生成完整的HTML代码片段，包含必要的CSS样式和ECharts.js的图表配置。不要包含<html>、<head>或<body>标签。
         """
         
-        return self._generate_with_stream(prompt)
+        return self._generate_with_stream(prompt, label="report.brand_sentiment")
     
     def generate_trend_analysis(self, trend_data: Dict) -> str:
         """生成趋势分析模块
@@ -605,7 +606,7 @@ class ReportLLMGenerator:
         请生成完整的HTML代码片段，包含必要的CSS样式和ECharts.js的图表配置。不要包含<html>、<head>或<body>标签。
         """
         
-        return self._generate_with_stream(prompt)
+        return self._generate_with_stream(prompt, label="report.trend_analysis")
     
     def generate_competitor_analysis(self, competitor_data: Dict) -> str:
         """生成竞争品牌分析模块
@@ -674,7 +675,7 @@ class ReportLLMGenerator:
         请生成完整的HTML代码片段，包含必要的CSS样式和ECharts.js的图表配置。不要包含<html>、<head>或<body>标签。
         """
         
-        return self._generate_with_stream(prompt)
+        return self._generate_with_stream(prompt, label="report.competitor_analysis")
     
     def generate_feature_analysis(self, feature_data: Dict) -> str:
         """生成产品特征分析模块
@@ -743,7 +744,7 @@ class ReportLLMGenerator:
         请生成完整的HTML代码片段，包含必要的CSS样式和ECharts.js的图表配置。不要包含<html>、<head>或<body>标签。
         """
         
-        return self._generate_with_stream(prompt)
+        return self._generate_with_stream(prompt, label="report.feature_analysis")
     
     def generate_keyword_analysis(self, keyword_data: Dict) -> str:
         """生成关键词分析模块
@@ -816,7 +817,7 @@ class ReportLLMGenerator:
         # 将 prompt 包装成正确的 messages 格式
         llm_messages = [{"role": "user", "content": prompt}]
         # 传递包装好的 llm_messages 列表给 messages 参数
-        return self.llm.generate(messages=llm_messages)
+        return self.llm.generate(messages=llm_messages, label="report.keyword_analysis", task_class="report")
     
     def generate_optimization_suggestions(self, all_data: Dict[str, Any]) -> str:
         """生成品牌优化建议模块
@@ -886,7 +887,7 @@ class ReportLLMGenerator:
         # 将 prompt 包装成正确的 messages 格式
         llm_messages = [{"role": "user", "content": prompt}]
         # 传递包装好的 llm_messages 列表给 messages 参数
-        return self.llm.generate(messages=llm_messages)
+        return self.llm.generate(messages=llm_messages, label="report.optimization_suggestions", task_class="report")
     
     def generate_ip_distribution_analysis(self, ip_distribution_data: Dict) -> str:
         """生成用户地理分布分析模块
@@ -961,7 +962,7 @@ class ReportLLMGenerator:
         请生成完整的HTML代码片段，包含必要的CSS样式和ECharts.js的图表配置。不要包含<html>、<head>或<body>标签。
         """
         
-        return self._generate_with_stream(prompt)
+        return self._generate_with_stream(prompt, label="report.ip_distribution")
     
     def get_css_styles(self) -> str:
         """获取CSS样式
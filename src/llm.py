@@ -1,40 +1,1068 @@
-from openai import OpenAI, RateLimitError, APIError, AuthenticationError
-from openai.types.chat import ChatCompletionMessage, ChatCompletionChunk
-from typing import Optional, Dict, Any, List, Union, Generator
+from openai import (OpenAI, AsyncOpenAI, RateLimitError, APIError, AuthenticationError,
+                    APIConnectionError, InternalServerError)
+from openai.types.chat import ChatCompletion, ChatCompletionMessage, ChatCompletionChunk
+from typing import Optional, Dict, Any, List, Union, Tuple, Generator, AsyncGenerator
+import os
 import json
+import time
+import asyncio
+import atexit
+import weakref
+import logging
+import threading
+import importlib.util
+import contextvars
+import collections
 import concurrent.futures
-from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
+import httpx
+from tenacity import Retrying, AsyncRetrying, stop_after_attempt, wait_random_exponential, retry_if_exception_type
+from src.utils.llm_cache import LLMCache, make_cache_key, is_deterministic_request
+from src.utils.single_flight import SingleFlight
+from src.utils.rate_limiter import RateLimiter, estimate_request_tokens, estimate_text_tokens
+from src.utils.llm_metrics import record_llm_call
+from src.utils.hedging import HedgePolicy
+from src.utils.cassette import Cassette
+from src.utils.concurrency import ConcurrencyRegistry
+from src.utils.structured_output import StructuredOutputError, StructuredRepair, extraction_stats
+from src.utils.streaming_json import IncrementalJSONParser, StreamingJSONError
+from src.utils.batch_job import BatchJob
+from src.utils.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError
+from src.utils.generation_guard import OutputBudgets, RepetitionDetector
 
-class LLM:
-    def __init__(self, model: str = "deepseek-v3", api_key: Optional[str] = None):
+logger = logging.getLogger(__name__)
+
+# 共享 HTTP 连接池的默认配置，可通过 configure_client_pool 调整
+DEFAULT_CLIENT_POOL_CONFIG: Dict[str, Any] = {
+    "max_connections": 100,           # 每个客户端的最大连接数
+    "max_keepalive_connections": 20,  # 保持 keep-alive 的空闲连接数
+    "keepalive_expiry": 30.0,         # 空闲连接保留时间(秒)
+    "timeout": 600.0,                 # 请求超时时间(秒)
+    "http2": False,                   # 是否启用 HTTP/2 (需要安装 h2)
+}
+
+
+class ClientRegistry:
+    """进程级 OpenAI 客户端注册表
+
+    按 (base_url, api_key) 复用 OpenAI 客户端及其底层 httpx 连接池，
+    避免每次调用都重新建立连接和 TLS 握手。线程安全。
+    """
+
+    def __init__(self, **pool_config: Any):
+        self.pool_config = {**DEFAULT_CLIENT_POOL_CONFIG, **pool_config}
+        self._clients: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _http2_enabled(self) -> bool:
+        if not self.pool_config["http2"]:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("已开启 http2 但未安装 h2 包，回退到 HTTP/1.1")
+            return False
+        return True
+
+    def _build_http_client(self) -> httpx.Client:
+        return httpx.Client(**self._http_client_kwargs())
+
+    def _http_client_kwargs(self) -> Dict[str, Any]:
+        limits = httpx.Limits(
+            max_connections=self.pool_config["max_connections"],
+            max_keepalive_connections=self.pool_config["max_keepalive_connections"],
+            keepalive_expiry=self.pool_config["keepalive_expiry"],
+        )
+        return {
+            "limits": limits,
+            "timeout": self.pool_config["timeout"],
+            "http2": self._http2_enabled(),
+        }
+
+    def _client_store(self) -> Dict[tuple, Any]:
+        return self._clients
+
+    def _create_client(self, base_url: str, api_key: str) -> OpenAI:
+        return OpenAI(base_url=base_url, api_key=api_key, http_client=self._build_http_client())
+
+    def get(self, base_url: str, api_key: str) -> OpenAI:
+        """获取 (base_url, api_key) 对应的共享客户端，不存在时创建"""
+        key = (base_url, api_key)
+        clients = self._client_store()
+        client = clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            clients = self._client_store()
+            client = clients.get(key)
+            if client is None:
+                client = self._create_client(base_url, api_key)
+                clients[key] = client
+            return client
+
+    def configure(self, **pool_config: Any) -> None:
+        """更新连接池配置，已创建的客户端会被关闭并在下次使用时重建"""
+        unknown = set(pool_config) - set(DEFAULT_CLIENT_POOL_CONFIG)
+        if unknown:
+            raise ValueError(f"未知的连接池配置项: {sorted(unknown)}")
+        with self._lock:
+            self.pool_config.update(pool_config)
+            self._close_clients()
+
+    def close(self) -> None:
+        """关闭所有共享客户端"""
+        with self._lock:
+            self._close_clients()
+
+    def _close_clients(self) -> None:
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+
+class AsyncClientRegistry(ClientRegistry):
+    """AsyncOpenAI 客户端注册表
+
+    httpx.AsyncClient 的连接绑定在创建它的事件循环上，因此按事件循环分别缓存，
+    事件循环被回收时对应客户端随之释放。
+    """
+
+    def __init__(self, **pool_config: Any):
+        super().__init__(**pool_config)
+        self._clients_by_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+
+    def _client_store(self) -> Dict[tuple, Any]:
+        loop = asyncio.get_running_loop()
+        clients = self._clients_by_loop.get(loop)
+        if clients is None:
+            clients = self._clients_by_loop.setdefault(loop, {})
+        return clients
+
+    def _create_client(self, base_url: str, api_key: str) -> AsyncOpenAI:
+        return AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=httpx.AsyncClient(**self._http_client_kwargs()))
+
+    def _close_clients(self) -> None:
+        # AsyncClient 只能在事件循环内关闭，这里仅丢弃引用，下次使用时重建
+        self._clients_by_loop.clear()
+
+
+# 所有 LLM / AsyncLLM 实例共享的客户端注册表
+client_registry = ClientRegistry()
+async_client_registry = AsyncClientRegistry()
+
+
+def configure_client_pool(**pool_config: Any) -> None:
+    """调整共享连接池配置 (max_connections、max_keepalive_connections、keepalive_expiry、timeout、http2)"""
+    client_registry.configure(**pool_config)
+    async_client_registry.configure(**pool_config)
+
+
+# 覆盖所有模型的 base_url (如指向本地桩服务 src.utils.llm_stub_server)，也可通过环境变量 LLM_BASE_URL 设置
+_base_url_override: Optional[str] = os.environ.get("LLM_BASE_URL") or None
+
+
+def configure_base_url(base_url: Optional[str]) -> None:
+    """让所有模型改用指定的 base_url，传 None 恢复默认的方舟地址"""
+    global _base_url_override
+    _base_url_override = base_url
+
+
+def _base_url_for_model(model_id: str) -> str:
+    """根据模型 ID 返回对应的 API base_url"""
+    if _base_url_override:
+        return _base_url_override
+    if model_id == 'bot-20250321210824-76l48':
+        return "https://ark.cn-beijing.volces.com/api/v3/bots"
+    return "https://ark.cn-beijing.volces.com/api/v3"
+
+
+# 进程级默认响应缓存，未在实例上指定 cache 时使用；默认关闭
+_default_cache: Optional[LLMCache] = None
+
+
+def enable_llm_cache(path: Optional[str] = None, **cache_options: Any) -> LLMCache:
+    """开启进程级 LLM 响应缓存，所有未单独指定 cache 的 LLM 实例共用
+
+    Args:
+        path: SQLite 文件路径，默认 data/llm_cache.sqlite
+        **cache_options: 传给 LLMCache 的其他参数 (max_entries、ttl_seconds、allow_sampling)
+
+    Returns:
+        LLMCache: 启用的缓存实例
+    """
+    global _default_cache
+    if path:
+        cache_options["path"] = path
+    _default_cache = LLMCache(**cache_options)
+    return _default_cache
+
+
+def disable_llm_cache() -> None:
+    """关闭进程级 LLM 响应缓存"""
+    global _default_cache
+    _default_cache = None
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """返回当前的进程级 LLM 响应缓存 (未开启时为 None)"""
+    return _default_cache
+
+
+if os.environ.get("LLM_CACHE_PATH"):
+    enable_llm_cache(os.environ["LLM_CACHE_PATH"])
+
+
+# 进程级录制/回放 cassette，未在实例上指定 cassette 时使用；默认关闭
+_default_cassette: Optional[Cassette] = None
+
+
+def start_cassette(path: str, mode: str = "replay", latency: str = "recorded") -> Cassette:
+    """开启进程级录制或回放
+
+    Args:
+        path: 录制文件路径 (JSONL，以 .gz 结尾时压缩)
+        mode: "record" 录制真实请求，"replay" 回放录制的响应
+        latency: 回放时 "recorded" 按录制耗时等待，"zero" 立即返回
+
+    Returns:
+        Cassette: 生效的 cassette
+    """
+    global _default_cassette
+    stop_cassette()
+    _default_cassette = Cassette(path, mode=mode, latency=latency)
+    return _default_cassette
+
+
+def stop_cassette() -> None:
+    """关闭进程级录制/回放，录制文件会被关闭"""
+    global _default_cassette
+    if _default_cassette is not None:
+        _default_cassette.close()
+    _default_cassette = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """返回当前的进程级 cassette (未开启时为 None)"""
+    return _default_cassette
+
+
+# 通过环境变量开启，便于对 main.py、PlanningAgent 等入口做端到端回放压测
+if os.environ.get("LLM_CASSETTE"):
+    start_cassette(os.environ["LLM_CASSETTE"],
+                   mode=os.environ.get("LLM_CASSETTE_MODE", "replay"),
+                   latency=os.environ.get("LLM_CASSETTE_LATENCY", "recorded"))
+
+
+# 进程级请求合并器：相同请求在途时，后续调用等待第一次调用的结果
+single_flight = SingleFlight()
+
+
+# 模型别名到模型 ID 的映射，LLM 与 AsyncLLM 共用
+MODEL_MAP: Dict[str, str] = {
+    "deepseek-v3": "deepseek-v3-250324",
+    "deepseek-v3-online": "bot-20250321210824-76l48",
+    "doubao-lite": "doubao-1-5-lite-32k-250115"
+}
+
+# 各模型每分钟请求数 (rpm) 与 token 数 (tpm) 额度，按方舟默认配额设置，以控制台实际配额为准。
+# 未配置的模型不限流。
+MODEL_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+    "deepseek-v3-250324": {"rpm": 15000, "tpm": 1200000},
+    "bot-20250321210824-76l48": {"rpm": 1000, "tpm": 200000},
+    "doubao-1-5-lite-32k-250115": {"rpm": 30000, "tpm": 1200000},
+}
+
+# 各模型上下文窗口 (token)，路由时跳过放不下当前请求的模型
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "deepseek-v3-250324": 64000,
+    "bot-20250321210824-76l48": 64000,
+    "doubao-1-5-lite-32k-250115": 32000,
+}
+
+# 模型档位，同档内按优先顺序排列 (值为模型别名或 ID)
+MODEL_TIERS: Dict[str, List[str]] = {
+    "cheap": ["doubao-lite"],
+    "strong": ["deepseek-v3"],
+    "online": ["deepseek-v3-online"],
+}
+
+# 任务类别的路由规则：
+#   tiers: 依次尝试的档位，首个档位的模型为主模型，其余模型构成回退链
+#   max_prompt_tokens: 提示词估算 token 数超过该值时跳过首个档位 (大输入直接用更强的模型)
+#   latency_budget: 单个模型的延迟预算(秒)，超时或出错时回退到下一个模型
+ROUTING_RULES: Dict[str, Dict[str, Any]] = {
+    "extraction": {"tiers": ["cheap", "strong"], "max_prompt_tokens": 8000, "latency_budget": 60},
+    "analysis": {"tiers": ["strong", "cheap"], "latency_budget": 120},
+    "report": {"tiers": ["strong", "cheap"], "latency_budget": 300},
+    "planning": {"tiers": ["strong", "cheap"], "latency_budget": 60},
+    "chat": {"tiers": ["strong", "cheap"], "latency_budget": 60},
+    "search": {"tiers": ["online", "strong"], "latency_budget": 120},
+}
+
+
+class ModelRouter:
+    """按任务类别与提示词大小为每次请求选择模型，并给出回退链与延迟预算"""
+
+    def __init__(self,
+                 rules: Dict[str, Dict[str, Any]],
+                 tiers: Dict[str, List[str]],
+                 context_windows: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            rules: 任务类别到路由规则的映射，见 ROUTING_RULES
+            tiers: 档位到模型列表的映射，见 MODEL_TIERS
+            context_windows: 模型 ID 到上下文窗口大小的映射
+        """
+        self.rules = {task_class: dict(rule) for task_class, rule in rules.items()}
+        self.tiers = {tier: list(models) for tier, models in tiers.items()}
+        self.context_windows = dict(context_windows or {})
+        self.decisions: collections.deque = collections.deque(maxlen=200)
+        self.stats: Dict[str, Any] = {"routed": {}, "fallbacks": {}}
+        self._lock = threading.Lock()
+
+    def configure(self, task_class: str, **rule: Any) -> None:
+        """新增或更新某个任务类别的路由规则 (如 tiers、max_prompt_tokens、latency_budget)"""
+        with self._lock:
+            self.rules.setdefault(task_class, {"tiers": ["strong"]}).update(rule)
+
+    def route(self, task_class: str, request_params: Dict[str, Any], label: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """为一次请求选择模型
+
+        Args:
+            task_class: 任务类别 (如 "extraction"、"report")
+            request_params: 已构建的请求参数，用于估算提示词大小
+            label: 调用阶段标签，仅用于日志
+
+        Returns:
+            路由决策 {"task_class", "models", "latency_budget", "prompt_tokens", "reason"}，
+            任务类别未配置时返回 None (沿用请求中的模型)
+        """
+        rule = self.rules.get(task_class)
+        if rule is None:
+            logger.warning(f"未配置任务类别 {task_class} 的路由规则，使用默认模型 {request_params['model']}")
+            return None
+
+        prompt_tokens = estimate_request_tokens(request_params, default_completion_tokens=0)
+        tiers = list(rule.get("tiers") or [])
+        reason = f"默认档位 {tiers[0]}" if tiers else "未配置档位"
+        max_prompt_tokens = rule.get("max_prompt_tokens")
+        if max_prompt_tokens and prompt_tokens > max_prompt_tokens and len(tiers) > 1:
+            reason = f"提示词约 {prompt_tokens} tokens 超过 {max_prompt_tokens}，跳过 {tiers[0]} 档"
+            tiers = tiers[1:]
+
+        required_tokens = prompt_tokens + (request_params.get("max_tokens") or 0)
+        models: List[str] = []
+        for tier in tiers:
+            for model in self.tiers.get(tier, []):
+                model_id = MODEL_MAP.get(model, model)
+                window = self.context_windows.get(model_id)
+                if window and required_tokens > window:
+                    continue
+                if model_id not in models:
+                    models.append(model_id)
+        if not models:
+            # 没有放得下的候选模型时沿用请求中的模型，由接口返回明确的错误
+            models = [request_params["model"]]
+            reason += "，无可用候选模型"
+
+        decision = {
+            "time": time.time(),
+            "task_class": task_class,
+            "label": label,
+            "models": models,
+            "latency_budget": rule.get("latency_budget"),
+            "prompt_tokens": prompt_tokens,
+            "reason": reason,
+        }
+        with self._lock:
+            self.decisions.append(decision)
+            routed = self.stats["routed"].setdefault(task_class, {})
+            routed[models[0]] = routed.get(models[0], 0) + 1
+        logger.info(f"模型路由 [{task_class}/{label or '-'}]: {' -> '.join(models)} "
+                    f"(预算 {decision['latency_budget']}s, {reason})")
+        return decision
+
+    def record_fallback(self, task_class: str, from_model: str, to_model: str, error: BaseException) -> None:
+        """记录一次回退"""
+        key = f"{from_model}->{to_model}"
+        with self._lock:
+            fallbacks = self.stats["fallbacks"].setdefault(task_class, {})
+            fallbacks[key] = fallbacks.get(key, 0) + 1
+        logger.warning(f"模型路由 [{task_class}]: {from_model} 失败或超出延迟预算 ({type(error).__name__}: {error})，回退到 {to_model}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回各任务类别的主模型分布、回退次数与最近的路由决策"""
+        with self._lock:
+            return {
+                "routed": {k: dict(v) for k, v in self.stats["routed"].items()},
+                "fallbacks": {k: dict(v) for k, v in self.stats["fallbacks"].items()},
+                "recent_decisions": list(self.decisions)[-20:],
+            }
+
+
+# 进程级模型路由器
+model_router = ModelRouter(ROUTING_RULES, MODEL_TIERS, MODEL_CONTEXT_WINDOWS)
+
+
+def configure_routing(task_class: str, **rule: Any) -> None:
+    """调整某个任务类别的路由规则，例如 configure_routing("analysis", tiers=["cheap", "strong"])"""
+    model_router.configure(task_class, **rule)
+
+
+# 按模型上下文窗口裁剪提示词时为输出预留的 token 数 (请求未指定 max_tokens 时)
+DEFAULT_COMPLETION_RESERVE = 4096
+
+
+class TokenBudgeter:
+    """按 token (而不是字符) 预算裁剪内容
+
+    安装了 tiktoken 时用其 cl100k_base 编码计数，否则退回 estimate_text_tokens 的估算。
+    重复出现的文本 (同一帖子在多个提示词中复用) 的计数会被缓存。线程安全。
+    """
+
+    def __init__(self, context_windows: Dict[str, int], max_cache_entries: int = 50000):
+        """
+        Args:
+            context_windows: 模型 ID 到上下文窗口大小的映射
+            max_cache_entries: 计数缓存的最大条目数
+        """
+        self.context_windows = context_windows
+        self.max_cache_entries = max_cache_entries
+        self._encoding = self._load_encoding()
+        self._counts: collections.OrderedDict = collections.OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "truncated": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_encoding() -> Any:
+        if importlib.util.find_spec("tiktoken") is None:
+            return None
+        try:
+            import tiktoken
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"加载 tiktoken 编码失败，token 计数退回估算: {e}")
+            return None
+
+    def _raw_count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_text_tokens(text)
+
+    def count(self, text: str) -> int:
+        """返回文本的 token 数 (带缓存)"""
+        if not text:
+            return 0
+        with self._lock:
+            cached = self._counts.get(text)
+            if cached is not None:
+                self._counts.move_to_end(text)
+                self.stats["hits"] += 1
+                return cached
+        tokens = self._raw_count(text)
+        with self._lock:
+            self.stats["misses"] += 1
+            self._counts[text] = tokens
+            if len(self._counts) > self.max_cache_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截取不超过 max_tokens 的最长前缀"""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        # 二分查找前缀长度；前缀不写入计数缓存
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._raw_count(text[:mid]) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        with self._lock:
+            self.stats["truncated"] += 1
+        return text[:lo]
+
+    def fit_sections(self, sections: List[Tuple[int, str]], max_tokens: int, separator: str = "\n",
+                     min_partial_tokens: int = 16) -> str:
+        """按优先级把多个片段装入 token 预算，保持原有顺序拼接
+
+        Args:
+            sections: (优先级, 文本) 列表，按展示顺序排列；优先级数值越小越重要，
+                同优先级按出现顺序 (如标题 0 > 正文 1 > 按热度排序的评论 2)
+            max_tokens: token 预算
+            separator: 片段之间的分隔符
+            min_partial_tokens: 剩余预算不足该值时不再截断放入，直接丢弃后续片段
+
+        Returns:
+            str: 拼接后的文本
+        """
+        separator_tokens = self.count(separator)
+        remaining = max_tokens
+        kept: Dict[int, str] = {}
+        for position in sorted(range(len(sections)), key=lambda i: (sections[i][0], i)):
+            text = sections[position][1]
+            if not text:
+                continue
+            cost = self.count(text) + separator_tokens
+            if cost <= remaining:
+                kept[position] = text
+                remaining -= cost
+                continue
+            if remaining - separator_tokens >= min_partial_tokens:
+                kept[position] = self.truncate(text, remaining - separator_tokens)
+            break
+        return separator.join(kept[i] for i in sorted(kept))
+
+    def budget_for(self, model_id: str, reserve_tokens: int = DEFAULT_COMPLETION_RESERVE) -> Optional[int]:
+        """模型上下文窗口扣除输出预留后的提示词预算，未知模型返回 None"""
+        window = self.context_windows.get(MODEL_MAP.get(model_id, model_id))
+        return window - reserve_tokens if window else None
+
+    def fit_request(self, request_params: Dict[str, Any]) -> Dict[str, Any]:
+        """提示词超出模型上下文窗口时裁剪最长的非 system 消息，避免上下文超长错误
+
+        Returns:
+            未超出时原样返回，否则返回裁剪后的新请求参数
+        """
+        budget = self.budget_for(request_params["model"],
+                                 request_params.get("max_tokens") or DEFAULT_COMPLETION_RESERVE)
+        messages = request_params.get("messages") or []
+        counts = [self.count(m["content"]) + 4 if isinstance(m.get("content"), str) else 0 for m in messages]
+        if budget is None or sum(counts) <= budget:
+            return request_params
+        candidates = [i for i, m in enumerate(messages) if m.get("role") != "system" and counts[i]]
+        if not candidates:
+            return request_params
+        longest = max(candidates, key=lambda i: counts[i])
+        allowed = budget - (sum(counts) - counts[longest]) - 4
+        logger.warning(f"提示词约 {sum(counts)} tokens 超出 {request_params['model']} 的预算 {budget}，"
+                       f"裁剪第 {longest} 条消息到 {max(allowed, 0)} tokens")
+        fitted = list(messages)
+        fitted[longest] = {**messages[longest], "content": self.truncate(messages[longest]["content"], allowed)}
+        return {**request_params, "messages": fitted}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tokenizer": "tiktoken" if self._encoding is not None else "estimate",
+                    "cached": len(self._counts), **self.stats}
+
+
+# 进程级 token 预算器
+token_budgeter = TokenBudgeter(MODEL_CONTEXT_WINDOWS)
+
+
+# 所有 LLM / AsyncLLM 调用共用的限流器
+rate_limiter = RateLimiter(MODEL_RATE_LIMITS)
+
+
+def configure_rate_limit(model: str, rpm: Optional[int] = None, tpm: Optional[int] = None) -> None:
+    """调整某个模型 (别名或 ID) 的 rpm/tpm 额度，两者均为空时取消限流"""
+    rate_limiter.configure(MODEL_MAP.get(model, model), rpm=rpm, tpm=tpm)
+
+
+# 各模型端点的自适应在途请求上限 (AIMD)，可通过 concurrency_controllers.add_listener 订阅调整决策
+concurrency_controllers = ConcurrencyRegistry()
+
+
+# 各模型端点的熔断器；熔断打开时请求快速失败 (CircuitOpenError，不重试)，带 task_class 的调用回退到下一个候选模型
+circuit_breakers = CircuitBreakerRegistry()
+
+
+def configure_circuit_breaker(**breaker_options: Any) -> None:
+    """调整熔断参数 (failure_rate_threshold、min_calls、window_seconds、open_seconds 等)，已有熔断器会被重置"""
+    circuit_breakers.configure(**breaker_options)
+
+
+def get_circuit_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """返回各模型熔断器的状态与窗口内错误率，供健康检查接口使用"""
+    return circuit_breakers.snapshot()
+
+
+def _record_breaker_outcome(breaker: CircuitBreaker, error: Optional[BaseException]) -> None:
+    """按请求结果更新熔断器；只有端点故障 (超时、连接错误、5xx、429) 计入错误率"""
+    if error is None:
+        breaker.record_success()
+    elif isinstance(error, (APIConnectionError, InternalServerError, RateLimitError)):
+        breaker.record_failure()
+    else:
+        breaker.record_ignored()
+
+
+# 对冲请求策略，默认关闭，通过 enable_hedging 开启
+_hedge_policy: Optional[HedgePolicy] = None
+# 同步客户端发送对冲请求所用的线程池
+_hedge_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+
+def enable_hedging(max_workers: int = 64, **policy_options: Any) -> HedgePolicy:
+    """开启对冲请求：请求超过其调用类别 (标签) 的 p95 耗时后再发一个相同请求，先返回者胜出
+
+    Args:
+        max_workers: 同步客户端对冲线程池大小
+        **policy_options: 传给 HedgePolicy 的参数 (quantile、max_hedge_rate、min_samples 等)
+
+    Returns:
+        HedgePolicy: 生效的对冲策略，可通过 get_stats() 查看对冲比例与胜负统计
+    """
+    global _hedge_policy, _hedge_executor
+    if _hedge_executor is None:
+        _hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+    _hedge_policy = HedgePolicy(**policy_options)
+    return _hedge_policy
+
+
+def disable_hedging() -> None:
+    """关闭对冲请求"""
+    global _hedge_policy
+    _hedge_policy = None
+
+
+def get_hedging_stats() -> Optional[Dict[str, Any]]:
+    """返回对冲统计，未开启时为 None"""
+    return _hedge_policy.get_stats() if _hedge_policy else None
+
+
+# 按标签学习的输出 token 上限；始终记录输出长度，开启后才为未指定 max_tokens 的请求设置上限
+output_budgets = OutputBudgets()
+_output_budgets_enabled = False
+_output_budgets_path: Optional[str] = None
+
+
+def _save_output_budgets() -> None:
+    if _output_budgets_path:
+        try:
+            output_budgets.save(_output_budgets_path)
+        except OSError as e:
+            logger.warning(f"保存输出长度历史失败: {e}")
+
+
+def enable_output_budgets(path: Optional[str] = None, **budget_options: Any) -> OutputBudgets:
+    """开启按标签学习的 max_tokens 上限，限制失控生成占用并发槽位的时间
+
+    Args:
+        path: 输出长度历史文件，开启时加载、进程退出时保存，使上限跨运行生效
+        **budget_options: 传给 OutputBudgets 的参数 (quantile、headroom、min_samples、ceiling 等)
+
+    Returns:
+        OutputBudgets: 生效的上限统计
+    """
+    global output_budgets, _output_budgets_enabled, _output_budgets_path
+    if budget_options:
+        output_budgets = OutputBudgets(**budget_options)
+    if path:
+        output_budgets.load(path)
+        if _output_budgets_path is None:
+            atexit.register(_save_output_budgets)
+        _output_budgets_path = path
+    _output_budgets_enabled = True
+    return output_budgets
+
+
+def disable_output_budgets() -> None:
+    """关闭 max_tokens 上限 (输出长度仍会被记录)"""
+    global _output_budgets_enabled
+    _output_budgets_enabled = False
+
+
+def get_output_budget_stats() -> Dict[str, Dict[str, Any]]:
+    """返回各标签的输出长度样本数、当前上限、被限制与被截断次数"""
+    return output_budgets.get_stats()
+
+
+if os.environ.get("LLM_OUTPUT_BUDGETS"):
+    enable_output_budgets(os.environ["LLM_OUTPUT_BUDGETS"])
+
+
+def get_extraction_stats() -> Dict[str, Dict[str, Any]]:
+    """返回各调用阶段结构化输出的解析失败率、修复率与修复成功率"""
+    return extraction_stats.get_stats()
+
+
+# ask_tool 的重试策略
+_RETRY_POLICY: Dict[str, Any] = {
+    "wait": wait_random_exponential(min=1, max=20),
+    "stop": stop_after_attempt(3),
+    "retry": retry_if_exception_type((RateLimitError, APIError)),
+}
+
+
+def _usage_total_tokens(completion: ChatCompletion) -> Optional[int]:
+    """从响应 usage 中读取总 token 数"""
+    usage = getattr(completion, "usage", None)
+    return usage.total_tokens if usage else None
+
+
+def _parse_json_content(content: str) -> Any:
+    """解析 LLM 返回的 JSON 内容，失败时尝试从 Markdown 中抽取"""
+    try:
+        # 直接尝试解析JSON
+        return json.loads(content)
+    except json.JSONDecodeError:
+        # 导入抽取工具并使用它处理内容
+        from src.utils.extract_markdown import extract_json_from_markdown
+        extracted_json = extract_json_from_markdown(content)
+        if extracted_json is not None:
+            return extracted_json
+        # 如果仍然无法解析，提供友好的错误信息
+        raise ValueError(f"无法从LLM响应提取JSON结构。响应内容:\n{content[:500]}...")
+
+
+class _BaseLLM:
+    """LLM 与 AsyncLLM 的公共部分：模型解析、消息拼装与请求参数构建"""
+
+    def __init__(self, model: str = "deepseek-v3", api_key: Optional[str] = None,
+                 cache: Optional[LLMCache] = None, routing: bool = True,
+                 cassette: Optional[Cassette] = None):
         """初始化LLM类
         
         Args:
             model: 调用的模型别名 (e.g., "deepseek-v3", "deepseek-v3-online")
-            api_key: API Key (当前硬编码)
+            api_key: API Key，未指定时读取环境变量 ARK_API_KEY
+            cache: 可选的响应缓存，未指定时使用 enable_llm_cache 开启的进程级缓存
+            routing: 是否对带 task_class 的调用启用模型路由；为 False 时始终使用 model
+            cassette: 可选的录制/回放 cassette，未指定时使用 start_cassette 开启的进程级 cassette
         """
-        self.model_map = {
-            "deepseek-v3": "deepseek-v3-250324",
-            "deepseek-v3-online": "bot-20250321210824-76l48",
-            "doubao-lite": "doubao-1-5-lite-32k-250115"
-        }
+        self.model_map = dict(MODEL_MAP)
         self.model = self.model_map[model] # Store the resolved default model ID
-        self.api_key = "" # Store the API key (using hardcoded for now)
+        self.api_key = api_key or os.environ.get("ARK_API_KEY", "") # Explicit key, else the ARK_API_KEY env var
+        self._cache = cache
+        self._cassette = cassette
+        self.routing = routing
+        self.last_batch_stats: Dict[str, Any] = {} # 最近一次 batch_generate 的吞吐统计
+        self.last_batch_job_stats: Dict[str, Any] = {} # 最近一次 generate_batch_job 的任务统计
 
-    def _get_client_for_model(self, model_id: str) -> OpenAI:
-        """Creates an OpenAI client with the correct base_url for the given model_id."""
-        if model_id == 'bot-20250321210824-76l48':
-            base_url = "https://ark.cn-beijing.volces.com/api/v3/bots"
-        else:
-            base_url = "https://ark.cn-beijing.volces.com/api/v3"
-            
-        return OpenAI(
-            base_url=base_url,
-            api_key=self.api_key
+    @property
+    def cache(self) -> Optional[LLMCache]:
+        """当前生效的响应缓存"""
+        return self._cache if self._cache is not None else _default_cache
+
+    @property
+    def cassette(self) -> Optional[Cassette]:
+        """当前生效的录制/回放 cassette"""
+        return self._cassette if self._cassette is not None else _default_cassette
+
+    def _cache_lookup(self, request_params: Dict[str, Any], use_cache: bool) -> tuple:
+        """查询缓存，返回 (cache_key, 缓存的 ChatCompletion)；不使用缓存时 cache_key 为 None"""
+        cache = self.cache
+        cassette = self.cassette
+        if cassette is not None and cassette.recording:
+            # 录制时不读缓存，保证每个请求都被录制
+            use_cache = False
+        if cache is None or not use_cache:
+            return None, None
+        if not cache.is_cacheable(request_params):
+            cache.record_skip()
+            return None, None
+        cache_key = make_cache_key(request_params)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cache_key, ChatCompletion.construct(**cached)
+        return cache_key, None
+
+    def _cache_store(self, cache_key: Optional[str], completion: ChatCompletion) -> None:
+        """将成功的响应写入缓存"""
+        if cache_key is not None and completion.choices:
+            self.cache.set(cache_key, completion.model_dump(mode="json"), model=completion.model)
+
+    def _sent_source(self) -> str:
+        """实际发出 (或回放) 的调用在计量中的来源"""
+        cassette = self.cassette
+        return "replay" if cassette is not None and cassette.replaying else "api"
+
+    @staticmethod
+    def _chunk_text(chunk: ChatCompletionChunk) -> str:
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content
+        return ""
+
+    @staticmethod
+    def _record_completion(label: Optional[str], request_params: Dict[str, Any], completion: ChatCompletion,
+                           start_time: float, retries: int, source: str) -> None:
+        """记录一次成功调用的 token 与延迟；缓存命中和合并的调用不计 token
+
+        实际发出的调用同时计入该标签的输出长度分布，因达到 max_tokens 被截断的记为中止。
+        """
+        usage = getattr(completion, "usage", None)
+        billed = source in ("api", "replay") and usage is not None
+        truncated = bool(completion.choices) and completion.choices[0].finish_reason == "length"
+        if billed:
+            output_budgets.observe(label, usage.completion_tokens, truncated=truncated)
+        record_llm_call(
+            label, request_params["model"],
+            prompt_tokens=usage.prompt_tokens if billed else 0,
+            completion_tokens=usage.completion_tokens if billed else 0,
+            latency=time.time() - start_time, retries=retries, source=source,
+            aborted="max_tokens" if truncated else None,
+        )
+
+    @staticmethod
+    def _record_stream(label: Optional[str], request_params: Dict[str, Any], text: str,
+                       start_time: float, error: Optional[str] = None, aborted: Optional[str] = None) -> None:
+        """记录一次流式调用，流式响应没有 usage，token 数为估算值
+
+        完整结束的流计入输出长度分布；因重复循环被截断的记为中止。
+        """
+        completion_tokens = estimate_text_tokens(text)
+        if error is None and aborted is None:
+            output_budgets.observe(label, completion_tokens)
+        record_llm_call(
+            label, request_params["model"],
+            prompt_tokens=estimate_request_tokens(request_params, default_completion_tokens=0),
+            completion_tokens=completion_tokens,
+            latency=time.time() - start_time, error=error, estimated=True, aborted=aborted,
+        )
+
+    @staticmethod
+    def _flight_key(request_params: Dict[str, Any], cache_key: Optional[str]) -> Optional[str]:
+        """请求合并使用的键，与缓存键一致；带采样的请求不合并"""
+        if cache_key is not None:
+            return cache_key
+        if is_deterministic_request(request_params):
+            return make_cache_key(request_params)
+        return None
+
+    def _resolve_model_id(self, model: Optional[str] = None) -> str:
+        """将模型别名解析为模型 ID，未指定时使用默认模型"""
+        return self.model_map.get(model, self.model) if model else self.model
+
+    @staticmethod
+    def _build_messages(messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """拼装最终消息列表，system_prompt 会插入或替换首条 system 消息"""
+        final_messages = list(messages)
+        if system_prompt:
+            if not final_messages or final_messages[0].get("role") != "system":
+                final_messages.insert(0, {"role": "system", "content": system_prompt})
+            elif final_messages[0].get("role") == "system":
+                final_messages[0] = {**final_messages[0], "content": system_prompt}
+        return final_messages
+
+    def _build_request_params(self,
+                              messages: List[Dict[str, str]],
+                              system_prompt: Optional[str] = None,
+                              model: Optional[str] = None,
+                              stream: bool = False,
+                              tools: Optional[List[Dict]] = None,
+                              tool_choice: Optional[str] = "auto",
+                              json_output: bool = False,
+                              label: Optional[str] = None,
+                              **kwargs: Any) -> Dict[str, Any]:
+        """构建 chat.completions.create 的请求参数
+
+        开启 enable_output_budgets 后，未指定 max_tokens 的请求使用该标签学习到的上限；
+        录制/回放时不设置，保证请求与录制文件一致。
+        """
+        request_params = {
+            "model": self._resolve_model_id(model),
+            "messages": self._build_messages(messages, system_prompt),
+            "stream": stream,
+            **kwargs
+        }
+        if _output_budgets_enabled and "max_tokens" not in request_params and self.cassette is None:
+            max_tokens = output_budgets.max_tokens_for(label)
+            if max_tokens is not None:
+                request_params["max_tokens"] = max_tokens
+        if tools:
+            request_params["tools"] = tools
+            request_params["tool_choice"] = tool_choice
+        elif json_output:
+            request_params["response_format"] = {"type": "json_object"}
+        return request_params
+
+    def _route_candidates(self, request_params: Dict[str, Any], model: Optional[str],
+                          task_class: Optional[str], label: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """返回按顺序尝试的请求参数列表
+
+        仅在指定 task_class、未显式指定 model 且实例启用路由时生效；
+        路由后的每个候选请求带上该任务类别的延迟预算作为超时。
+        每个候选请求都会按其模型的上下文窗口裁剪，避免上下文超长错误。
+        """
+        if not task_class or model or not self.routing:
+            return [token_budgeter.fit_request(request_params)], None
+        decision = model_router.route(task_class, request_params, label)
+        if decision is None:
+            return [token_budgeter.fit_request(request_params)], None
+        budget = decision["latency_budget"]
+        candidates = []
+        for model_id in decision["models"]:
+            params = {**request_params, "model": model_id}
+            if budget and "timeout" not in params:
+                params["timeout"] = budget
+            candidates.append(token_budgeter.fit_request(params))
+        return candidates, task_class
+
+    @staticmethod
+    def _structured_kwargs(schema: Dict[str, Any], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """顶层为对象的 schema 使用 response_format=json_object 约束输出"""
+        if schema.get("type") == "object":
+            return {"response_format": {"type": "json_object"}, **kwargs}
+        return kwargs
+
+    def _record_batch_stats(self, total: int, errors: Dict[int, str], concurrency: int, elapsed: float) -> None:
+        """记录并输出一次批量调用的吞吐统计"""
+        self.last_batch_stats = {
+            "total": total,
+            "succeeded": total - len(errors),
+            "failed": len(errors),
+            "errors": errors,
+            "elapsed": elapsed,
+            "throughput": total / elapsed if elapsed > 0 else 0.0,
+        }
+        logger.info(
+            f"batch_generate 完成: {total} 条 (失败 {len(errors)}), 并发 {concurrency}, "
+            f"耗时 {elapsed:.2f}秒, 吞吐 {self.last_batch_stats['throughput']:.2f} 条/秒"
         )
 
-    @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3),
-           retry=retry_if_exception_type((RateLimitError, APIError)))
+
+class LLM(_BaseLLM):
+    """同步 LLM 客户端"""
+
+    def _get_client_for_model(self, model_id: str) -> OpenAI:
+        """Returns the shared OpenAI client with the correct base_url for the given model_id."""
+        return client_registry.get(_base_url_for_model(model_id), self.api_key)
+
+    def _create_completion(self, request_params: Dict[str, Any], use_cache: bool = True,
+                           label: Optional[str] = None, retries: int = 0) -> ChatCompletion:
+        """执行一次非流式 chat completion 请求，命中缓存时直接返回缓存结果，并记录调用计量"""
+        start_time = time.time()
+        cache_key, cached = self._cache_lookup(request_params, use_cache)
+        if cached is not None:
+            self._record_completion(label, request_params, cached, start_time, retries, "cache")
+            return cached
+
+        sent = []
+
+        def _send() -> ChatCompletion:
+            sent.append(True)
+            completion = self._dispatch(request_params, label)
+            self._cache_store(cache_key, completion)
+            return completion
+
+        try:
+            flight_key = self._flight_key(request_params, cache_key)
+            completion = _send() if flight_key is None else single_flight.do(flight_key, _send)
+        except Exception as e:
+            record_llm_call(label, request_params["model"], latency=time.time() - start_time,
+                            retries=retries, error=str(e))
+            raise
+        self._record_completion(label, request_params, completion, start_time, retries,
+                                self._sent_source() if sent else "coalesced")
+        return completion
+
+    def _complete_with_fallback(self, candidates: List[Dict[str, Any]], task_class: Optional[str],
+                                use_cache: bool = True, label: Optional[str] = None, retries: int = 0) -> ChatCompletion:
+        """依次尝试候选请求，出错或超出延迟预算时回退到下一个模型"""
+        for i, request_params in enumerate(candidates):
+            try:
+                return self._create_completion(request_params, use_cache=use_cache, label=label, retries=retries)
+            except Exception as e:
+                if i == len(candidates) - 1:
+                    raise
+                model_router.record_fallback(task_class, request_params["model"], candidates[i + 1]["model"], e)
+
+    def _dispatch(self, request_params: Dict[str, Any], label: Optional[str]) -> ChatCompletion:
+        """发送请求；开启 cassette 时录制响应，或直接回放录制的响应而不访问接口"""
+        cassette = self.cassette
+        if cassette is not None and cassette.replaying:
+            response, delay = cassette.replay(request_params)
+            if delay:
+                time.sleep(delay)
+            return ChatCompletion.construct(**response)
+        start_time = time.time()
+        completion = self._send_hedged(request_params, label)
+        if cassette is not None and cassette.recording:
+            cassette.record(request_params, completion.model_dump(mode="json"), time.time() - start_time)
+        return completion
+
+    def _replay_stream(self, request_params: Dict[str, Any], label: Optional[str]) -> Generator[ChatCompletionChunk, None, None]:
+        """按录制的时间间隔回放流式响应"""
+        start_time = time.time()
+        streamed_text = []
+        error = None
+        try:
+            for offset, data in self.cassette.replay_stream(request_params):
+                delay = start_time + offset - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                chunk = ChatCompletionChunk.construct(**data)
+                streamed_text.append(self._chunk_text(chunk))
+                yield chunk
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self._record_stream(label, request_params, "".join(streamed_text), start_time, error)
+
+    def _send_hedged(self, request_params: Dict[str, Any], label: Optional[str]) -> ChatCompletion:
+        """发送请求；开启对冲时，超过该调用类别的 p95 仍未返回则再发一个相同请求，先返回者胜出"""
+        policy, executor = _hedge_policy, _hedge_executor
+        call_class = label or request_params["model"]
+        delay = policy.start(call_class) if policy else None
+        if delay is None:
+            start_time = time.time()
+            completion = self._send_request(request_params)
+            if policy:
+                policy.observe(call_class, time.time() - start_time)
+            return completion
+
+        start_time = time.time()
+        primary = executor.submit(contextvars.copy_context().run, self._send_request, request_params)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done or not policy.try_hedge(call_class):
+            completion = primary.result()
+            policy.observe(call_class, time.time() - start_time)
+            return completion
+
+        hedge = executor.submit(contextvars.copy_context().run, self._send_request, request_params)
+        roles = {primary: "primary", hedge: "hedge"}
+        pending = set(roles)
+        first_error = None
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        policy.observe(call_class, time.time() - start_time, winner=roles[future])
+                        return future.result()
+                    first_error = first_error or future.exception()
+            raise first_error
+        finally:
+            # 同步请求无法中断，落败的请求在后台完成后结果被丢弃
+            for future in pending:
+                future.cancel()
+
+    def _send_request(self, request_params: Dict[str, Any]) -> ChatCompletion:
+        """经过限流与自适应并发控制后实际发出请求"""
+        model_id = request_params["model"]
+        # Get the shared client for this specific model_id
+        client = self._get_client_for_model(model_id)
+        if "timeout" in request_params:
+            # 带延迟预算的请求超时后由回退链处理，不再由客户端重试
+            client = client.with_options(max_retries=0)
+        breaker = circuit_breakers.get(model_id)
+        breaker.acquire()
+        reservation = None
+        try:
+            reservation = rate_limiter.acquire(model_id, estimate_request_tokens(request_params))
+            controller = concurrency_controllers.get(model_id)
+            controller.acquire()
+        except BaseException:
+            # 排队期间被中断：退还已预扣的额度
+            rate_limiter.settle(reservation, 0)
+            breaker.record_ignored()
+            raise
+        start_time = time.time()
+        try:
+            completion = client.chat.completions.create(**request_params)
+        except BaseException as e:
+            controller.release(None, rate_limited=isinstance(e, RateLimitError))
+            rate_limiter.settle(reservation, 0)
+            _record_breaker_outcome(breaker, e)
+            raise
+        breaker.record_success()
+        controller.release(time.time() - start_time)
+        rate_limiter.settle(reservation, _usage_total_tokens(completion))
+        return completion
+
     def ask_tool(self,
                  messages: List[Dict[str, str]],
                  system_prompt: Optional[str] = None,
@@ -42,6 +1070,9 @@ class LLM:
                  tools: Optional[List[Dict]] = None,
                  tool_choice: Optional[str] = "auto",
                  json_output: bool = False,
+                 use_cache: bool = True,
+                 label: Optional[str] = None,
+                 task_class: Optional[str] = None,
                  **kwargs: Any) -> ChatCompletionMessage:
         """(非流式) 向 LLM 请求决策，可能包含工具调用。
         Args:
@@ -51,40 +1082,28 @@ class LLM:
             tools: 可用工具定义列表
             tool_choice: 工具选择模式 ("none", "auto", {"type": "function", ...})
             json_output: 是否强制要求 JSON 输出 (如果为 True，tools 应为 None)
+            use_cache: 为 False 时绕过响应缓存
+            label: 调用阶段标签，用于计量汇总 (如 "planning.plan_tasks")
+            task_class: 任务类别，未指定 model 时由 model_router 选择模型及回退链
             **kwargs: 其他传递给 API 的参数
         Returns:
             ChatCompletionMessage 对象，包含 content 和 tool_calls
         Raises:
-            Exception: API 调用失败或其他错误
+            Exception: API 调用失败或其他错误 (限流与 API 错误最多重试 3 次)
         """
-        final_messages = list(messages)
-        if system_prompt:
-            if not final_messages or final_messages[0].get("role") != "system":
-                final_messages.insert(0, {"role": "system", "content": system_prompt})
-            elif final_messages[0].get("role") == "system":
-                final_messages[0]["content"] = system_prompt
-
-        resolved_model_id = self.model_map.get(model, self.model) if model else self.model
-        # Get a client configured for this specific model_id
-        client = self._get_client_for_model(resolved_model_id)
-
-        request_params = {
-            "model": resolved_model_id,
-            "messages": final_messages,
-            "stream": False,
-            **kwargs
-        }
-
-        if tools:
-            request_params["tools"] = tools
-            request_params["tool_choice"] = tool_choice
-        elif json_output:
-            request_params["response_format"] = {"type": "json_object"}
-        
-        # Use the dynamically created client
-        completion = client.chat.completions.create(**request_params)
-        if not completion.choices:
-            raise ValueError("LLM response missing 'choices'")
+        request_params = self._build_request_params(
+            messages, system_prompt, model,
+            tools=tools, tool_choice=tool_choice, json_output=json_output, label=label, **kwargs
+        )
+        candidates, routed_class = self._route_candidates(request_params, model, task_class, label)
+        for attempt in Retrying(**_RETRY_POLICY):
+            with attempt:
+                completion = self._complete_with_fallback(
+                    candidates, routed_class, use_cache=use_cache, label=label,
+                    retries=attempt.retry_state.attempt_number - 1
+                )
+                if not completion.choices:
+                    raise ValueError("LLM response missing 'choices'")
         return completion.choices[0].message
 
     def generate(self, 
@@ -93,6 +1112,9 @@ class LLM:
                  model: Optional[str] = None, # Accepts alias
                  return_content_only: bool = True,
                  json_output: bool = False,
+                 use_cache: bool = True,
+                 label: Optional[str] = None,
+                 task_class: Optional[str] = None,
                  **kwargs: Any) -> Union[str, Any, Dict]:
         """生成响应 (基于消息列表)
         
@@ -103,53 +1125,28 @@ class LLM:
             model: 可选的模型别名或 ID 进行覆盖
             return_content_only: 是否只返回内容而非完整消息对象
             json_output: 是否输出JSON格式的响应
+            use_cache: 为 False 时绕过响应缓存
+            label: 调用阶段标签，用于计量汇总 (如 "report.executive_summary")
+            task_class: 任务类别 (如 "extraction"、"report")，未指定 model 时由 model_router
+                        按类别与提示词大小选择模型，超出延迟预算或出错时回退到下一个模型
             **kwargs: 其他参数
             
         Returns:
             根据参数返回字符串、消息对象或JSON对象
         """
-        final_messages = list(messages)
-        if system_prompt:
-            if not final_messages or final_messages[0].get("role") != "system":
-                final_messages.insert(0, {"role": "system", "content": system_prompt})
-            elif final_messages[0].get("role") == "system":
-                final_messages[0]["content"] = system_prompt
-
-        resolved_model_id = self.model_map.get(model, self.model) if model else self.model
-        # Get a client configured for this specific model_id
-        client = self._get_client_for_model(resolved_model_id)
-
-        request_params = {
-            "model": resolved_model_id,
-            "messages": final_messages,
-            "stream": False,
-            **kwargs
-        }
-            
-        if json_output:
-            request_params["response_format"] = {"type": "json_object"}
-            
-        # Use the dynamically created client
-        completion = client.chat.completions.create(**request_params)
+        request_params = self._build_request_params(
+            messages, system_prompt, model, json_output=json_output, label=label, **kwargs
+        )
+        candidates, routed_class = self._route_candidates(request_params, model, task_class, label)
+        completion = self._complete_with_fallback(candidates, routed_class, use_cache=use_cache, label=label)
         
         message_obj = completion.choices[0].message
-        content = message_obj.content
         
         if json_output:
-            try:
-                # 直接尝试解析JSON
-                return json.loads(content)
-            except json.JSONDecodeError:
-                # 导入抽取工具并使用它处理内容
-                from src.utils.extract_markdown import extract_json_from_markdown
-                extracted_json = extract_json_from_markdown(content)
-                if extracted_json is not None:
-                    return extracted_json
-                # 如果仍然无法解析，提供友好的错误信息
-                raise ValueError(f"无法从LLM响应提取JSON结构。响应内容:\n{content[:500]}...")
+            return _parse_json_content(message_obj.content)
         
         if return_content_only:
-            return content
+            return message_obj.content
         else:
             return message_obj
             
@@ -157,60 +1154,702 @@ class LLM:
                        message_lists: List[List[Dict[str, str]]],
                        system_prompt: Optional[str] = None,
                        model: Optional[str] = None, # Accepts alias
-                       batch_size: int = 10, # Note: batch_size is not currently used for parallel execution
+                       batch_size: int = 10,
                        json_output: bool = False,
-                       **kwargs: Any) -> List[Union[str, Dict]]:
-        results = []
-        # Simple sequential execution
-        for i, messages in enumerate(message_lists):
-            result = self.generate(
-                messages=messages,
-                system_prompt=system_prompt,
-                model=model, # Pass alias down
-                json_output=json_output,
-                **kwargs
-            )
-            results.append(result)
+                       label: Optional[str] = None,
+                       task_class: Optional[str] = None,
+                       **kwargs: Any) -> List[Union[str, Dict, None]]:
+        """并发批量生成响应，结果顺序与输入一致。
+
+        Args:
+            message_lists: 消息列表的列表，每个元素对应一次独立请求
+            system_prompt: 系统提示词，作用于每个请求
+            model: 可选的模型别名或 ID 进行覆盖
+            batch_size: 同时在途的最大请求数 (线程池大小)
+            json_output: 是否输出JSON格式的响应
+            label: 调用阶段标签，用于计量汇总 (如 "atomic.brand_mentions")
+            task_class: 任务类别，每条请求单独路由
+            **kwargs: 其他传递给 generate 的参数
+
+        Returns:
+            与 message_lists 等长的结果列表。单条请求失败时对应位置为 None，
+            不会中断整个批次；本批次的统计信息记录在 self.last_batch_stats 中。
+        """
+        return self._run_batch(self.generate, message_lists, batch_size,
+                               system_prompt=system_prompt,
+                               model=model, # Pass alias down
+                               json_output=json_output,
+                               label=label,
+                               task_class=task_class,
+                               **kwargs)
+
+    def _run_batch(self, fn: Any, message_lists: List[List[Dict[str, str]]], batch_size: int,
+                   **call_kwargs: Any) -> List[Any]:
+        """在线程池中对每个消息列表调用 fn(messages=..., **call_kwargs)，失败的位置为 None"""
+        if not message_lists:
+            self._record_batch_stats(0, {}, 0, 0.0)
+            return []
+
+        results: List[Any] = [None] * len(message_lists)
+        errors: Dict[int, str] = {}
+        max_workers = max(1, min(batch_size, len(message_lists)))
+        start_time = time.time()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 每个任务复制当前上下文，使 track_usage 等上下文状态在工作线程中生效
+            future_to_index = {
+                executor.submit(contextvars.copy_context().run, fn, messages=messages, **call_kwargs): i
+                for i, messages in enumerate(message_lists)
+            }
+            for future in concurrent.futures.as_completed(future_to_index):
+                i = future_to_index[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    # 单条失败只影响自己的结果位置
+                    errors[i] = str(e)
+                    logger.warning(f"batch_generate 第 {i} 条请求失败: {e}")
+
+        self._record_batch_stats(len(message_lists), errors, max_workers, time.time() - start_time)
+        return results
+
+    def generate_structured(self,
+                            messages: List[Dict[str, str]],
+                            schema: Dict[str, Any],
+                            system_prompt: Optional[str] = None,
+                            model: Optional[str] = None, # Accepts alias
+                            max_repairs: int = 1,
+                            label: Optional[str] = None,
+                            task_class: Optional[str] = None,
+                            **kwargs: Any) -> Any:
+        """生成并校验结构化 (JSON) 输出
+
+        顶层为对象的 schema 会以 response_format=json_object 请求。解析或校验失败时，
+        只把出错的片段与错误说明发给模型修复 (标签为 "<label>.repair")，不重跑原始请求。
+
+        Args:
+            messages: 消息列表
+            schema: JSON Schema 子集，见 src.utils.structured_output.validate_schema
+            system_prompt: 系统提示词
+            model: 模型覆盖
+            max_repairs: 最多修复次数
+            label: 调用阶段标签，同时用于解析失败率与修复率统计
+            task_class: 任务类别，原始请求与修复请求都按该类别路由
+            **kwargs: 其他传递给 generate 的参数
+
+        Returns:
+            符合 schema 的解析结果
+
+        Raises:
+            StructuredOutputError: 修复后仍不符合 schema，或输出被截断 (如达到 max_tokens)
+        """
+        content = self.generate(messages, system_prompt=system_prompt, model=model, label=label,
+                                task_class=task_class, **self._structured_kwargs(schema, kwargs))
+        return self._validate_structured(content, schema, model, max_repairs, label, task_class)
+
+    def _validate_structured(self, content: Optional[str], schema: Dict[str, Any], model: Optional[str],
+                             max_repairs: int, label: Optional[str], task_class: Optional[str]) -> Any:
+        """校验一次输出，不合规时发起修复请求；修复后仍不合规时抛出 StructuredOutputError"""
+        repair = StructuredRepair(content, schema, max_repairs, label)
+        for repair_messages, fragment_schema in repair.requests():
+            try:
+                repair_content = self.generate(repair_messages, model=model, label=repair.repair_label,
+                                               task_class=task_class,
+                                               **self._structured_kwargs(fragment_schema, {}))
+            except Exception as e:
+                repair.fail(e)
+                break
+            repair.apply(repair_content)
+        return repair.result()
+
+    def batch_generate_structured(self,
+                                  message_lists: List[List[Dict[str, str]]],
+                                  schema: Dict[str, Any],
+                                  system_prompt: Optional[str] = None,
+                                  model: Optional[str] = None, # Accepts alias
+                                  batch_size: int = 10,
+                                  label: Optional[str] = None,
+                                  task_class: Optional[str] = None,
+                                  **kwargs: Any) -> List[Any]:
+        """并发批量调用 generate_structured，结果顺序与输入一致；请求失败或修复后仍不合规的位置为 None"""
+        return self._run_batch(self.generate_structured, message_lists, batch_size,
+                               schema=schema,
+                               system_prompt=system_prompt,
+                               model=model,
+                               label=label,
+                               task_class=task_class,
+                               **kwargs)
+
+    def generate_batch_job(self,
+                           job_dir: str,
+                           message_lists: List[List[Dict[str, str]]],
+                           system_prompt: Optional[str] = None,
+                           model: Optional[str] = None, # Accepts alias
+                           schema: Optional[Dict[str, Any]] = None,
+                           max_repairs: int = 1,
+                           label: Optional[str] = None,
+                           batch_job_options: Optional[Dict[str, Any]] = None,
+                           **kwargs: Any) -> List[Any]:
+        """通过离线批处理任务生成响应，适合不要求延迟的大批量回填
+
+        每条请求的 custom_id 由请求内容计算，相同的请求只提交一次；同一 job_dir 重新运行时
+        复用已取回的结果，只提交未完成的请求。批处理请求不使用路由与学习到的 max_tokens 上限，
+        保证重新运行时请求 (及 custom_id) 不变。
+
+        Args:
+            job_dir: 任务目录，见 src.utils.batch_job.BatchJob
+            message_lists: 消息列表的列表，每个元素对应一条请求
+            system_prompt: 系统提示词，作用于每条请求
+            model: 可选的模型别名或 ID 进行覆盖
+            schema: 指定时按 generate_structured 的方式校验，不合规的结果以在线请求修复
+            max_repairs: 每条结果最多修复次数
+            label: 调用阶段标签，用于计量汇总
+            batch_job_options: 覆盖 DEFAULT_BATCH_JOB_CONFIG 的配置 (poll_interval、timeout 等)
+            **kwargs: 其他 API 参数
+
+        Returns:
+            与 message_lists 等长的列表：响应内容，指定 schema 时为解析结果；
+            失败或修复后仍不合规的位置为 None。本次任务的统计记录在 self.last_batch_job_stats 中。
+        """
+        if schema is not None:
+            kwargs = self._structured_kwargs(schema, kwargs)
+        bodies = []
+        for messages in message_lists:
+            request_params = self._build_request_params(messages, system_prompt, model, **kwargs)
+            request_params.pop("stream")
+            bodies.append(token_budgeter.fit_request(request_params))
+        custom_ids = [make_cache_key(body)[:32] for body in bodies]
+        model_id = self._resolve_model_id(model)
+        job = BatchJob(job_dir, self._get_client_for_model(model_id), label=label, **(batch_job_options or {}))
+        responses = job.run(dict(zip(custom_ids, bodies)))
+        self.last_batch_job_stats = dict(job.stats)
+
+        results: List[Any] = []
+        for custom_id in custom_ids:
+            response = responses.get(custom_id)
+            content = response["choices"][0]["message"].get("content") if response else None
+            if schema is None or content is None:
+                results.append(content)
+                continue
+            try:
+                results.append(self._validate_structured(content, schema, model, max_repairs, label, None))
+            except StructuredOutputError:
+                results.append(None)
         return results
 
     def generate_stream(self, 
                         messages: List[Dict[str, str]],
                         system_prompt: Optional[str] = None,
                         model: Optional[str] = None, # Accepts alias
+                        label: Optional[str] = None,
+                        detect_repetition: bool = False,
                         **kwargs: Any) -> Generator[ChatCompletionChunk, None, None]:
         """(流式) 生成文本响应。
         Args:
             messages: 消息列表
             system_prompt: 系统提示词
             model: 可选的模型别名或 ID 进行覆盖
+            label: 调用阶段标签，用于计量汇总
+            detect_repetition: 输出陷入重复循环时提前结束流并断开连接，计量中记为中止；
+                               默认关闭，由容易陷入重复的调用 (如关键词列表) 显式开启
             **kwargs: 其他 API 参数
         Yields:
             ChatCompletionChunk: 流式响应块
         Raises:
             Exception: API 调用或流处理错误
         """
-        final_messages = list(messages)
-        if system_prompt:
-            if not final_messages or final_messages[0].get("role") != "system":
-                final_messages.insert(0, {"role": "system", "content": system_prompt})
-            elif final_messages[0].get("role") == "system":
-                 final_messages[0]["content"] = system_prompt
-        
-        resolved_model_id = self.model_map.get(model, self.model) if model else self.model
-        # Get a client configured for this specific model_id
-        client = self._get_client_for_model(resolved_model_id)
-        
-        request_params = {
-            "model": resolved_model_id,
-            "messages": final_messages,
-            "stream": True,
-            **kwargs 
-        }
+        request_params = self._build_request_params(
+            messages, system_prompt, model, stream=True, label=label, **kwargs
+        )
+        request_params = token_budgeter.fit_request(request_params)
+        cassette = self.cassette
+        if cassette is not None and cassette.replaying:
+            yield from self._replay_stream(request_params, label)
+            return
+        recorded = [] if cassette is not None and cassette.recording else None
+        # Get the shared client for this specific model_id
+        client = self._get_client_for_model(request_params["model"])
+        breaker = circuit_breakers.get(request_params["model"])
+        breaker.acquire()
+        reservation = None
+        try:
+            # 流式响应没有 usage，按估算值扣减额度
+            reservation = rate_limiter.acquire(request_params["model"], estimate_request_tokens(request_params))
+            # 流式请求在整个输出期间占用并发槽位，耗时不计入延迟统计
+            controller = concurrency_controllers.get(request_params["model"])
+            controller.acquire()
+        except BaseException:
+            # 排队期间被中断：退还已预扣的额度
+            rate_limiter.settle(reservation, 0)
+            breaker.record_ignored()
+            raise
+        rate_limited = False
+        start_time = time.time()
+        streamed_text = []
+        error = None
+        aborted = None
+        detector = RepetitionDetector() if detect_repetition else None
+        # 流正常结束时为 None；调用方提前关闭流时保持 False，不计入熔断统计
+        failure: Optional[Union[BaseException, bool]] = False
+        completion_stream = None
+        try:
+            completion_stream = client.chat.completions.create(**request_params)
+            for chunk in completion_stream:
+                text = self._chunk_text(chunk)
+                streamed_text.append(text)
+                if recorded is not None:
+                    recorded.append((time.time() - start_time, chunk.model_dump(mode="json")))
+                yield chunk
+                if detector is not None and detector.feed(text):
+                    aborted = "repetition"
+                    logger.warning(f"[{label or '-'}] 流式输出陷入重复循环，提前中止: {detector.reason}")
+                    break
+            failure = None
+            if recorded is not None:
+                cassette.record_stream(request_params, recorded)
+        except Exception as e:
+            rate_limited = isinstance(e, RateLimitError)
+            error = str(e)
+            failure = e
+            raise
+        finally:
+            if (failure is False or aborted) and completion_stream is not None:
+                # 调用方提前关闭或检测到重复循环：断开连接，不再接收剩余输出
+                completion_stream.response.close()
+            controller.release(None, rate_limited=rate_limited)
+            if failure is False:
+                breaker.record_ignored()
+            else:
+                _record_breaker_outcome(breaker, failure)
+            self._record_stream(label, request_params, "".join(streamed_text), start_time, error, aborted)
+
+    def generate_stream_json(self,
+                             messages: List[Dict[str, str]],
+                             system_prompt: Optional[str] = None,
+                             model: Optional[str] = None, # Accepts alias
+                             label: Optional[str] = None,
+                             max_preamble_chars: int = 500,
+                             **kwargs: Any) -> Generator[Tuple[Union[int, str], Any], None, None]:
+        """(流式) 生成 JSON，边接收边解析
+
+        顶层为数组时每个元素闭合即产出 (序号, 元素)，顶层为对象时每个键的值闭合即产出 (键, 值)，
+        下游可以在模型输出其余部分时开始处理已完成的部分。顶层闭合后立即结束请求。
+        Args:
+            messages: 消息列表
+            system_prompt: 系统提示词
+            model: 可选的模型别名或 ID 进行覆盖
+            label: 调用阶段标签，用于计量汇总
+            max_preamble_chars: JSON 开始之前允许的最多字符数
+            **kwargs: 其他 API 参数 (顶层为对象时可传 response_format={"type": "json_object"})
+        Yields:
+            (序号或键, 值)
+        Raises:
+            StreamingJSONError: 输出不合法 (迟迟不出现 JSON、元素无法解析或被截断)，请求会被提前中止
+        """
+        parser = IncrementalJSONParser(max_preamble_chars)
+        stream = self.generate_stream(messages, system_prompt=system_prompt, model=model, label=label, **kwargs)
+        try:
+            for chunk in stream:
+                yield from parser.feed(self._chunk_text(chunk))
+                if parser.done:
+                    break
+            yield from parser.close()
+        finally:
+            stream.close()
+
+
+class AsyncLLM(_BaseLLM):
+    """异步 LLM 客户端，接口与 LLM 一致，适合在 FastAPI 等事件循环中并发调用"""
+
+    def _get_client_for_model(self, model_id: str) -> AsyncOpenAI:
+        """Returns the shared AsyncOpenAI client of the running event loop for the given model_id."""
+        return async_client_registry.get(_base_url_for_model(model_id), self.api_key)
+
+    async def _create_completion(self, request_params: Dict[str, Any], use_cache: bool = True,
+                                 label: Optional[str] = None, retries: int = 0) -> ChatCompletion:
+        """执行一次非流式 chat completion 请求，命中缓存时直接返回缓存结果，并记录调用计量
+
+        缓存的 SQLite 读写在线程池中执行，不阻塞事件循环。
+        """
+        start_time = time.time()
+        cache_key, cached = None, None
+        if self.cache is not None:
+            cache_key, cached = await asyncio.to_thread(self._cache_lookup, request_params, use_cache)
+        if cached is not None:
+            self._record_completion(label, request_params, cached, start_time, retries, "cache")
+            return cached
+
+        sent = []
+
+        async def _send() -> ChatCompletion:
+            sent.append(True)
+            completion = await self._dispatch(request_params, label)
+            if cache_key is not None:
+                await asyncio.to_thread(self._cache_store, cache_key, completion)
+            return completion
+
+        try:
+            flight_key = self._flight_key(request_params, cache_key)
+            completion = await (_send() if flight_key is None else single_flight.do_async(flight_key, _send))
+        except Exception as e:
+            record_llm_call(label, request_params["model"], latency=time.time() - start_time,
+                            retries=retries, error=str(e))
+            raise
+        self._record_completion(label, request_params, completion, start_time, retries,
+                                self._sent_source() if sent else "coalesced")
+        return completion
+
+    async def _complete_with_fallback(self, candidates: List[Dict[str, Any]], task_class: Optional[str],
+                                      use_cache: bool = True, label: Optional[str] = None,
+                                      retries: int = 0) -> ChatCompletion:
+        """依次尝试候选请求，出错或超出延迟预算时回退到下一个模型"""
+        for i, request_params in enumerate(candidates):
+            try:
+                return await self._create_completion(request_params, use_cache=use_cache, label=label, retries=retries)
+            except Exception as e:
+                if i == len(candidates) - 1:
+                    raise
+                model_router.record_fallback(task_class, request_params["model"], candidates[i + 1]["model"], e)
+
+    async def _dispatch(self, request_params: Dict[str, Any], label: Optional[str]) -> ChatCompletion:
+        """发送请求；开启 cassette 时录制响应，或直接回放录制的响应而不访问接口"""
+        cassette = self.cassette
+        if cassette is not None and cassette.replaying:
+            response, delay = cassette.replay(request_params)
+            if delay:
+                await asyncio.sleep(delay)
+            return ChatCompletion.construct(**response)
+        start_time = time.time()
+        completion = await self._send_hedged(request_params, label)
+        if cassette is not None and cassette.recording:
+            # 录制文件的写入在线程池中执行，不阻塞事件循环
+            await asyncio.to_thread(cassette.record, request_params, completion.model_dump(mode="json"),
+                                    time.time() - start_time)
+        return completion
+
+    async def _replay_stream(self, request_params: Dict[str, Any], label: Optional[str]) -> AsyncGenerator[ChatCompletionChunk, None]:
+        """按录制的时间间隔回放流式响应"""
+        start_time = time.time()
+        streamed_text = []
+        error = None
+        try:
+            for offset, data in self.cassette.replay_stream(request_params):
+                delay = start_time + offset - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                chunk = ChatCompletionChunk.construct(**data)
+                streamed_text.append(self._chunk_text(chunk))
+                yield chunk
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self._record_stream(label, request_params, "".join(streamed_text), start_time, error)
+
+    async def _send_hedged(self, request_params: Dict[str, Any], label: Optional[str]) -> ChatCompletion:
+        """发送请求；开启对冲时，超过该调用类别的 p95 仍未返回则再发一个相同请求，先返回者胜出，落败者被取消"""
+        policy = _hedge_policy
+        call_class = label or request_params["model"]
+        delay = policy.start(call_class) if policy else None
+        start_time = time.time()
+        if delay is None:
+            completion = await self._send_request(request_params)
+            if policy:
+                policy.observe(call_class, time.time() - start_time)
+            return completion
+
+        primary = asyncio.ensure_future(self._send_request(request_params))
+        roles = {primary: "primary"}
+        pending = {primary}
+        first_error = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and policy.try_hedge(call_class):
+                hedge = asyncio.ensure_future(self._send_request(request_params))
+                roles[hedge] = "hedge"
+                pending.add(hedge)
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        policy.observe(call_class, time.time() - start_time,
+                                       winner=roles[task] if len(roles) > 1 else None)
+                        return task.result()
+                    first_error = first_error or task.exception()
+                if not pending:
+                    raise first_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send_request(self, request_params: Dict[str, Any]) -> ChatCompletion:
+        """经过限流与自适应并发控制后实际发出请求"""
+        model_id = request_params["model"]
+        client = self._get_client_for_model(model_id)
+        if "timeout" in request_params:
+            # 带延迟预算的请求超时后由回退链处理，不再由客户端重试
+            client = client.with_options(max_retries=0)
+        breaker = circuit_breakers.get(model_id)
+        breaker.acquire()
+        reservation = None
+        try:
+            reservation = await rate_limiter.acquire_async(model_id, estimate_request_tokens(request_params))
+            controller = concurrency_controllers.get(model_id)
+            await controller.acquire_async()
+        except BaseException:
+            # 排队期间被取消 (如对冲请求的落败方)：退还已预扣的额度
+            rate_limiter.settle(reservation, 0)
+            breaker.record_ignored()
+            raise
+        start_time = time.time()
+        try:
+            completion = await client.chat.completions.create(**request_params)
+        except BaseException as e:
+            controller.release(None, rate_limited=isinstance(e, RateLimitError))
+            rate_limiter.settle(reservation, 0)
+            _record_breaker_outcome(breaker, e)
+            raise
+        breaker.record_success()
+        controller.release(time.time() - start_time)
+        rate_limiter.settle(reservation, _usage_total_tokens(completion))
+        return completion
+
+    async def ask_tool(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str] = None,
+                       model: Optional[str] = None, # Accepts alias
+                       tools: Optional[List[Dict]] = None,
+                       tool_choice: Optional[str] = "auto",
+                       json_output: bool = False,
+                       use_cache: bool = True,
+                       label: Optional[str] = None,
+                       task_class: Optional[str] = None,
+                       **kwargs: Any) -> ChatCompletionMessage:
+        """(非流式) 向 LLM 请求决策，参数与 LLM.ask_tool 相同"""
+        request_params = self._build_request_params(
+            messages, system_prompt, model,
+            tools=tools, tool_choice=tool_choice, json_output=json_output, label=label, **kwargs
+        )
+        candidates, routed_class = self._route_candidates(request_params, model, task_class, label)
+        async for attempt in AsyncRetrying(**_RETRY_POLICY):
+            with attempt:
+                completion = await self._complete_with_fallback(
+                    candidates, routed_class, use_cache=use_cache, label=label,
+                    retries=attempt.retry_state.attempt_number - 1
+                )
+                if not completion.choices:
+                    raise ValueError("LLM response missing 'choices'")
+        return completion.choices[0].message
+
+    async def generate(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str] = None,
+                       model: Optional[str] = None, # Accepts alias
+                       return_content_only: bool = True,
+                       json_output: bool = False,
+                       use_cache: bool = True,
+                       label: Optional[str] = None,
+                       task_class: Optional[str] = None,
+                       **kwargs: Any) -> Union[str, Any, Dict]:
+        """生成响应，参数与返回值与 LLM.generate 相同"""
+        request_params = self._build_request_params(
+            messages, system_prompt, model, json_output=json_output, label=label, **kwargs
+        )
+        candidates, routed_class = self._route_candidates(request_params, model, task_class, label)
+        completion = await self._complete_with_fallback(candidates, routed_class, use_cache=use_cache, label=label)
+
+        message_obj = completion.choices[0].message
+
+        if json_output:
+            return _parse_json_content(message_obj.content)
+
+        if return_content_only:
+            return message_obj.content
+        else:
+            return message_obj
+
+    async def batch_generate(self,
+                             message_lists: List[List[Dict[str, str]]],
+                             system_prompt: Optional[str] = None,
+                             model: Optional[str] = None, # Accepts alias
+                             batch_size: int = 10,
+                             json_output: bool = False,
+                             label: Optional[str] = None,
+                             task_class: Optional[str] = None,
+                             **kwargs: Any) -> List[Union[str, Dict, None]]:
+        """基于 asyncio.gather 的并发批量生成，batch_size 为信号量限制的最大在途请求数。
+
+        结果顺序与输入一致，单条失败时对应位置为 None，统计信息记录在 self.last_batch_stats 中。
+        """
+        return await self._run_batch(self.generate, message_lists, batch_size,
+                                     system_prompt=system_prompt,
+                                     model=model,
+                                     json_output=json_output,
+                                     label=label,
+                                     task_class=task_class,
+                                     **kwargs)
+
+    async def _run_batch(self, fn: Any, message_lists: List[List[Dict[str, str]]], batch_size: int,
+                         **call_kwargs: Any) -> List[Any]:
+        """并发调用 await fn(messages=..., **call_kwargs)，最多 batch_size 个在途，失败的位置为 None"""
+        if not message_lists:
+            self._record_batch_stats(0, {}, 0, 0.0)
+            return []
+
+        semaphore = asyncio.Semaphore(max(1, batch_size))
+        errors: Dict[int, str] = {}
+        start_time = time.time()
+
+        async def _run(i: int, messages: List[Dict[str, str]]) -> Any:
+            async with semaphore:
+                try:
+                    return await fn(messages=messages, **call_kwargs)
+                except Exception as e:
+                    # 单条失败只影响自己的结果位置
+                    errors[i] = str(e)
+                    logger.warning(f"batch_generate 第 {i} 条请求失败: {e}")
+                    return None
+
+        results = await asyncio.gather(*(_run(i, messages) for i, messages in enumerate(message_lists)))
+        self._record_batch_stats(len(message_lists), errors, min(batch_size, len(message_lists)), time.time() - start_time)
+        return list(results)
+
+    async def generate_structured(self,
+                                  messages: List[Dict[str, str]],
+                                  schema: Dict[str, Any],
+                                  system_prompt: Optional[str] = None,
+                                  model: Optional[str] = None, # Accepts alias
+                                  max_repairs: int = 1,
+                                  label: Optional[str] = None,
+                                  task_class: Optional[str] = None,
+                                  **kwargs: Any) -> Any:
+        """生成并校验结构化 (JSON) 输出，参数、返回值与异常与 LLM.generate_structured 相同"""
+        content = await self.generate(messages, system_prompt=system_prompt, model=model, label=label,
+                                      task_class=task_class, **self._structured_kwargs(schema, kwargs))
+        repair = StructuredRepair(content, schema, max_repairs, label)
+        for repair_messages, fragment_schema in repair.requests():
+            try:
+                repair_content = await self.generate(repair_messages, model=model, label=repair.repair_label,
+                                                     task_class=task_class,
+                                                     **self._structured_kwargs(fragment_schema, {}))
+            except Exception as e:
+                repair.fail(e)
+                break
+            repair.apply(repair_content)
+        return repair.result()
+
+    async def batch_generate_structured(self,
+                                        message_lists: List[List[Dict[str, str]]],
+                                        schema: Dict[str, Any],
+                                        system_prompt: Optional[str] = None,
+                                        model: Optional[str] = None, # Accepts alias
+                                        batch_size: int = 10,
+                                        label: Optional[str] = None,
+                                        task_class: Optional[str] = None,
+                                        **kwargs: Any) -> List[Any]:
+        """并发批量调用 generate_structured，结果顺序与输入一致；失败的位置为 None"""
+        return await self._run_batch(self.generate_structured, message_lists, batch_size,
+                                     schema=schema,
+                                     system_prompt=system_prompt,
+                                     model=model,
+                                     label=label,
+                                     task_class=task_class,
+                                     **kwargs)
+
+    async def generate_stream(self,
+                              messages: List[Dict[str, str]],
+                              system_prompt: Optional[str] = None,
+                              model: Optional[str] = None, # Accepts alias
+                              label: Optional[str] = None,
+                              detect_repetition: bool = False,
+                              **kwargs: Any) -> AsyncGenerator[ChatCompletionChunk, None]:
+        """(流式) 生成文本响应，逐块异步产出 ChatCompletionChunk；重复循环检测同 LLM.generate_stream"""
+        request_params = self._build_request_params(
+            messages, system_prompt, model, stream=True, label=label, **kwargs
+        )
+        request_params = token_budgeter.fit_request(request_params)
+        cassette = self.cassette
+        if cassette is not None and cassette.replaying:
+            async for chunk in self._replay_stream(request_params, label):
+                yield chunk
+            return
+        recorded = [] if cassette is not None and cassette.recording else None
+        client = self._get_client_for_model(request_params["model"])
+        breaker = circuit_breakers.get(request_params["model"])
+        breaker.acquire()
+        reservation = None
+        try:
+            # 流式响应没有 usage，按估算值扣减额度
+            reservation = await rate_limiter.acquire_async(request_params["model"],
+                                                           estimate_request_tokens(request_params))
+            # 流式请求在整个输出期间占用并发槽位，耗时不计入延迟统计
+            controller = concurrency_controllers.get(request_params["model"])
+            await controller.acquire_async()
+        except BaseException:
+            # 排队期间被取消：退还已预扣的额度
+            rate_limiter.settle(reservation, 0)
+            breaker.record_ignored()
+            raise
+        rate_limited = False
+        start_time = time.time()
+        streamed_text = []
+        error = None
+        aborted = None
+        detector = RepetitionDetector() if detect_repetition else None
+        # 流正常结束时为 None；调用方提前关闭流时保持 False，不计入熔断统计
+        failure: Optional[Union[BaseException, bool]] = False
+        completion_stream = None
+        try:
+            completion_stream = await client.chat.completions.create(**request_params)
+            async for chunk in completion_stream:
+                text = self._chunk_text(chunk)
+                streamed_text.append(text)
+                if recorded is not None:
+                    recorded.append((time.time() - start_time, chunk.model_dump(mode="json")))
+                yield chunk
+                if detector is not None and detector.feed(text):
+                    aborted = "repetition"
+                    logger.warning(f"[{label or '-'}] 流式输出陷入重复循环，提前中止: {detector.reason}")
+                    break
+            failure = None
+            if recorded is not None:
+                await asyncio.to_thread(cassette.record_stream, request_params, recorded)
+        except Exception as e:
+            rate_limited = isinstance(e, RateLimitError)
+            error = str(e)
+            failure = e
+            raise
+        finally:
+            if (failure is False or aborted) and completion_stream is not None:
+                # 调用方提前关闭或检测到重复循环：断开连接，不再接收剩余输出
+                await completion_stream.response.aclose()
+            controller.release(None, rate_limited=rate_limited)
+            if failure is False:
+                breaker.record_ignored()
+            else:
+                _record_breaker_outcome(breaker, failure)
+            self._record_stream(label, request_params, "".join(streamed_text), start_time, error, aborted)
 
-        # Use the dynamically created client
-        completion_stream = client.chat.completions.create(**request_params)
-        for chunk in completion_stream:
-            yield chunk 
+    async def generate_stream_json(self,
+                                   messages: List[Dict[str, str]],
+                                   system_prompt: Optional[str] = None,
+                                   model: Optional[str] = None, # Accepts alias
+                                   label: Optional[str] = None,
+                                   max_preamble_chars: int = 500,
+                                   **kwargs: Any) -> AsyncGenerator[Tuple[Union[int, str], Any], None]:
+        """(流式) 生成 JSON，边接收边解析，参数与产出与 LLM.generate_stream_json 相同"""
+        parser = IncrementalJSONParser(max_preamble_chars)
+        stream = self.generate_stream(messages, system_prompt=system_prompt, model=model, label=label, **kwargs)
+        try:
+            async for chunk in stream:
+                for event in parser.feed(self._chunk_text(chunk)):
+                    yield event
+                if parser.done:
+                    break
+            for event in parser.close():
+                yield event
+        finally:
+            await stream.aclose()
 
 # 使用示例
 if __name__ == "__main__":
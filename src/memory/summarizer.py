@@ -39,6 +39,8 @@ def summarize_history(history: List[Dict[str, str]], llm: Optional[LLM] = None)
     # 根据 llm.py 的 generate 函数接口调整调用
     summary = llm.generate(
         messages=messages_for_llm,
+        label="memory.summary",
+        task_class="analysis",
         # 可以根据需要调整模型或其他参数
         # model="your_preferred_model_alias",
         # temperature=0.7,
@@ -1,8 +1,8 @@
 import json
 from typing import Dict, List, Any
 from collections import Counter
-from src.llm import LLM
-from src.utils.extract_markdown import extract_structured_data
+from src.llm import LLM, token_budgeter
+from src.utils.structured_output import StructuredOutputError
 
 # 添加这个函数，用于计算情感百分比
 def calculate_percentages(counts: Dict[str, int]) -> Dict[str, float]:
@@ -219,7 +219,7 @@ def extract_top_k_contents(data: List[Dict[str, Any]], k: int = 20) -> str:
         # 提取内容
         content = {
             "title": item.get("title", "无标题"),
-            "detail": item.get("detail_desc", "")[:500],  # 限制长度
+            "detail": token_budgeter.truncate(item.get("detail_desc", ""), 500),  # 限制 token 数
             "heat": heat,
             "comments": [],
             "url": item.get("url", "")
@@ -229,7 +229,7 @@ def extract_top_k_contents(data: List[Dict[str, Any]], k: int = 20) -> str:
         if "comments" in item and isinstance(item["comments"], list):
             for comment in item["comments"][:5]:  # 每篇文章最多取5条评论
                 if comment and isinstance(comment, str):
-                    content["comments"].append(comment[:200])  # 限制评论长度
+                    content["comments"].append(token_budgeter.truncate(comment, 200))  # 限制评论 token 数
         
         contents_with_heat.append(content)
     
@@ -261,7 +261,7 @@ def analyze_content_with_llm(data: List[Dict[str, Any]], analysis_type: str, top
         top_k: 分析的top内容数量
         
     Returns:
-        Dict[str, Any]: 分析结果
+        Dict[str, Any]: 分析结果，输出修复后仍不符合该类型的 schema 时为空字典
     """
     llm = LLM(model="deepseek-v3")
     
@@ -391,11 +391,13 @@ def analyze_content_with_llm(data: List[Dict[str, Any]], analysis_type: str, top
     # 创建ChatML格式的消息列表
     messages = [{"role": "user", "content": user_content}]
     
-    # 调用LLM并添加结果处理
-    response = llm.generate(messages, system_prompt=system_prompt)
-    
-    # 使用extract_structured_data从响应中提取结构化数据
-    return extract_structured_data(response, 'json')
+    # 调用LLM，输出按 schema 校验，不合规时修复
+    try:
+        return llm.generate_structured(messages, ANALYSIS_SCHEMAS.get(analysis_type, GENERAL_ANALYSIS_SCHEMA),
+                                       system_prompt=system_prompt, label=f"analysis.{analysis_type}",
+                                       task_class="analysis")
+    except StructuredOutputError:
+        return {}
 
 
 def get_top_heat_posts(data: List[Dict[str, Any]], top_n: int = 3) -> List[Dict[str, Any]]:
@@ -501,6 +503,132 @@ def calculate_sentiment_distribution(data: List[Dict[str, Any]]) -> Dict[str, Di
     
     return result
 
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+# extract_feature_dimensions 的输出结构
+FEATURE_DIMENSIONS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["特征维度分析"],
+    "properties": {
+        "特征维度分析": {
+            "type": "object",
+            "required": ["发现的维度", "品牌维度得分"],
+            "properties": {
+                "发现的维度": _STRING_LIST,
+                "品牌维度得分": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": ["品牌", "各维度得分"],
+                        "properties": {
+                            "品牌": {"type": "string"},
+                            "各维度得分": {"type": "array", "items": {"type": "number"}},
+                        },
+                    },
+                },
+                "维度用户原声": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": ["维度", "原声"],
+                        "properties": {"维度": {"type": "string"}, "原声": _STRING_LIST},
+                    },
+                },
+            },
+        },
+    },
+}
+
+_KEYWORD_LIST = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "required": ["text"],
+        "properties": {"text": {"type": "string"}, "weight": {"type": "number"}},
+    },
+}
+
+# extract_keyword_analysis 的输出结构
+KEYWORD_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["关键词分析"],
+    "properties": {
+        "关键词分析": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["品牌"],
+                "properties": {
+                    "品牌": {"type": "string"},
+                    "正面关键词": _KEYWORD_LIST,
+                    "负面关键词": _KEYWORD_LIST,
+                },
+            },
+        },
+    },
+}
+
+# analyze_content_with_llm 竞争关系分析 (competitors) 的输出结构
+COMPETITOR_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["竞争关系分析"],
+    "properties": {
+        "竞争关系分析": {
+            "type": "object",
+            "required": ["主要品牌", "竞争格局"],
+            "properties": {
+                "主要品牌": {"type": "string"},
+                "竞争格局": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": ["竞品"],
+                        "properties": {
+                            "竞品": {"type": "string"},
+                            "竞争类型": {"type": "string"},
+                            "用户摇摆证据": _STRING_LIST,
+                            "用户流出证据": _STRING_LIST,
+                            "竞争优劣势": {
+                                "type": "object",
+                                "properties": {"优势": _STRING_LIST, "劣势": _STRING_LIST},
+                            },
+                        },
+                    },
+                },
+                "用户决策因素": _STRING_LIST,
+            },
+        },
+    },
+}
+
+# analyze_content_with_llm 通用分析的输出结构
+GENERAL_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["综合分析"],
+    "properties": {
+        "综合分析": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["品牌"],
+                "properties": {
+                    "品牌": {"type": "string"},
+                    "主要关注点": _STRING_LIST,
+                    "独特表达": _STRING_LIST,
+                    "用户原声": _STRING_LIST,
+                },
+            },
+        },
+    },
+}
+
+# analyze_content_with_llm 各分析类型的输出结构，未列出的类型使用 GENERAL_ANALYSIS_SCHEMA
+ANALYSIS_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "features": FEATURE_DIMENSIONS_SCHEMA,
+    "keywords": KEYWORD_ANALYSIS_SCHEMA,
+    "competitors": COMPETITOR_ANALYSIS_SCHEMA,
+}
+
 def extract_feature_dimensions(data: List[Dict[str, Any]]) -> Dict[str, Any]:
     """使用LLM提取内容中的特征维度
     
@@ -569,13 +697,11 @@ def extract_feature_dimensions(data: List[Dict[str, Any]]) -> Dict[str, Any]:
     # 创建ChatML格式的消息列表
     messages = [{"role": "user", "content": user_content}]
     
-    # 调用LLM并处理结果
-    response = llm.generate(messages, system_prompt=system_prompt)
-    
-    # 使用extract_structured_data从响应中提取结构化数据
-    result = extract_structured_data(response, 'json')
-    
-    if result is None:
+    # 调用LLM，输出按 schema 校验，不合规时修复
+    try:
+        result = llm.generate_structured(messages, FEATURE_DIMENSIONS_SCHEMA, system_prompt=system_prompt,
+                                         label="analysis.feature_dimensions", task_class="analysis")
+    except StructuredOutputError:
         return {}
     
     # 创建结果字典
@@ -673,13 +799,11 @@ def extract_keyword_analysis(data: List[Dict[str, Any]]) -> Dict[str, Any]:
     # 创建ChatML格式的消息列表
     messages = [{"role": "user", "content": user_content}]
     
-    # 调用LLM并处理结果
-    response = llm.generate(messages, system_prompt=system_prompt)
-    
-    # 使用extract_structured_data从响应中提取结构化数据
-    result = extract_structured_data(response, 'json')
-    
-    if result is None or "关键词分析" not in result:
+    # 调用LLM，输出按 schema 校验，不合规时修复
+    try:
+        result = llm.generate_structured(messages, KEYWORD_ANALYSIS_SCHEMA, system_prompt=system_prompt,
+                                         label="analysis.keywords", task_class="analysis")
+    except StructuredOutputError:
         return {}
     
     # 直接使用原始结构，不提供默认值
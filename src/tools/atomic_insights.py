@@ -1,5 +1,6 @@
 import os
 import csv
+import copy
 import json
 import re
 import sys
@@ -8,27 +9,160 @@ import time
 import pandas as pd
 from typing import Dict, List, Any, Tuple, Optional
 import math
+import hashlib
 import concurrent.futures
+import contextvars
+import threading
 from functools import partial
 import logging
 
 # 添加项目根目录到 Python 路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from src.llm import LLM
-from src.utils.extract_markdown import extract_structured_data, extract_json_from_markdown
+from src.llm import LLM, token_budgeter
+from src.utils.extract_markdown import extract_json_from_markdown
+from src.utils.rate_limiter import estimate_text_tokens
+from src.utils.pipeline import Pipeline
+from src.utils.near_duplicates import DEFAULT_NEAR_DUPLICATE_CONFIG, find_near_duplicates
+from src.utils.post_store import (LOOKUP_STATUSES, PostResultStore, get_post_result_store, post_content_hash,
+                                  post_store_key)
 
 # 关闭httpx详细日志
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-def batch_analyze_brand_mentions(full_contents: List[str], llm: LLM, batch_size: int = 20) -> List[Dict]:
-    """批量分析品牌提及频次"""
-    brand_mentions_prompts = []
-    for content in full_contents:
-        prompt = f"""
+logger = logging.getLogger(__name__)
+
+# 品牌提及分析打包模式 (需显式开启) 的参数：单个提示词中帖子内容的 token 预算与最大帖子数
+BRAND_MENTIONS_PACK_TOKEN_BUDGET = 6000
+BRAND_MENTIONS_PACK_MAX_POSTS = 30
+
+# 在线模式流水线各阶段的工作线程数与阶段间队列容量
+PIPELINE_WORKERS = {
+    "brand_mentions": 20,
+    "user_competition": 20,
+    "brand_analysis": 20,
+}
+PIPELINE_QUEUE_SIZE = 64
+
+# 品牌情感和特性分析 (步骤 6) 的全局并发上限，所有帖子的所有品牌共享
+BRAND_ANALYSIS_MAX_CONCURRENCY = 20
+
+# 单条帖子内容 (标题 + 正文 + 评论) 在提示词中的 token 预算
+POST_CONTENT_TOKEN_BUDGET = 2000
+
+# 结果存储的版本号：提示词文本与 Schema 已自动计入版本标签，结果的后处理逻辑变化时手动递增
+RESULT_STORE_VERSION = 1
+
+# 近似重复检测的推荐相似度阈值 (字符 5-gram 的 Jaccard 相似度)，通过 atomic_insights 的 dedupe_threshold 开启
+NEAR_DUPLICATE_THRESHOLD: float = DEFAULT_NEAR_DUPLICATE_CONFIG["threshold"]
+
+# 由 LLM 分析得到、可在结果存储中复用的字段
+ATOMIC_FIELDS = ("brand_mentions", "user_competition", "brand_sentiments", "brand_features", "brand_analysis")
+
+# 各分析步骤输出的 JSON Schema，用于校验与修复 LLM 输出
+BRAND_MENTIONS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "additionalProperties": {"type": "integer"},
+}
+
+_STRING_PROPERTY = {"type": "string"}
+
+USER_COMPETITION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["brand_pairs"],
+    "properties": {
+        "brand_pairs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["type", "source_brand", "target_brand"],
+                "properties": {
+                    "type": _STRING_PROPERTY,
+                    "source_brand": _STRING_PROPERTY,
+                    "target_brand": _STRING_PROPERTY,
+                    "evidence": _STRING_PROPERTY,
+                },
+            },
+        },
+        "reason": _STRING_PROPERTY,
+    },
+}
+
+_FEATURE_ITEMS = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "required": ["feature"],
+        "properties": {"feature": _STRING_PROPERTY, "description": _STRING_PROPERTY},
+    },
+}
+
+BRAND_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["sentiment", "features", "strengths", "weaknesses"],
+    "properties": {
+        "sentiment": {"type": "string", "enum": ["positive", "neutral", "negative"]},
+        "features": {"type": "object", "additionalProperties": _STRING_PROPERTY},
+        "strengths": _FEATURE_ITEMS,
+        "weaknesses": _FEATURE_ITEMS,
+    },
+}
+
+
+# 融合模式：一次调用同时输出品牌提及、用户竞争与主要品牌的评价
+FUSED_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["brand_mentions", "user_competition", "brand_analysis"],
+    "properties": {
+        "brand_mentions": BRAND_MENTIONS_SCHEMA,
+        "user_competition": USER_COMPETITION_SCHEMA,
+        "brand_analysis": {"type": "object", "additionalProperties": BRAND_ANALYSIS_SCHEMA},
+    },
+}
+
+
+def pack_by_token_budget(texts: List[str], indexes: List[int], token_budget: int, max_items: int) -> List[List[int]]:
+    """按 token 预算将内容顺序分组，每组的估算 token 总数不超过预算 (单条超预算时独占一组)"""
+    groups = []
+    current, used = [], 0
+    for idx in indexes:
+        cost = estimate_text_tokens(texts[idx]) + 8  # 序号标记等固定开销
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            groups.append(current)
+            current, used = [], 0
+        current.append(idx)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _comment_likes(comment: Dict) -> int:
+    try:
+        return int(comment.get('comment_like_count') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def build_post_content(item: Dict[str, Any], max_tokens: int = POST_CONTENT_TOKEN_BUDGET) -> str:
+    """把标准化后的帖子拼成提示词内容，按 标题 > 正文 > 高赞评论 的优先级装入 token 预算"""
+    sections = [(0, f"{item['author_name']}：{item['title']}"), (1, item['detail_desc'])]
+    comments = [c for c in (item['comments_data'] or []) if isinstance(c, dict)]
+    for comment in sorted(comments, key=_comment_likes, reverse=True):
+        comment_location = comment.get('comment_location', "")
+        comment_date = comment.get('comment_date', "")
+        location_info = f"[{comment_location}]" if comment_location else ""
+        date_info = f"({comment_date})" if comment_date else ""
+        sections.append((2, f"{comment.get('comment_user_nick', '')}{location_info}{date_info}：{comment.get('comment_content', '')}"))
+    return token_budgeter.fit_sections(sections, max_tokens) + "\n"
+
+
+def _brand_mentions_prompt(content: str) -> str:
+    """单条内容的品牌提及提示词"""
+    return f"""
         分析以下内容中提到的品牌及其频次:
         
-        {content[:2000]}
+        {content}
         
         请输出JSON格式:
         {{
@@ -39,41 +173,20 @@ def batch_analyze_brand_mentions(full_contents: List[str], llm: LLM, batch_size:
         
         只返回JSON格式，不要其他解释。
         """
-        brand_mentions_prompts.append(prompt)
 
-    # 转换为ChatML格式
-    brand_mentions_messages = [[{"role": "user", "content": p}] for p in brand_mentions_prompts]
-
-    # 批量处理
-    brand_mentions_responses = []
-    for i in tqdm(range(0, len(brand_mentions_messages), batch_size), desc="批量分析品牌提及"):
-        batch_messages = brand_mentions_messages[i:i+batch_size]
-        batch_results = llm.batch_generate(batch_messages)
-        brand_mentions_responses.extend(batch_results)
-    
-    # 解析结果
-    brand_mentions_list = []
-    for response in brand_mentions_responses:
-        result = extract_structured_data(response, 'json')
-        brand_mentions_list.append(result)
-    
-    return brand_mentions_list
 
-def batch_analyze_user_competition(full_contents: List[str], brand_mentions_list: List[Dict], llm: LLM, batch_size: int = 20) -> List[Dict]:
-    """批量分析用户竞争情况"""
-    competition_prompts = []
+def _user_competition_prompt(content: str, brand_mentions: Optional[Dict]) -> str:
+    """单条内容的用户竞争提示词，带上该内容中提及最多的品牌作为上下文"""
+    brand_context = ""
+    if brand_mentions:
+        top_brands = sorted(brand_mentions.items(), key=lambda x: x[1], reverse=True)[:5]
+        if top_brands:
+            brand_context = "在此内容中发现的主要品牌：" + ", ".join([f"{b}({c}次)" for b, c in top_brands]) + "\n\n"
     
-    for i, content in enumerate(full_contents):
-        brand_context = ""
-        if i < len(brand_mentions_list):
-            top_brands = sorted(brand_mentions_list[i].items(), key=lambda x: x[1], reverse=True)[:5]
-            if top_brands:
-                brand_context = "在此内容中发现的主要品牌：" + ", ".join([f"{b}({c}次)" for b, c in top_brands]) + "\n\n"
-        
-        prompt = f"""
+    return f"""
         {brand_context}分析以下内容中的用户竞争情况:
         
-        {content[:2000]}
+        {content}
         
         请分析所有品牌之间的竞争关系，特别注意用户从一个品牌转向另一个品牌的迹象。
         
@@ -93,38 +206,14 @@ def batch_analyze_user_competition(full_contents: List[str], brand_mentions_list
         流出关系的判定：当用户对一个品牌持贬义态度并同时对另一个品牌持褒义态度时，判定为从贬义品牌流出到褒义品牌。
         只返回JSON格式，不要其他解释。
         """
-        competition_prompts.append(prompt)
 
-    # 转换为ChatML格式
-    competition_messages = [[{"role": "user", "content": p}] for p in competition_prompts]
-
-    # 批量处理
-    competition_responses = []
-    for i in tqdm(range(0, len(competition_messages), batch_size), desc="批量分析用户竞争情况"):
-        batch_messages = competition_messages[i:i+batch_size]
-        batch_results = llm.batch_generate(batch_messages)
-        competition_responses.extend(batch_results)
-    
-    # 解析结果
-    user_competitions = []
-    for response in competition_responses:
-        result = extract_structured_data(response, 'json')
-        user_competitions.append(result)
-    
-    return user_competitions
 
-def analyze_brands_for_content(content: str, brands: List[str], llm: LLM, batch_size: int = 5) -> Dict[str, Dict]:
-    """为单条内容分析多个品牌，保持结果与品牌的映射关系"""
-    if not brands:
-        return {}
-    
-    # 为每个品牌生成分析提示
-    prompts = []
-    for brand in brands:
-        prompt = f"""
+def _brand_analysis_prompt(content: str, brand: str) -> str:
+    """单条内容中某个品牌的情感与特性分析提示词"""
+    return f"""
         分析以下文本中关于"{brand}"品牌的评价:
         
-        {content[:2000]}
+        {content}
         
         请输出JSON格式:
         {{
@@ -143,25 +232,245 @@ def analyze_brands_for_content(content: str, brands: List[str], llm: LLM, batch_
         
         只返回JSON格式，不要其他解释。
         """
-        prompts.append(prompt)
-    
-    # 转换为ChatML格式
-    messages = [[{"role": "user", "content": p}] for p in prompts]
-    
-    # 批量处理
-    responses = []
-    for i in range(0, len(messages), batch_size):
-        batch_messages = messages[i:i+batch_size]
-        batch_results = llm.batch_generate(batch_messages)
-        responses.extend(batch_results)
-    
-    # 解析结果并映射到品牌
-    brand_analysis = {}
-    for brand, response in zip(brands, responses):
-        result = extract_structured_data(response, 'json')
-        brand_analysis[brand] = result
-    
-    return brand_analysis
+
+
+def _fused_analysis_prompt(content: str) -> str:
+    """单条内容的融合分析提示词，覆盖品牌提及、用户竞争与主要品牌评价三个步骤"""
+    return f"""
+        分析以下内容:
+        
+        {content}
+        
+        请完成三项分析:
+        1. 品牌提及：内容中提到的品牌及其频次。
+        2. 用户竞争：所有品牌之间的竞争关系，特别注意用户从一个品牌转向另一个品牌的迹象。
+           流出关系的判定：当用户对一个品牌持贬义态度并同时对另一个品牌持褒义态度时，判定为从贬义品牌流出到褒义品牌。
+        3. 品牌评价：对提及次数最多的品牌 (最多5个) 分别分析总体情感倾向、提到的产品特征及评价、优势与劣势。
+        
+        请输出JSON格式:
+        {{
+            "brand_mentions": {{
+                "品牌名称1": 提及次数,
+                "品牌名称2": 提及次数
+            }},
+            "user_competition": {{
+                "brand_pairs": [
+                    {{
+                        "type": "摇摆/流出",
+                        "source_brand": "品牌A",
+                        "target_brand": "品牌B",
+                        "evidence": "用户原文证据（截取相关段落）"
+                    }}
+                ],
+                "reason": "整体分析"
+            }},
+            "brand_analysis": {{
+                "品牌名称1": {{
+                    "sentiment": "positive/neutral/negative",
+                    "features": {{"特征1": "评价", "特征2": "评价"}},
+                    "strengths": [{{"feature": "特性名称", "description": "详细描述"}}],
+                    "weaknesses": [{{"feature": "特性名称", "description": "详细描述"}}]
+                }}
+            }}
+        }}
+        
+        没有提到品牌时 brand_mentions 与 brand_analysis 为空对象 {{}}。只返回JSON格式，不要其他解释。
+        """
+
+
+def _build_packed_brand_mentions_prompt(contents: List[str], group: List[int]) -> str:
+    """构建多帖子打包的品牌提及提示词，每条帖子以 [序号] 标记"""
+    posts = "\n\n".join(f"[{idx}]\n{contents[idx]}" for idx in group)
+    return f"""
+        以下是 {len(group)} 条独立的内容，每条以 [序号] 开头。请分别分析每条内容中提到的品牌及其频次，不要跨内容合并统计:
+        
+        {posts}
+        
+        请输出JSON数组，每条内容对应一个元素，index 为该内容的序号:
+        [
+            {{"index": 序号, "brands": {{"品牌名称1": 提及次数, "品牌名称2": 提及次数}}}},
+            ...
+        ]
+        
+        没有提到品牌的内容 brands 为空对象 {{}}。必须覆盖全部 {len(group)} 个序号，只返回JSON格式，不要其他解释。
+        """
+
+
+def atomic_store_version(model_id: Optional[str], fused: bool) -> str:
+    """结果存储的版本标签：模型、分析模式以及提示词模板与 Schema 的哈希，任一变化都会使旧结果失效"""
+    templates = [
+        _brand_mentions_prompt("{content}"),
+        _user_competition_prompt("{content}", {"{brand}": 1}),
+        _brand_analysis_prompt("{content}", "{brand}"),
+        _fused_analysis_prompt("{content}"),
+        _build_packed_brand_mentions_prompt(["{content}"], [0]),
+        BRAND_MENTIONS_SCHEMA, USER_COMPETITION_SCHEMA, BRAND_ANALYSIS_SCHEMA, FUSED_ANALYSIS_SCHEMA,
+        POST_CONTENT_TOKEN_BUDGET,
+    ]
+    digest = hashlib.sha256(json.dumps(templates, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"v{RESULT_STORE_VERSION}:{model_id or 'extraction-routing'}:{'fused' if fused else 'stepwise'}:{digest[:16]}"
+
+
+def _unpack_brand_mentions(response: Optional[str], group: List[int]) -> Dict[int, Dict]:
+    """将打包响应按序号拆回每条内容的结果，忽略不属于本组或格式错误的元素"""
+    parsed = extract_json_from_markdown(response)
+    if isinstance(parsed, dict):
+        # 兼容模型把数组包在对象里返回的情况
+        parsed = next((v for v in parsed.values() if isinstance(v, list)), None)
+    if not isinstance(parsed, list):
+        return {}
+
+    expected = set(group)
+    results = {}
+    for element in parsed:
+        if not isinstance(element, dict):
+            continue
+        try:
+            idx = int(element.get("index"))
+        except (TypeError, ValueError):
+            continue
+        brands = element.get("brands")
+        if idx in expected and isinstance(brands, dict):
+            results[idx] = brands
+    return results
+
+
+def _top_brands(brand_mentions: Optional[Dict], limit: int = 5) -> List[str]:
+    """提及次数最多的品牌 (最多 limit 个)"""
+    if not brand_mentions:
+        return []
+    main_brands = sorted(brand_mentions.items(), key=lambda x: x[1], reverse=True)[:limit]
+    return [brand for brand, _ in main_brands if brand]
+
+
+def split_fused_results(fused_results: List[Optional[Dict]]) -> Tuple[List, List, List]:
+    """把融合分析结果拆成与分步模式相同的 (品牌提及列表, 用户竞争列表, 品牌分析列表)
+
+    品牌分析只保留提及次数最多的 5 个品牌，模型没有给出评价的品牌值为 None，与分步模式一致。
+    """
+    brand_mentions_list, user_competitions, all_brand_analysis = [], [], []
+    for result in fused_results:
+        if not result:
+            brand_mentions_list.append(None)
+            user_competitions.append(None)
+            all_brand_analysis.append({})
+            continue
+        brand_mentions = result.get("brand_mentions") or {}
+        analysis = result.get("brand_analysis") or {}
+        brand_mentions_list.append(brand_mentions)
+        user_competitions.append(result.get("user_competition"))
+        all_brand_analysis.append({brand: analysis.get(brand) for brand in _top_brands(brand_mentions)})
+    return brand_mentions_list, user_competitions, all_brand_analysis
+
+
+def batch_fused_analysis(full_contents: List[str], llm: LLM, batch_size: int = 20) -> Tuple[List, List, List]:
+    """融合模式：每条内容一次结构化调用，替代品牌提及、用户竞争与逐品牌分析的多轮调用
+
+    Returns:
+        与分步模式相同的 (品牌提及列表, 用户竞争列表, 品牌分析列表)，与 full_contents 顺序一致
+    """
+    messages = [[{"role": "user", "content": _fused_analysis_prompt(content)}] for content in full_contents]
+    fused_results = []
+    for i in tqdm(range(0, len(messages), batch_size), desc="融合分析"):
+        fused_results.extend(llm.batch_generate_structured(messages[i:i+batch_size], FUSED_ANALYSIS_SCHEMA,
+                                                           batch_size=batch_size, label="atomic.fused",
+                                                           task_class="extraction"))
+    return split_fused_results(fused_results)
+
+
+def batch_job_analysis(full_contents: List[str], llm: LLM, job_dir: str,
+                       batch_job_options: Optional[Dict[str, Any]] = None,
+                       fused: bool = False) -> Tuple[List, List, List]:
+    """离线批处理模式的品牌提及、用户竞争与品牌分析 (atomic_insights 的步骤 4~6)
+
+    每个步骤是 job_dir 下的一个批处理任务，提示词与在线模式相同；后一步依赖前一步的结果，
+    因此按步骤依次提交。fused 为 True 时只提交一个融合分析任务。
+    中断或部分失败后以相同参数重新运行，只会提交尚未完成的请求。
+
+    Returns:
+        (品牌提及列表, 用户竞争列表, 品牌分析列表)，与 full_contents 顺序一致
+    """
+    if fused:
+        fused_results = llm.generate_batch_job(
+            os.path.join(job_dir, "fused"),
+            [[{"role": "user", "content": _fused_analysis_prompt(content)}] for content in full_contents],
+            schema=FUSED_ANALYSIS_SCHEMA, label="atomic.fused", batch_job_options=batch_job_options)
+        print(f"融合分析批处理完成: {llm.last_batch_job_stats}")
+        return split_fused_results(fused_results)
+
+    brand_mentions_list = llm.generate_batch_job(
+        os.path.join(job_dir, "brand_mentions"),
+        [[{"role": "user", "content": _brand_mentions_prompt(content)}] for content in full_contents],
+        schema=BRAND_MENTIONS_SCHEMA, label="atomic.brand_mentions", batch_job_options=batch_job_options)
+    print(f"品牌提及批处理完成: {llm.last_batch_job_stats}")
+
+    user_competitions = llm.generate_batch_job(
+        os.path.join(job_dir, "user_competition"),
+        [[{"role": "user", "content": _user_competition_prompt(content, brand_mentions_list[i])}]
+         for i, content in enumerate(full_contents)],
+        schema=USER_COMPETITION_SCHEMA, label="atomic.user_competition", batch_job_options=batch_job_options)
+    print(f"用户竞争批处理完成: {llm.last_batch_job_stats}")
+
+    pairs = [(i, brand) for i in range(len(full_contents)) for brand in _top_brands(brand_mentions_list[i])]
+    analyses = llm.generate_batch_job(
+        os.path.join(job_dir, "brand_analysis"),
+        [[{"role": "user", "content": _brand_analysis_prompt(full_contents[i], brand)}] for i, brand in pairs],
+        schema=BRAND_ANALYSIS_SCHEMA, label="atomic.brand_analysis", batch_job_options=batch_job_options)
+    print(f"品牌分析批处理完成: {llm.last_batch_job_stats}")
+
+    all_brand_analysis: List[Dict[str, Dict]] = [{} for _ in full_contents]
+    for (i, brand), analysis in zip(pairs, analyses):
+        all_brand_analysis[i][brand] = analysis
+    return brand_mentions_list, user_competitions, all_brand_analysis
+
+
+class BrandAnalysisPool:
+    """品牌情感和特性分析 (步骤 6) 的共享线程池
+
+    所有帖子的 (帖子, 品牌) 请求共用一个线程池，全局并发不超过 max_concurrency；
+    单个品牌失败 (请求出错或修复后仍不合规) 时结果为 None 并记录错误，不影响其他品牌与帖子。
+    """
+
+    def __init__(self, llm: LLM, max_concurrency: int = BRAND_ANALYSIS_MAX_CONCURRENCY):
+        self.llm = llm
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency,
+                                                              thread_name_prefix="brand-analysis")
+        self.errors: Dict[int, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "BrandAnalysisPool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.executor.shutdown(wait=True)
+
+    def _analyze(self, content: str, brand: str) -> Dict:
+        return self.llm.generate_structured([{"role": "user", "content": _brand_analysis_prompt(content, brand)}],
+                                            BRAND_ANALYSIS_SCHEMA, label="atomic.brand_analysis",
+                                            task_class="extraction")
+
+    def submit(self, content: str, brands: List[str]) -> Dict[str, concurrent.futures.Future]:
+        # 复制当前上下文，使 track_usage 等上下文状态在工作线程中生效
+        return {brand: self.executor.submit(contextvars.copy_context().run, self._analyze, content, brand)
+                for brand in brands}
+
+    def collect(self, index: int, futures: Dict[str, concurrent.futures.Future]) -> Dict[str, Optional[Dict]]:
+        """等待一条帖子的全部品牌结果，失败的品牌记录到 self.errors"""
+        results: Dict[str, Optional[Dict]] = {}
+        for brand, future in futures.items():
+            try:
+                results[brand] = future.result()
+            except Exception as e:
+                results[brand] = None
+                with self._lock:
+                    self.errors.setdefault(index, {})[brand] = str(e)
+                logger.warning(f"第 {index} 条内容的品牌 {brand} 分析失败: {e}")
+        return results
+
+    def analyze(self, index: int, content: str, brands: List[str]) -> Dict[str, Optional[Dict]]:
+        """分析一条帖子的多个品牌，返回 {品牌: 分析结果}"""
+        return self.collect(index, self.submit(content, brands))
+
 
 def collect_all_fields(parsed_data: List[Dict[str, Any]]) -> Dict[str, Any]:
     """收集所有数据项中的字段，生成字段全集及默认值"""
@@ -224,12 +533,133 @@ def normalize_data_fields(data_item: Dict[str, Any], all_fields: Dict[str, Any])
     
     return normalized_item
 
-def atomic_insights(parsed_data: List[Dict[str, Any]], output_dir: str = None, model_id="doubao-lite") -> List[Dict]:
-    """增强版内容分析函数，处理已解析的数据列表，使用并行处理提高效率"""
+def _brand_mentions_for_group(full_contents: List[str], group: List[int], llm: LLM) -> Dict[int, Optional[Dict]]:
+    """打包分析一组内容的品牌提及，输出中缺失的序号单独重跑"""
+    messages = [{"role": "user", "content": _build_packed_brand_mentions_prompt(full_contents, group)}]
+    try:
+        response = llm.generate(messages, label="atomic.brand_mentions.packed", task_class="extraction")
+    except Exception as e:
+        logger.warning(f"品牌提及打包调用失败，{len(group)} 条内容单独重跑: {e}")
+        response = None
+    results: Dict[int, Optional[Dict]] = dict(_unpack_brand_mentions(response, group))
+    for idx in group:
+        if idx not in results:
+            try:
+                results[idx] = llm.generate_structured(
+                    [{"role": "user", "content": _brand_mentions_prompt(full_contents[idx])}], BRAND_MENTIONS_SCHEMA,
+                    label="atomic.brand_mentions", task_class="extraction")
+            except Exception as e:
+                logger.warning(f"第 {idx} 条内容品牌提及分析失败: {e}")
+                results[idx] = None
+    return results
+
+
+def _online_analysis(full_contents: List[str], llm: LLM, pack_token_budget: Optional[int],
+                     queue_size: int = PIPELINE_QUEUE_SIZE) -> Tuple[List, List, List, Dict[str, Dict]]:
+    """在线模式的品牌提及、用户竞争与品牌分析 (atomic_insights 的步骤 4~6)
+
+    按条目流水线执行：某条内容的品牌提及一出来，它的用户竞争与品牌分析就开始，
+    不等待其他内容；阶段之间为有界队列。打包模式下品牌提及按组处理，整组完成后进入下游。
+    品牌分析按 (帖子, 品牌) 展开到共享线程池，全局并发不超过 BRAND_ANALYSIS_MAX_CONCURRENCY。
+
+    Returns:
+        (品牌提及列表, 用户竞争列表, 品牌分析列表, 各阶段失败的条目 {阶段: {序号: 错误}})
+    """
+    pipeline = Pipeline(len(full_contents), queue_size=queue_size)
+    if pack_token_budget:
+        groups = pack_by_token_budget(full_contents, list(range(len(full_contents))),
+                                      pack_token_budget, BRAND_MENTIONS_PACK_MAX_POSTS)
+        pipeline.add_stage("brand_mentions", lambda group: _brand_mentions_for_group(full_contents, group, llm),
+                           workers=PIPELINE_WORKERS["brand_mentions"], groups=groups)
+    else:
+        pipeline.add_stage("brand_mentions", lambda i, upstream: llm.generate_structured(
+            [{"role": "user", "content": _brand_mentions_prompt(full_contents[i])}], BRAND_MENTIONS_SCHEMA,
+            label="atomic.brand_mentions", task_class="extraction"),
+            workers=PIPELINE_WORKERS["brand_mentions"])
+    # 用户竞争与品牌分析都只依赖品牌提及，两者并行
+    pipeline.add_stage("user_competition", lambda i, upstream: llm.generate_structured(
+        [{"role": "user", "content": _user_competition_prompt(full_contents[i], upstream["brand_mentions"])}],
+        USER_COMPETITION_SCHEMA, label="atomic.user_competition", task_class="extraction"),
+        workers=PIPELINE_WORKERS["user_competition"], after=["brand_mentions"])
+    with BrandAnalysisPool(llm) as brand_pool:
+        pipeline.add_stage("brand_analysis", lambda i, upstream: brand_pool.analyze(
+            i, full_contents[i], _top_brands(upstream["brand_mentions"])),
+            workers=PIPELINE_WORKERS["brand_analysis"], after=["brand_mentions"])
+        results = pipeline.run()
+
+    errors = {stage: dict(stage_errors) for stage, stage_errors in pipeline.errors.items() if stage_errors}
+    if brand_pool.errors:
+        errors["brand_analysis"] = {**errors.get("brand_analysis", {}), **brand_pool.errors}
+    if errors:
+        logger.warning("原子化分析失败条目数: " + ", ".join(f"{stage} {len(e)}" for stage, e in errors.items()))
+    return (results["brand_mentions"], results["user_competition"],
+            [analysis or {} for analysis in results["brand_analysis"]], errors)
+
+
+def _atomic_fields(brand_mentions: Optional[Dict], user_competition: Optional[Dict],
+                   brand_analysis: Dict[str, Optional[Dict]]) -> Dict[str, Any]:
+    """把一条内容的分析结果整理为输出字段 (见 ATOMIC_FIELDS)"""
+    brand_sentiments = {}
+    brand_features = {}
+    brand_strengths_weaknesses = {}
+
+    for brand, analysis in brand_analysis.items():
+        if not analysis:
+            # 单条请求失败或解析失败时跳过该品牌
+            continue
+
+        # 提取情感
+        brand_sentiments[brand] = analysis.get('sentiment', 'neutral')
+
+        # 提取特性
+        brand_features[brand] = analysis.get('features', {})
+
+        # 提取优劣势
+        strengths = analysis.get('strengths', [])
+        weaknesses = analysis.get('weaknesses', [])
+        brand_strengths_weaknesses[brand] = {
+            "strengths": strengths,
+            "weaknesses": weaknesses
+        }
+
+    return {
+        'brand_mentions': brand_mentions or {},
+        'user_competition': user_competition or {},
+        'brand_sentiments': brand_sentiments,
+        'brand_features': brand_features,
+        'brand_analysis': brand_strengths_weaknesses,
+    }
+
+
+def atomic_insights(parsed_data: List[Dict[str, Any]], output_dir: str = None, model_id: Optional[str] = None,
+                    pack_token_budget: Optional[int] = None,
+                    batch_job_dir: Optional[str] = None,
+                    batch_job_options: Optional[Dict[str, Any]] = None,
+                    fused: bool = False,
+                    result_store: Optional[PostResultStore] = None,
+                    store_stats: Optional[Dict[str, Any]] = None,
+                    dedupe_threshold: Optional[float] = None) -> List[Dict]:
+    """增强版内容分析函数，处理已解析的数据列表，使用并行处理提高效率
+
+    model_id 为 None 时按 extraction 任务类别路由模型，指定时所有调用固定使用该模型。
+    pack_token_budget 不为 None 时 (如 BRAND_MENTIONS_PACK_TOKEN_BUDGET)，品牌提及分析把多条短内容
+    打包进同一个提示词；默认不打包，每条内容单独分析。
+    batch_job_dir 不为 None 时，步骤 4~6 改为离线批处理任务 (见 batch_job_analysis)，
+    适合不要求延迟的大批量回填；此时不路由、不打包，输出结构与在线模式相同。
+    fused 为 True 时每条内容只做一次融合分析调用 (见 batch_fused_analysis)，输出字段不变。
+    result_store (未指定时使用进程级存储 get_post_result_store()) 存在时，URL 与内容哈希均未变化、
+    且版本标签 (见 atomic_store_version) 相同的帖子直接复用已有结果，只有新帖子或内容有变化的帖子
+    调用 LLM；全部分析成功的帖子写回存储。store_stats 不为 None 时写入本次的复用统计。
+    dedupe_threshold 不为 None 时 (如 NEAR_DUPLICATE_THRESHOLD)，待分析内容中与前面某条内容的估计
+    Jaccard 相似度不低于该值的近似重复内容不再调用 LLM，直接复制那条内容的结果，并在 duplicate_of
+    字段中记录那条内容的存储键 (见 post_store_key：URL，没有 URL 时为 "sha256:<内容哈希>")；
+    该标记随结果一起写入存储，之后开启去重并从存储复用时保持不变。未开启去重或不是重复内容时
+    输出中没有 duplicate_of 字段。
+    """
     start_time = time.time()
-    print(f"开始处理 {len(parsed_data)} 条数据，使用模型: {model_id}")
+    print(f"开始处理 {len(parsed_data)} 条数据，使用模型: {model_id or 'extraction 路由'}")
     
-    llm = LLM(model=model_id)
+    llm = LLM(model=model_id or "doubao-lite", routing=model_id is None)
 
     if not parsed_data:
         return []
@@ -244,98 +674,98 @@ def atomic_insights(parsed_data: List[Dict[str, Any]], output_dir: str = None, m
         normalized_data = list(executor.map(normalize_with_fields, parsed_data))
     print(f"数据标准化完成，处理了 {len(normalized_data)} 条记录")
 
-    # 3. 构建内容
-    full_contents = []
-    for item in normalized_data:
-        author_name = item['author_name'] 
-        title = item['title']
-        source = item['source'].lower()
-        detail_desc = item['detail_desc']
-        
-        main_content = f"{author_name}：{title} {detail_desc}\n"
-        
-        comments_text = ""
-        comments_data = item['comments_data']
-        if comments_data:
-            for comment in comments_data:
-                if not isinstance(comment, dict):
-                    continue
-                comment_user = comment.get('comment_user_nick', "")
-                comment_content = comment.get('comment_content', "")
-                comment_location = comment.get('comment_location', "")
-                comment_date = comment.get('comment_date', "")
-                
-                location_info = f"[{comment_location}]" if comment_location else ""
-                date_info = f"({comment_date})" if comment_date else ""
-                comments_text += f"{comment_user}{location_info}{date_info}：{comment_content}\n"
-        
-        full_content = main_content + comments_text
-        full_contents.append(full_content)
+    # 3. 查询结果存储，内容未变化的帖子不再分析
+    result_store = result_store or get_post_result_store()
+    stored_fields: List[Optional[Dict[str, Any]]] = [None] * len(normalized_data)
+    if result_store is not None or dedupe_threshold is not None:
+        # 存储键同时用作近似重复内容的 duplicate_of 标记
+        content_hashes = [post_content_hash(item) for item in normalized_data]
+        store_keys = [post_store_key(item, content_hash) for item, content_hash in zip(normalized_data, content_hashes)]
+    if result_store is not None:
+        version = atomic_store_version(model_id, fused)
+        stored_fields, statuses = result_store.lookup(list(zip(store_keys, content_hashes)), version)
+        reuse = {"total": len(statuses), **{status: statuses.count(status) for status in LOOKUP_STATUSES}}
+        reuse["reuse_ratio"] = reuse["hit"] / len(statuses)
+        print(f"结果存储复用 {reuse['hit']}/{reuse['total']} 条 ({reuse['reuse_ratio']:.1%})，"
+              f"内容变化 {reuse['changed']} 条，版本变化 {reuse['outdated']} 条，新帖子 {reuse['new']} 条")
+    pending = [i for i, fields in enumerate(stored_fields) if fields is None]
+
+    # 构建内容 (按 token 预算裁剪，预算不超过模型上下文窗口)
+    content_budget = min(POST_CONTENT_TOKEN_BUDGET, token_budgeter.budget_for(llm.model) or POST_CONTENT_TOKEN_BUDGET)
+    full_contents = [build_post_content(normalized_data[i], content_budget) for i in pending]
+
+    # 近似重复的内容 (转发、复制粘贴、跨平台重复发布) 只分析第一条，结果复制给其他重复内容
+    duplicate_of: List[Optional[int]] = [None] * len(full_contents)
+    if dedupe_threshold is not None and len(full_contents) > 1:
+        dedupe_start = time.time()
+        duplicate_of = find_near_duplicates(full_contents, threshold=dedupe_threshold)
+        logger.info(f"近似重复检测完成，{sum(1 for rep in duplicate_of if rep is not None)}/{len(full_contents)} 条内容"
+                    f"与前面的内容重复，耗时: {time.time() - dedupe_start:.2f}秒")
+    analyzed = [j for j, rep in enumerate(duplicate_of) if rep is None]
+    full_contents = [full_contents[j] for j in analyzed]
+
+    analysis_errors: Dict[str, Dict] = {}
+    if not full_contents:
+        brand_mentions_list, user_competitions, all_brand_analysis = [], [], []
+    elif batch_job_dir:
+        # 4~6. 离线批处理
+        brand_mentions_list, user_competitions, all_brand_analysis = batch_job_analysis(
+            full_contents, llm, batch_job_dir, batch_job_options, fused=fused)
+        print(f"批处理分析完成，总耗时: {time.time() - start_time:.2f}秒")
+    elif fused:
+        # 4~6. 融合分析
+        brand_mentions_list, user_competitions, all_brand_analysis = batch_fused_analysis(full_contents, llm)
+        print(f"融合分析完成，总耗时: {time.time() - start_time:.2f}秒")
+    else:
+        # 4~6. 按条目流水线执行
+        brand_mentions_list, user_competitions, all_brand_analysis, analysis_errors = _online_analysis(
+            full_contents, llm, pack_token_budget)
+        print(f"品牌提及、用户竞争与品牌分析完成，总耗时: {time.time() - start_time:.2f}秒")
+    # 错误按原始序号记录
+    analysis_errors = {stage: {pending[analyzed[r]]: error for r, error in errors.items()}
+                       for stage, errors in analysis_errors.items()}
 
-    # 4. 分析品牌提及 (每条内容独立分析)
-    brand_mentions_list = batch_analyze_brand_mentions(full_contents, llm, batch_size=20)
-    print(f"品牌提及分析完成，总耗时: {time.time() - start_time:.2f}秒")
-    
-    # 5. 分析用户竞争情况 (每条内容独立分析)
-    user_competitions = batch_analyze_user_competition(full_contents, brand_mentions_list, llm, batch_size=20)
-    print(f"用户竞争分析完成，总耗时: {time.time() - start_time:.2f}秒")
-    
-    # 6. 每条内容单独分析品牌情感和特性
-    all_brand_analysis = []
-    
-    for i, content in enumerate(tqdm(full_contents, desc="分析品牌情感和特性")):
-        # 提取当前内容的主要品牌（最多5个）
-        if i < len(brand_mentions_list) and brand_mentions_list[i]:
-            main_brands = sorted(brand_mentions_list[i].items(), key=lambda x: x[1], reverse=True)[:5]
-            top_brands = [brand for brand, _ in main_brands if brand]
-            
-            # 为当前内容分析所有主要品牌
-            content_brand_analysis = analyze_brands_for_content(content, top_brands, llm)
-        else:
-            content_brand_analysis = {}
-        
-        all_brand_analysis.append(content_brand_analysis)
-    
-    print(f"品牌情感和特性分析完成，总耗时: {time.time() - start_time:.2f}秒")
-    
     # 7. 整合所有结果
+    failed = {i for errors in analysis_errors.values() for i in errors}
+    complete = set()
+    for r, j in enumerate(analyzed):
+        i = pending[j]
+        brand_mentions = brand_mentions_list[r] if r < len(brand_mentions_list) else None
+        user_competition = user_competitions[r] if r < len(user_competitions) else None
+        brand_analysis = (all_brand_analysis[r] if r < len(all_brand_analysis) else None) or {}
+        stored_fields[i] = _atomic_fields(brand_mentions, user_competition, brand_analysis)
+        # 只保存全部步骤都成功的帖子，失败的帖子下次重新分析。被截断的输出在 generate_structured 中
+        # 视为失败 (StructuredOutputError)，到这里为 None，不会当作完整结果写入存储
+        if (i not in failed and brand_mentions is not None and user_competition is not None
+                and all(brand_analysis.values())):
+            complete.add(i)
+    duplicates = 0
+    for j, rep in enumerate(duplicate_of):
+        if rep is None:
+            continue
+        i, source = pending[j], pending[rep]
+        # 标记与结果字段一起保存，从存储复用时仍能看出结果复制自哪条帖子
+        stored_fields[i] = {**copy.deepcopy(stored_fields[source]), 'duplicate_of': store_keys[source]}
+        duplicates += 1
+        if source in complete:
+            complete.add(i)
+    if result_store is not None:
+        to_store = [(store_keys[i], content_hashes[i], stored_fields[i]) for i in sorted(complete)]
+        result_store.put_many(to_store, version)
+        reuse["stored"] = len(to_store)
+        reuse["duplicates"] = duplicates
+        reuse["version"] = version
+        if store_stats is not None:
+            store_stats.update(reuse)
+
     processed_data = []
-    
-    for i, item in enumerate(normalized_data):
-        # 复制原始数据
+    for item, fields in zip(normalized_data, stored_fields):
+        # 复制原始数据，添加品牌提及、用户竞争与品牌分析结果
         processed_item = {k: v for k, v in item.items()}
-        
-        # 添加品牌提及和用户竞争分析结果
-        processed_item['brand_mentions'] = brand_mentions_list[i] if i < len(brand_mentions_list) else {}
-        processed_item['user_competition'] = user_competitions[i] if i < len(user_competitions) else {}
-        
-        # 从品牌分析中提取情感、特性和优劣势
-        brand_analysis = all_brand_analysis[i] if i < len(all_brand_analysis) else {}
-        
-        brand_sentiments = {}
-        brand_features = {}
-        brand_strengths_weaknesses = {}
-        
-        for brand, analysis in brand_analysis.items():
-                
-            # 提取情感
-            brand_sentiments[brand] = analysis.get('sentiment', 'neutral')
-            
-            # 提取特性
-            brand_features[brand] = analysis.get('features', {})
-            
-            # 提取优劣势
-            strengths = analysis.get('strengths', [])
-            weaknesses = analysis.get('weaknesses', [])
-            brand_strengths_weaknesses[brand] = {
-                "strengths": strengths,
-                "weaknesses": weaknesses
-            }
-        
-        processed_item['brand_sentiments'] = brand_sentiments
-        processed_item['brand_features'] = brand_features
-        processed_item['brand_analysis'] = brand_strengths_weaknesses
-        
+        processed_item.update({field: fields.get(field) or {} for field in ATOMIC_FIELDS})
+        if dedupe_threshold is not None and fields.get('duplicate_of') is not None:
+            # 结果复制自近似重复的帖子，记录那条帖子的存储键
+            processed_item['duplicate_of'] = fields['duplicate_of']
         processed_data.append(processed_item)
     
     # 8. 输出结果
@@ -344,6 +774,10 @@ def atomic_insights(parsed_data: List[Dict[str, Any]], output_dir: str = None, m
         output_jsonl_path = os.path.join(output_dir, "atomic_insights_results.json")
         with open(output_jsonl_path, 'w', encoding='utf-8') as f:
             json.dump(processed_data, f, ensure_ascii=False, indent=2)
+        if analysis_errors:
+            # 失败的条目在结果中为空值，错误信息单独保存便于排查与重跑
+            with open(os.path.join(output_dir, "atomic_insights_errors.json"), 'w', encoding='utf-8') as f:
+                json.dump(analysis_errors, f, ensure_ascii=False, indent=2)
 
     total_time = time.time() - start_time
     print(f"原子化分析完成，共处理 {len(parsed_data)} 条数据，总耗时: {total_time:.2f}秒，平均每条 {total_time/len(parsed_data):.2f}秒")
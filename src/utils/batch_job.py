@@ -0,0 +1,227 @@
+"""
+离线批处理任务模块
+
+大批量回填不需要低延迟，只需要便宜的吞吐：把互相独立的 chat completion 请求写成
+供应商批处理格式的 JSONL 任务文件 (每行 {"custom_id", "method", "url", "body"})，
+通过 Files + Batches 接口提交 (或提交给本地桩服务 src.utils.llm_stub_server)，
+轮询到批次结束后按 custom_id 取回结果。
+
+任务目录中保存已取回的结果 (results.jsonl) 与提交记录 (batches.json)：
+进程中断后重新运行会先收取仍在处理中的批次，部分请求失败时只重新提交未完成的请求。
+"""
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.utils.llm_metrics import record_llm_call
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# 批次的终止状态，之后不会再有新的输出
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+DEFAULT_BATCH_JOB_CONFIG: Dict[str, Any] = {
+    "poll_interval": 30.0,              # 轮询批次状态的间隔(秒)
+    "timeout": 24 * 3600.0,             # 等待单轮批次结束的最长时间(秒)
+    "completion_window": "24h",         # 提交时声明的完成时限
+    "max_requests_per_file": 50000,     # 单个任务文件的最多请求数，超出时拆成多个批次
+    "max_rounds": 2,                    # 单次运行中对失败请求的最多提交轮数
+}
+
+
+class BatchJobError(RuntimeError):
+    """批处理任务提交或轮询失败"""
+
+
+def batch_request_line(custom_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """构建任务文件中的一行请求"""
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _append_jsonl(path: str, records: List[Dict[str, Any]]) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _field(obj: Any, name: str) -> Any:
+    """兼容接口返回的 dict 与 SDK 对象"""
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+class BatchJob:
+    """一个可恢复的离线批处理任务
+
+    同一任务目录可以反复运行：已取回的结果直接复用，未完成的请求重新提交。
+    """
+
+    def __init__(self, job_dir: str, client: Any, label: Optional[str] = None, **config: Any):
+        """
+        Args:
+            job_dir: 任务目录，保存任务文件、提交记录与取回的结果
+            client: OpenAI 兼容客户端 (需要支持 Files 与 Batches 接口)
+            label: 调用阶段标签，取回的结果按该标签记入计量
+            **config: 覆盖 DEFAULT_BATCH_JOB_CONFIG 的配置项
+        """
+        self.job_dir = job_dir
+        self.client = client
+        self.label = label
+        self.config = {**DEFAULT_BATCH_JOB_CONFIG, **config}
+        self.results_path = os.path.join(job_dir, "results.jsonl")
+        self.errors_path = os.path.join(job_dir, "errors.jsonl")
+        self.batches_path = os.path.join(job_dir, "batches.json")
+        self.stats = {"reused": 0, "submitted": 0, "succeeded": 0, "failed": 0, "batches": 0}
+        os.makedirs(job_dir, exist_ok=True)
+
+    def load_results(self) -> Dict[str, Dict[str, Any]]:
+        """读取已取回的结果 custom_id -> 响应体 (chat.completion)"""
+        return {record["custom_id"]: record["response"] for record in _read_jsonl(self.results_path)}
+
+    def _load_batches(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.batches_path):
+            return []
+        with open(self.batches_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_batches(self, batches: List[Dict[str, Any]]) -> None:
+        tmp_path = self.batches_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(batches, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.batches_path)
+
+    def run(self, requests: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """提交尚未完成的请求并等待结果
+
+        Args:
+            requests: custom_id -> chat.completions 请求体
+
+        Returns:
+            custom_id -> 响应体；多轮提交后仍失败的请求不在结果中，重新运行时会再次提交
+        """
+        batches = self._load_batches()
+        # 先收取上次运行中断时仍在处理的批次，避免重复提交
+        in_flight = [batch for batch in batches if not batch.get("collected")]
+        if in_flight:
+            logger.info(f"[{self.job_dir}] 恢复 {len(in_flight)} 个未收取的批次")
+            self._wait_and_collect(batches, in_flight)
+
+        results = self.load_results()
+        self.stats["reused"] = sum(1 for custom_id in requests if custom_id in results)
+        for round_index in range(self.config["max_rounds"]):
+            pending = {cid: body for cid, body in requests.items() if cid not in results}
+            if not pending:
+                break
+            logger.info(f"[{self.job_dir}] 第 {round_index + 1} 轮提交 {len(pending)} 条请求 "
+                        f"(已完成 {len(requests) - len(pending)} 条)")
+            submitted = [self._submit(batches, chunk) for chunk in self._chunks(pending)]
+            self._wait_and_collect(batches, submitted)
+            results = self.load_results()
+
+        self.stats["failed"] = sum(1 for custom_id in requests if custom_id not in results)
+        return {custom_id: results[custom_id] for custom_id in requests if custom_id in results}
+
+    def _chunks(self, pending: Dict[str, Dict[str, Any]]) -> Iterator[Dict[str, Dict[str, Any]]]:
+        items = list(pending.items())
+        size = self.config["max_requests_per_file"]
+        for i in range(0, len(items), size):
+            yield dict(items[i:i + size])
+
+    def _submit(self, batches: List[Dict[str, Any]], requests: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """写任务文件、上传并创建批次，提交记录立即落盘"""
+        input_path = os.path.join(self.job_dir, f"input-{len(batches):04d}.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for custom_id, body in requests.items():
+                f.write(json.dumps(batch_request_line(custom_id, body), ensure_ascii=False) + "\n")
+        try:
+            with open(input_path, "rb") as f:
+                input_file = self.client.files.create(file=(os.path.basename(input_path), f.read()), purpose="batch")
+            created = self.client.post("/batches", cast_to=Dict[str, Any], body={
+                "input_file_id": _field(input_file, "id"),
+                "endpoint": BATCH_ENDPOINT,
+                "completion_window": self.config["completion_window"],
+            })
+        except Exception as e:
+            raise BatchJobError(f"提交批处理任务失败: {e}") from e
+        batch = {
+            "id": _field(created, "id"),
+            "input_file": os.path.basename(input_path),
+            "requests": len(requests),
+            "status": _field(created, "status"),
+            "submitted_at": time.time(),
+            "collected": False,
+        }
+        batches.append(batch)
+        self._save_batches(batches)
+        self.stats["submitted"] += len(requests)
+        self.stats["batches"] += 1
+        return batch
+
+    def _wait_and_collect(self, batches: List[Dict[str, Any]], waiting: List[Dict[str, Any]]) -> None:
+        deadline = time.time() + self.config["timeout"]
+        waiting = list(waiting)
+        while waiting:
+            for batch in list(waiting):
+                try:
+                    remote = self.client.get(f"/batches/{batch['id']}", cast_to=Dict[str, Any])
+                except Exception as e:
+                    raise BatchJobError(f"查询批次 {batch['id']} 失败: {e}") from e
+                batch["status"] = _field(remote, "status")
+                if batch["status"] in TERMINAL_STATUSES:
+                    self._collect(batch, remote)
+                    batch["collected"] = True
+                    self._save_batches(batches)
+                    waiting.remove(batch)
+            if not waiting:
+                break
+            if time.time() >= deadline:
+                # 批次仍保持未收取状态，下次运行时继续等待
+                raise BatchJobError(f"等待批次超时: {[batch['id'] for batch in waiting]}")
+            time.sleep(self.config["poll_interval"])
+
+    def _collect(self, batch: Dict[str, Any], remote: Any) -> None:
+        """取回一个已结束批次的输出，成功的结果追加到 results.jsonl 并记入计量"""
+        latency = time.time() - batch["submitted_at"]
+        succeeded, failed = [], []
+        for file_key in ("output_file_id", "error_file_id"):
+            file_id = _field(remote, file_key)
+            if not file_id:
+                continue
+            for line in self.client.files.retrieve_content(file_id).splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                body = response.get("body") or {}
+                if response.get("status_code") == 200 and body.get("choices"):
+                    succeeded.append({"custom_id": record["custom_id"], "response": body})
+                else:
+                    failed.append(record)
+        _append_jsonl(self.results_path, succeeded)
+        _append_jsonl(self.errors_path, failed)
+        for record in succeeded:
+            body = record["response"]
+            usage = body.get("usage") or {}
+            record_llm_call(self.label, body.get("model") or "batch",
+                            prompt_tokens=usage.get("prompt_tokens", 0),
+                            completion_tokens=usage.get("completion_tokens", 0),
+                            latency=latency, source="batch")
+        for record in failed:
+            record_llm_call(self.label, "batch", latency=latency, source="batch",
+                            error=json.dumps(record.get("error") or record.get("response"), ensure_ascii=False)[:200])
+        self.stats["succeeded"] += len(succeeded)
+        missing = batch["requests"] - len(succeeded) - len(failed)
+        logger.info(f"[{self.job_dir}] 批次 {batch['id']} 状态 {batch['status']}: 成功 {len(succeeded)} 条，"
+                    f"失败 {len(failed)} 条，无输出 {max(0, missing)} 条")
@@ -0,0 +1,128 @@
+"""
+LLM 请求录制/回放 (cassette) 模块
+
+录制模式下把每次请求与响应写入紧凑的 JSONL 文件 (以 .gz 结尾时 gzip 压缩)；
+回放模式下按请求内容返回录制的响应，可按录制时的耗时或零延迟回放，
+用于在不消耗 token 的情况下端到端对比不同版本流水线的吞吐。
+"""
+import gzip
+import json
+import threading
+import collections
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.llm_cache import make_cache_key
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(LookupError):
+    """回放模式下找不到录制的响应"""
+
+
+def cassette_key(request_params: Dict[str, Any]) -> str:
+    """请求的录制键，流式与非流式请求分开"""
+    key = make_cache_key(request_params)
+    return key + ":stream" if request_params.get("stream") else key
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Cassette:
+    """一盘录制带，mode 为 "record" 或 "replay"
+
+    同一请求被录制多次时 (如 temperature > 0)，回放按录制顺序依次返回，
+    用完后重复返回最后一次的响应。
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY, latency: str = "recorded"):
+        """
+        Args:
+            path: 录制文件路径
+            mode: "record" 追加写入，"replay" 读取回放
+            latency: 回放延迟，"recorded" 按录制耗时，"zero" 立即返回
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"未知的 cassette 模式: {mode}")
+        if latency not in ("recorded", "zero"):
+            raise ValueError(f"未知的回放延迟模式: {latency}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._entries: Dict[str, collections.deque] = {}
+        self._file = None
+        if mode == REPLAY:
+            self._load()
+        else:
+            self._file = _open(path, "a")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def _load(self) -> None:
+        with _open(self.path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], collections.deque()).append(entry)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.stats["recorded"] += 1
+
+    def record(self, request_params: Dict[str, Any], response: Dict[str, Any], latency: float) -> None:
+        """录制一次非流式请求的响应 (model_dump 后的字典) 与耗时"""
+        self._write({"key": cassette_key(request_params), "model": request_params.get("model"),
+                     "latency": round(latency, 4), "response": response})
+
+    def record_stream(self, request_params: Dict[str, Any], chunks: List[Tuple[float, Dict[str, Any]]]) -> None:
+        """录制一次完整的流式响应，chunks 为 (相对开始的秒数, chunk 字典) 列表"""
+        self._write({"key": cassette_key(request_params), "model": request_params.get("model"),
+                     "chunks": [[round(offset, 4), chunk] for offset, chunk in chunks]})
+
+    def _next(self, request_params: Dict[str, Any]) -> Dict[str, Any]:
+        key = cassette_key(request_params)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"cassette {self.path} 中没有模型 {request_params.get('model')} 的该请求记录")
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+            self.stats["replayed"] += 1
+        return entry
+
+    def replay(self, request_params: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+        """返回 (录制的响应字典, 应等待的秒数)"""
+        entry = self._next(request_params)
+        return entry["response"], entry.get("latency", 0.0) if self.latency == "recorded" else 0.0
+
+    def replay_stream(self, request_params: Dict[str, Any]) -> List[Tuple[float, Dict[str, Any]]]:
+        """返回 [(应等待到的相对秒数, chunk 字典)]，零延迟模式下偏移均为 0"""
+        entry = self._next(request_params)
+        zero = self.latency == "zero"
+        return [(0.0 if zero else offset, chunk) for offset, chunk in entry["chunks"]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "path": self.path, **self.stats}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
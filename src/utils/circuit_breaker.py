@@ -0,0 +1,164 @@
+"""
+熔断器模块
+
+按模型 ID 维护熔断状态：closed (正常放行) -> open (错误率超过阈值，快速失败) ->
+half_open (冷却结束后放行少量探测请求，成功则恢复 closed，失败则重新 open)。
+错误率按时间滑动窗口统计；只有端点本身的故障 (超时、连接错误、5xx、429) 计入错误。
+"""
+import time
+import threading
+import collections
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时的快速失败"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"模型 {name} 熔断中，{retry_after:.1f}秒后重试")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """单个模型端点的熔断器，线程安全"""
+
+    def __init__(self,
+                 name: str,
+                 failure_rate_threshold: float = 0.5,
+                 min_calls: int = 10,
+                 window_seconds: float = 60.0,
+                 open_seconds: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        Args:
+            name: 熔断器名称 (通常为模型 ID)
+            failure_rate_threshold: 窗口内错误率达到该值时打开熔断
+            min_calls: 窗口内调用数不足时不判定
+            window_seconds: 错误率滑动窗口长度(秒)
+            open_seconds: 打开后多久进入半开状态(秒)
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probes = 0
+        self._outcomes: collections.deque = collections.deque()  # (时间, 是否失败)
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, failed in self._outcomes if failed) / len(self._outcomes)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self._probes = 0
+        self.stats["opened"] += 1
+
+    def acquire(self) -> None:
+        """请求发出前调用；熔断打开 (或半开探测名额已满) 时抛出 CircuitOpenError"""
+        with self._lock:
+            now = time.time()
+            if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == OPEN:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self.opened_at + self.open_seconds - now)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probes += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            now = time.time()
+            self.stats["calls"] += 1
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, False))
+            self._trim(now)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            now = time.time()
+            self.stats["calls"] += 1
+            self.stats["failures"] += 1
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            self._outcomes.append((now, True))
+            self._trim(now)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and self._failure_rate() >= self.failure_rate_threshold):
+                self._open(now)
+
+    def record_ignored(self) -> None:
+        """请求被取消或因调用方错误失败 (如 400)，不计入错误率，仅释放半开探测名额"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前状态、窗口内错误率与累计统计"""
+        with self._lock:
+            now = time.time()
+            self._trim(now)
+            retry_after: Optional[float] = None
+            if self.state == OPEN:
+                retry_after = max(0.0, self.opened_at + self.open_seconds - now)
+            return {
+                "name": self.name,
+                "state": self.state,
+                "window_calls": len(self._outcomes),
+                "failure_rate": round(self._failure_rate(), 3),
+                "retry_after": retry_after,
+                "stats": dict(self.stats),
+            }
+
+
+class CircuitBreakerRegistry:
+    """按模型 ID 懒创建 CircuitBreaker，共享默认参数"""
+
+    def __init__(self, **breaker_options: Any):
+        self.breaker_options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model_id)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(model_id)
+                if breaker is None:
+                    breaker = CircuitBreaker(model_id, **self.breaker_options)
+                    self._breakers[model_id] = breaker
+        return breaker
+
+    def configure(self, **breaker_options: Any) -> None:
+        """更新默认参数，已创建的熔断器会被重建 (状态重置为 closed)"""
+        with self._lock:
+            self.breaker_options.update(breaker_options)
+            self._breakers.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {model_id: breaker.snapshot() for model_id, breaker in list(self._breakers.items())}
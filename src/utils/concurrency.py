@@ -0,0 +1,238 @@
+"""
+自适应并发控制模块
+
+按 AIMD (加性增、乘性减) 策略自动调整每个模型端点的在途请求上限：
+p90 延迟保持稳定时逐步加 1，遇到限流 (429) 或延迟突增时乘性下调。
+当前上限与最近的调整决策可通过 snapshot / 监听回调获取。
+"""
+import time
+import asyncio
+import threading
+import collections
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """计算分位数 (q 取 0~1)，空列表返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class AIMDController:
+    """单个模型端点的自适应并发上限"""
+
+    def __init__(self,
+                 name: str,
+                 initial_limit: float = 16,
+                 min_limit: float = 1,
+                 max_limit: float = 128,
+                 decrease_factor: float = 0.5,
+                 latency_tolerance: float = 1.5,
+                 spike_factor: float = 3.0,
+                 window_size: int = 100,
+                 min_samples: int = 20,
+                 cooldown: float = 2.0,
+                 listeners: Optional[List[Callable[[Dict[str, Any]], None]]] = None):
+        """
+        Args:
+            name: 控制器名称 (通常为模型 ID)
+            initial_limit: 初始在途上限
+            min_limit: 上限下界
+            max_limit: 上限上界
+            decrease_factor: 乘性下调系数
+            latency_tolerance: 最近 p90 不超过基线 p90 的该倍数时视为稳定，允许加 1
+            spike_factor: 单次延迟超过基线 p90 的该倍数时视为延迟突增
+            window_size: 延迟滑动窗口大小
+            min_samples: 判定延迟突增所需的最少样本数
+            cooldown: 两次下调之间的最短间隔(秒)，避免同一波错误连续减半
+            listeners: 每次调整后调用的回调，参数为 snapshot()
+        """
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.spike_factor = spike_factor
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.listeners = list(listeners or [])
+
+        self.in_flight = 0
+        self.baseline_p90: Optional[float] = None
+        self._latencies: collections.deque = collections.deque(maxlen=window_size)
+        self._successes_since_change = 0
+        self._last_decrease = 0.0
+        self.decisions: collections.deque = collections.deque(maxlen=50)
+        self.stats = {"completed": 0, "rate_limited": 0, "latency_spikes": 0, "increases": 0, "decreases": 0}
+        self._cond = threading.Condition()
+        # 等待槽位的协程 (事件循环, future)，按到达顺序由 release 唤醒
+        self._async_waiters: collections.deque = collections.deque()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    def acquire(self) -> None:
+        """阻塞直到有空闲并发槽位"""
+        with self._cond:
+            while not self._has_capacity():
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        """acquire 的异步版本：没有空闲槽位时排队等待 release 按先后顺序交出槽位，不轮询"""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._has_capacity() and not self._async_waiters:
+                self.in_flight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._async_waiters.append(waiter)
+        try:
+            await waiter[1]
+        except BaseException:
+            with self._cond:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+                else:
+                    # 取消前槽位已交给本协程，归还给下一个等待者
+                    self._release_slot()
+            raise
+
+    def _wake_async_waiters(self) -> None:
+        """把空闲槽位按到达顺序交给等待中的协程 (需持有锁)"""
+        while self._async_waiters and self._has_capacity():
+            loop, future = self._async_waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(_grant, future)
+            except RuntimeError:
+                # 事件循环已关闭，收回槽位
+                self.in_flight -= 1
+
+    def _release_slot(self) -> None:
+        """归还一个槽位并唤醒等待者 (需持有锁)"""
+        self.in_flight -= 1
+        self._wake_async_waiters()
+        self._cond.notify_all()
+
+    def release(self, latency: Optional[float], rate_limited: bool = False) -> None:
+        """释放槽位并根据本次结果调整上限
+
+        Args:
+            latency: 本次调用耗时(秒)，调用失败且非限流时传 None
+            rate_limited: 是否遇到 429 限流
+        """
+        decision = None
+        with self._cond:
+            now = time.time()
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+                decision = self._decrease(now, "rate_limited")
+            elif latency is not None:
+                self.stats["completed"] += 1
+                decision = self._observe_latency(now, latency)
+            self._release_slot()
+        if decision:
+            self._notify()
+
+    def _observe_latency(self, now: float, latency: float) -> Optional[Dict[str, Any]]:
+        spike = (self.baseline_p90 is not None and len(self._latencies) >= self.min_samples
+                 and latency > self.baseline_p90 * self.spike_factor)
+        self._latencies.append(latency)
+        if spike:
+            self.stats["latency_spikes"] += 1
+            return self._decrease(now, f"latency_spike {latency:.2f}s > {self.spike_factor}x p90 {self.baseline_p90:.2f}s")
+
+        self._successes_since_change += 1
+        # 大约每完成一轮 (limit 个) 请求评估一次是否加 1
+        if self._successes_since_change < max(1, int(self.limit)):
+            return None
+        self._successes_since_change = 0
+        recent_p90 = percentile(list(self._latencies), 0.9)
+        if self.baseline_p90 is None:
+            self.baseline_p90 = recent_p90
+        stable = recent_p90 <= self.baseline_p90 * self.latency_tolerance
+        # 基线缓慢跟随，适应端点正常的容量变化
+        self.baseline_p90 = 0.9 * self.baseline_p90 + 0.1 * recent_p90
+        if stable and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.stats["increases"] += 1
+            return self._record(now, "increase", f"p90 {recent_p90:.2f}s stable")
+        return None
+
+    def _decrease(self, now: float, reason: str) -> Optional[Dict[str, Any]]:
+        if now - self._last_decrease < self.cooldown:
+            return None
+        self._last_decrease = now
+        self._successes_since_change = 0
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.stats["decreases"] += 1
+        return self._record(now, "decrease", reason)
+
+    def _record(self, now: float, action: str, reason: str) -> Dict[str, Any]:
+        decision = {"time": now, "action": action, "limit": self.limit, "reason": reason}
+        self.decisions.append(decision)
+        return decision
+
+    def _notify(self) -> None:
+        snapshot = self.snapshot()
+        for listener in self.listeners:
+            listener(snapshot)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前上限、在途数、基线延迟与最近决策"""
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "async_waiters": len(self._async_waiters),
+                "baseline_p90": self.baseline_p90,
+                "recent_p90": percentile(list(self._latencies), 0.9),
+                "stats": dict(self.stats),
+                "decisions": list(self.decisions)[-10:],
+            }
+
+
+class ConcurrencyRegistry:
+    """按模型 ID 懒创建 AIMDController，共享默认参数与监听回调"""
+
+    def __init__(self, **controller_options: Any):
+        self.controller_options = controller_options
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._controllers: Dict[str, AIMDController] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_id: str) -> AIMDController:
+        controller = self._controllers.get(model_id)
+        if controller is None:
+            with self._lock:
+                controller = self._controllers.get(model_id)
+                if controller is None:
+                    controller = AIMDController(model_id, listeners=self.listeners, **self.controller_options)
+                    self._controllers[model_id] = controller
+        return controller
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """注册指标回调，每次上限调整后以 snapshot 调用"""
+        self.listeners.append(listener)
+        for controller in list(self._controllers.values()):
+            controller.listeners.append(listener)
+
+    def configure(self, **controller_options: Any) -> None:
+        """更新默认参数，已创建的控制器会被重建"""
+        with self._lock:
+            self.controller_options.update(controller_options)
+            self._controllers.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {model_id: controller.snapshot() for model_id, controller in list(self._controllers.items())}
@@ -6,49 +6,248 @@
 
 import re
 import json
-from typing import Dict, Any, Optional, Union, Tuple
+import logging
+from typing import Dict, Any, Iterator, List, Optional, Union, Tuple
 
-def extract_json_from_markdown(text: str) -> Optional[Dict[str, Any]]:
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {"{": "}", "[": "]"}
+# 单遍扫描的词法单元：完整 (或截断到文本末尾) 的字符串、括号、逗号、// 注释；其余内容整段复制
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(?:"|\\?\Z)|[{}\[\],]|//[^\n]*')
+
+
+def _strip_trailing_comma(out: list) -> None:
+    while out:
+        tail = out[-1].rstrip()
+        if not tail:
+            out.pop()
+            continue
+        out[-1] = tail[:-1] if tail.endswith(",") else tail
+        return
+
+
+def _find_opener(text: str, openers: str, begin: int, end: int) -> Optional[int]:
+    """返回 text[begin:end] 中第一个左括号的位置，没有则返回 None"""
+    found = [index for index in (text.find(ch, begin, end) for ch in openers) if index >= 0]
+    return min(found) if found else None
+
+
+def _repair_truncated(out: list, stack: list, last_comma: Optional[Tuple[int, Tuple[str, ...]]]) -> str:
+    """补齐到文本末尾仍未闭合的 JSON：去掉悬空的逗号/冒号后补齐括号"""
+    closed = _close_truncated(out, stack)
+    try:
+        json.loads(closed)
+        return closed
+    except json.JSONDecodeError:
+        pass
+    if last_comma is not None:
+        # 最后一个元素不完整 (如截断在数字或键名中间)，退回到最后一个逗号之前
+        index, comma_stack = last_comma
+        return _close_truncated(out[:index], list(comma_stack))
+    return closed
+
+
+def _json_candidates(text: str, openers: str, allow_truncated: bool) -> Iterator[Tuple[str, bool]]:
+    """单遍扫描文本，按起始位置顺序产出以 openers 中字符开头的平衡 JSON 值
+
+    从容器之外的下一个左括号开始扫描一个顶层容器，扫描时识别字符串与转义，
+    去掉对象/数组末尾多余的逗号和 // 注释，并记录其中每个闭合的 (嵌套) 值；
+    顶层容器闭合后依次产出它及其内部的值，调用方取第一个能解析的即可提前结束。
+    每个字符只扫描一次，正文中大量不闭合的括号不会导致重复扫描。
+    到文本末尾仍未闭合时，allow_truncated 为 True 则先产出补齐字符串引号与括号后的结果；
+    若正文中不成对的引号把后面的左括号当成了字符串内容，则从其中第一个左括号处重新扫描。
+
+    Yields:
+        (清理后的 JSON 文本, 是否为截断后补齐的结果)
+    """
+    next_opener = {ch: text.find(ch) for ch in openers}
+    # 重新扫描时跳过已经产出过的值 (按起始位置)
+    yielded = set()
+    # 未闭合的扫描都会走到文本末尾；重新扫描一次即覆盖了引号配对的两种可能，之后不再重新扫描
+    restarted = False
+    position = 0
+    while True:
+        for ch, found in next_opener.items():
+            if 0 <= found < position:
+                next_opener[ch] = text.find(ch, position)
+        starts = [found for found in next_opener.values() if found >= 0]
+        if not starts:
+            return
+        start = min(starts)
+
+        out: List[str] = []
+        stack: List[str] = []
+        # 未闭合的左括号: (文本位置, 在 out 中的下标, 括号)；已闭合的值: (文本位置, 起止下标)
+        open_at: List[Tuple[int, int, str]] = []
+        spans: List[Tuple[int, int, int]] = []
+        # 最近一个逗号之前的输出长度及当时的括号栈，截断补齐失败时退回到这里
+        last_comma: Optional[Tuple[int, Tuple[str, ...]]] = None
+        # 被当成字符串内容的第一个左括号，未闭合时从这里重新扫描
+        resume: Optional[int] = None
+        position = start
+        closed = False
+        for match in _TOKEN.finditer(text, start):
+            token_start = match.start()
+            if token_start > position:
+                out.append(text[position:token_start])
+            position = match.end()
+            token = match.group()
+            first = token[0]
+            if first == '"':
+                if len(token) == 1 or token[-1] != '"' or (token[-2] == "\\" and position == len(text)):
+                    # 截断在字符串中间：去掉悬空的转义符并补齐引号
+                    token = (token[:-1] if token.endswith("\\") else token) + '"'
+                if resume is None:
+                    resume = _find_opener(text, openers, token_start + 1, position)
+                out.append(token)
+            elif first in _CLOSERS:
+                stack.append(_CLOSERS[first])
+                open_at.append((token_start, len(out), first))
+                out.append(first)
+            elif first == "}" or first == "]":
+                # 去掉 ",}" / ",]" 中多余的逗号
+                _strip_trailing_comma(out)
+                out.append(first)
+                if stack:
+                    stack.pop()
+                    opened, index, opener = open_at.pop()
+                    if opener in openers:
+                        spans.append((opened, index, len(out)))
+                if not stack:
+                    closed = True
+                    break
+            elif first == ",":
+                last_comma = (len(out), tuple(stack))
+                out.append(first)
+            # 其余为 // 注释，直接丢弃
+
+        if not closed:
+            if position < len(text):
+                out.append(text[position:])
+            if allow_truncated and text[start] in openers:
+                yield _repair_truncated(out, stack, last_comma), True
+        spans.sort()
+        for opened, begin, end in spans:
+            if opened not in yielded:
+                yielded.add(opened)
+                yield "".join(out[begin:end]), False
+        if not closed:
+            if resume is None or restarted:
+                return
+            restarted = True
+            # 如 '{ 说明 "引号 } {"a": 1}'：引号不成对，真正的 JSON 落在了字符串里
+            position = resume
+            next_opener = {ch: text.find(ch, position) for ch in openers}
+
+
+def _fenced_blocks(text: str):
+    """依次产出 ``` 代码块的内容，未闭合的代码块延伸到文本末尾"""
+    position = 0
+    while True:
+        open_at = text.find("```", position)
+        if open_at < 0:
+            return
+        body_start = open_at + 3
+        if text.startswith("json", body_start):
+            body_start += 4
+        close_at = text.find("```", body_start)
+        if close_at < 0:
+            yield text[body_start:]
+            return
+        yield text[body_start:close_at]
+        position = close_at + 3
+
+
+def _close_truncated(out: list, stack: list) -> str:
+    text = "".join(out).rstrip()
+    while text and text[-1] in ",:":
+        if text[-1] == ":":
+            # 只有键没有值：去掉整个键
+            key_start = text.rfind('"', 0, text.rfind('"', 0, len(text) - 1))
+            text = text[:key_start].rstrip() if key_start >= 0 else text[:-1].rstrip()
+        else:
+            text = text[:-1].rstrip()
+    return text + "".join(reversed(stack))
+
+
+def _first_json_value(text: str, openers: str, allow_truncated: bool = False) -> Tuple[Any, bool]:
+    """返回文本中第一个能解析的、以 openers 中字符开头的 JSON 值及其是否为截断后补齐的结果"""
+    for candidate, truncated in _json_candidates(text, openers, allow_truncated):
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            # 不是 JSON (如正文中的 [图片])，尝试下一个
+            continue
+        if truncated:
+            logger.info(f"JSON 输出被截断，已补齐为 {len(candidate)} 个字符的部分结果")
+        return value, truncated
+    return None, False
+
+
+def extract_json_from_markdown(text: str, allow_truncated: bool = False) -> Optional[Dict[str, Any]]:
     """
     从可能包含 Markdown 格式的文本中提取 JSON 内容
     
+    依次尝试: 整体解析; ```json 代码块 (及未闭合的代码块) 中的对象或数组;
+    正文中第一个可解析的对象。后两步使用单遍扫描找出最外层的平衡括号，
+    能处理多余的逗号与 // 注释。
+    
     参数:
         text: 可能包含 Markdown 格式的文本
+        allow_truncated: 是否接受被截断的输出 (补齐字符串引号与括号后的部分结果)；
+                         补齐后的结果可能缺少字段，只应在随后会按 Schema 校验时开启
         
     返回:
         解析后的 JSON 对象，如果提取或解析失败则返回 None
     """
+    return _extract_json(text, allow_truncated)[0]
+
+
+def extract_json_with_truncation(text: str) -> Tuple[Optional[Any], bool]:
+    """
+    同 extract_json_from_markdown(text, allow_truncated=True)，同时返回结果是否为截断后补齐的
+
+    返回:
+        (解析后的 JSON，提取失败为 None；是否为截断后补齐的部分结果)
+    """
+    return _extract_json(text, True)
+
+
+def _extract_json(text: str, allow_truncated: bool) -> Tuple[Optional[Any], bool]:
+    # 批量请求中失败的条目为 None，直接视为提取失败
+    if not isinstance(text, str):
+        return None, False
+
     # 尝试直接解析，可能本身就是 JSON
     try:
-        return json.loads(text)
+        return json.loads(text), False
     except json.JSONDecodeError:
         pass
-    
-    # 尝试提取 ```json ... ``` 格式的内容
-    json_pattern = r'```(?:json)?\s*([\s\S]*?)```'
-    matches = re.findall(json_pattern, text)
-    
-    for match in matches:
-        try:
-            return json.loads(match.strip())
-        except json.JSONDecodeError:
-            continue
-    
-    # 尝试提取 { ... } 格式的内容（最外层的大括号对）
-    brace_pattern = r'({[\s\S]*?})'
-    matches = re.findall(brace_pattern, text)
-    
-    for match in matches:
-        try:
-            # 尝试解析可能的 JSON 对象
-            result = json.loads(match.strip())
-            # 确认结果是字典类型，而不是数组或原始值
-            if isinstance(result, dict):
-                return result
-        except json.JSONDecodeError:
-            continue
-    
-    return None
+
+    # 整体以 { 或 [ 开头 (可能有多余逗号或被截断)
+    stripped = text.lstrip()
+    if stripped[:1] in _CLOSERS:
+        result, truncated = _first_json_value(stripped, "{[", allow_truncated)
+        if result is not None:
+            return result, truncated
+
+    # 代码块中的对象或数组
+    if "```" in text:
+        for block in _fenced_blocks(text):
+            block = block.strip()
+            try:
+                return json.loads(block), False
+            except json.JSONDecodeError:
+                pass
+            result, truncated = _first_json_value(block, "{[", allow_truncated)
+            if result is not None:
+                return result, truncated
+
+    # 正文中的对象
+    result, truncated = _first_json_value(text, "{", allow_truncated)
+    if isinstance(result, dict):
+        return result, truncated
+    return None, False
 
 def extract_html_from_markdown(text: str) -> Optional[str]:
     """
@@ -0,0 +1,157 @@
+"""
+extract_json_from_markdown 微基准
+
+对比单遍扫描实现与原先的正则级联实现 (整体解析 -> 代码块 -> 非贪婪 {...} 匹配)
+的耗时与提取结果，内置样本还会检查提取到的是否为最外层的 JSON (而不是某个内层对象)。
+另有一组病态样本 (正文中大量不闭合的括号) 单独计时，用于发现扫描退化为平方复杂度的回归。
+样本默认使用内置的典型 LLM 输出，也可以读取 cassette 录制文件 (见 src.utils.cassette)
+中的真实响应:
+
+    python -m src.utils.extract_markdown_bench --cassette outputs/run.jsonl.gz
+"""
+import re
+import sys
+import gzip
+import json
+import time
+import argparse
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils.extract_markdown import extract_json_from_markdown
+
+
+def legacy_extract_json_from_markdown(text: str) -> Optional[Dict[str, Any]]:
+    """原先的正则级联实现，仅用于对比"""
+    if not isinstance(text, str):
+        return None
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    for match in re.findall(r'```(?:json)?\s*([\s\S]*?)```', text):
+        try:
+            return json.loads(match.strip())
+        except json.JSONDecodeError:
+            continue
+    for match in re.findall(r'({[\s\S]*?})', text):
+        try:
+            result = json.loads(match.strip())
+            if isinstance(result, dict):
+                return result
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _keyword_analysis_output(brands: int = 5, keywords: int = 20) -> str:
+    data = {"关键词分析": [{
+        "品牌": f"品牌{b}",
+        "正面关键词": [{"text": f"优点{k}", "weight": k % 10 + 1} for k in range(keywords)],
+        "负面关键词": [{"text": f"缺点{k}", "weight": k % 10 + 1} for k in range(keywords)],
+        "原声示例": [{"关键词": f"优点{k}", "情感": "正面", "原声": [f"用户说优点{k}很好，{{没毛病}}"]}
+                     for k in range(5)],
+    } for b in range(brands)]}
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def builtin_samples() -> List[Tuple[str, Optional[List[str]]]]:
+    """内置的典型输出：纯 JSON、带说明的代码块、正文内嵌套对象、多余逗号、注释与截断
+
+    Returns:
+        (输出文本, 最外层对象应包含的键；不含 JSON 时为 None) 列表
+    """
+    analysis = _keyword_analysis_output()
+    brand_analysis = ('{\n  "sentiment": "positive",  // 总体情感倾向\n  "features": {"续航": "表现好", "价格": "偏贵",},\n'
+                      '  "strengths": [{"feature": "续航", "description": "满电能跑500公里"},],\n  "weaknesses": []\n}')
+    return [
+        ('{"小米": 3, "华为": 1}', ["小米", "华为"]),
+        (analysis, ["关键词分析"]),
+        (f"好的，以下是分析结果：\n\n```json\n{analysis}\n```\n\n以上结果基于提供的内容样本。", ["关键词分析"]),
+        ('根据内容，主要品牌如下 [见原文]：{"brand_pairs": [{"type": "流出", "source_brand": "A", '
+         '"target_brand": "B", "evidence": "从A换到了B"}], "reason": "用户对A不满"} 希望有帮助。',
+         ["brand_pairs", "reason"]),
+        (brand_analysis, ["sentiment", "features", "strengths", "weaknesses"]),
+        (f"```json\n{analysis[:len(analysis) * 2 // 3]}", ["关键词分析"]),
+        ("这段内容没有提到任何品牌。", None),
+    ]
+
+
+def pathological_samples() -> List[Tuple[str, Optional[List[str]]]]:
+    """病态样本：约 56 KB 的正文中有 8000 个不闭合的 {，JSON 在末尾；以及大量闭合的非 JSON 括号"""
+    return [
+        ("说明 {占位" * 8000 + '{"a": 1}', ["a"]),
+        ("[图片] " * 8000 + '{"a": 1}', ["a"]),
+    ]
+
+
+def cassette_samples(path: str) -> List[Tuple[str, Optional[List[str]]]]:
+    """读取 cassette 录制文件中的非流式响应内容 (不检查提取结果的结构)"""
+    samples = []
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            response = json.loads(line).get("response") or {}
+            for choice in response.get("choices") or []:
+                content = (choice.get("message") or {}).get("content")
+                if content:
+                    samples.append((content, None))
+    return samples
+
+
+def _is_outermost(result: Any, keys: Optional[List[str]]) -> bool:
+    if keys is None:
+        return True
+    return isinstance(result, dict) and all(key in result for key in keys)
+
+
+def run_benchmark(samples: List[Tuple[str, Optional[List[str]]]], repeat: int = 200) -> Dict[str, Dict[str, float]]:
+    """对每个实现重复解析全部样本，返回平均单样本耗时(微秒)、提取到结果的样本数与结构正确的样本数"""
+    impls: Dict[str, Callable[[str], Any]] = {
+        "regex_cascade": legacy_extract_json_from_markdown,
+        "single_pass": extract_json_from_markdown,
+        "single_pass_repair": partial(extract_json_from_markdown, allow_truncated=True),
+    }
+    results = {}
+    for name, fn in impls.items():
+        outputs = [fn(text) for text, _ in samples]
+        extracted = sum(1 for output in outputs if output is not None)
+        correct = sum(1 for output, (_, keys) in zip(outputs, samples) if _is_outermost(output, keys))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for text, _ in samples:
+                fn(text)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "us_per_sample": elapsed / (repeat * len(samples)) * 1e6,
+            "extracted": extracted,
+            "correct": correct,
+            "samples": len(samples),
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="extract_json_from_markdown 微基准")
+    parser.add_argument("--cassette", help="读取 cassette 录制文件中的真实响应作为样本")
+    parser.add_argument("--repeat", type=int, default=200, help="重复次数")
+    parser.add_argument("--pathological-repeat", type=int, default=1, help="病态样本的重复次数，0 表示跳过")
+    args = parser.parse_args(argv)
+
+    samples = cassette_samples(args.cassette) if args.cassette else builtin_samples()
+    if not samples:
+        sys.exit("没有可用的样本")
+    groups = [("典型样本", samples, args.repeat)]
+    if args.pathological_repeat > 0:
+        groups.append(("病态样本", pathological_samples(), args.pathological_repeat))
+    for title, group, repeat in groups:
+        print(title)
+        for name, result in run_benchmark(group, repeat).items():
+            print(f"{name:>18}: {result['us_per_sample']:12.1f} us/样本, 提取到结果 {result['extracted']}/{result['samples']}, "
+                  f"结构正确 {result['correct']}/{result['samples']}")
+
+
+if __name__ == "__main__":
+    main()
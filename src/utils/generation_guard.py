@@ -0,0 +1,169 @@
+"""
+失控生成防护模块
+
+OutputBudgets 按调用阶段标签统计历史输出 token 数，用高分位数乘以余量作为该阶段的
+max_tokens，避免个别调用无休止地输出并长时间占用并发槽位；历史可保存到文件供下次运行使用。
+RepetitionDetector 在流式输出时检测尾部的循环重复 (如反复输出同一段关键词列表)，
+供调用方提前截断。
+"""
+import os
+import json
+import math
+import threading
+import collections
+from typing import Any, Dict, Optional
+
+from src.utils.concurrency import percentile
+
+
+class OutputBudgets:
+    """按标签学习的输出 token 上限，线程安全"""
+
+    def __init__(self,
+                 quantile: float = 0.99,
+                 headroom: float = 1.5,
+                 min_samples: int = 20,
+                 window_size: int = 500,
+                 floor: int = 256,
+                 ceiling: int = 8192,
+                 step: int = 256):
+        """
+        Args:
+            quantile: 参考的历史输出长度分位数
+            headroom: 在分位数基础上放宽的倍数
+            min_samples: 样本数不足时不设上限
+            window_size: 每个标签保留的样本数
+            floor: 上限的下界
+            ceiling: 上限的上界
+            step: 上限向上取整的步长，减少上限变化导致的缓存键变化
+        """
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.floor = floor
+        self.ceiling = ceiling
+        self.step = step
+        self._samples: Dict[str, collections.deque] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, label: str) -> Dict[str, int]:
+        return self.stats.setdefault(label, {"observed": 0, "capped": 0, "truncated": 0})
+
+    def observe(self, label: Optional[str], completion_tokens: int, truncated: bool = False) -> None:
+        """记录一次调用的输出 token 数
+
+        Args:
+            label: 调用阶段标签，未指定时不记录
+            completion_tokens: 输出 token 数
+            truncated: 是否因达到 max_tokens 被截断 (截断的样本只说明上限偏紧，不计入分布)
+        """
+        if not label:
+            return
+        with self._lock:
+            entry = self._entry(label)
+            if truncated:
+                entry["truncated"] += 1
+                return
+            entry["observed"] += 1
+            samples = self._samples.get(label)
+            if samples is None:
+                samples = self._samples[label] = collections.deque(maxlen=self.window_size)
+            samples.append(completion_tokens)
+
+    def _limit(self, label: str) -> Optional[int]:
+        samples = self._samples.get(label)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        limit = percentile(list(samples), self.quantile) * self.headroom
+        limit = int(math.ceil(limit / self.step) * self.step)
+        return max(self.floor, min(self.ceiling, limit))
+
+    def max_tokens_for(self, label: Optional[str]) -> Optional[int]:
+        """返回该标签当前的输出上限并计入一次限制，样本不足时返回 None"""
+        if not label:
+            return None
+        with self._lock:
+            limit = self._limit(label)
+            if limit is not None:
+                self._entry(label)["capped"] += 1
+        return limit
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各标签的样本数、当前上限及被截断次数"""
+        with self._lock:
+            return {label: {**entry, "max_tokens": self._limit(label)} for label, entry in self.stats.items()}
+
+    def save(self, path: str) -> None:
+        """保存各标签的历史样本"""
+        with self._lock:
+            data = {label: list(samples) for label, samples in self._samples.items()}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def load(self, path: str) -> None:
+        """加载 save 保存的历史样本，文件不存在时忽略"""
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            for label, values in data.items():
+                samples = self._samples.setdefault(label, collections.deque(maxlen=self.window_size))
+                samples.extend(int(v) for v in values)
+
+
+class RepetitionDetector:
+    """检测流式输出尾部的循环重复
+
+    每新增 check_interval 个字符检查一次：尾部存在某个长度在 [min_period, max_period]
+    之间的片段连续重复 min_repeats 次以上，且重复部分不少于 min_span 个字符时判定为循环。
+    """
+
+    def __init__(self,
+                 min_period: int = 8,
+                 max_period: int = 400,
+                 min_repeats: int = 4,
+                 min_span: int = 200,
+                 check_interval: int = 64):
+        self.min_period = min_period
+        self.max_period = max_period
+        self.min_repeats = min_repeats
+        self.min_span = min_span
+        self.check_interval = check_interval
+        self.tail = ""
+        self.reason: Optional[str] = None
+        self._since_check = 0
+        self._keep = max_period * max(min_repeats, math.ceil(min_span / max(min_period, 1)) + 1)
+
+    def feed(self, text: str) -> bool:
+        """喂入新输出，检测到循环时返回 True (之后一直返回 True)"""
+        if self.reason is not None:
+            return True
+        if not text:
+            return False
+        self.tail = (self.tail + text)[-self._keep:]
+        self._since_check += len(text)
+        if self._since_check < self.check_interval:
+            return False
+        self._since_check = 0
+        return self._check()
+
+    def _check(self) -> bool:
+        tail = self.tail
+        for period in range(self.min_period, min(self.max_period, len(tail) // self.min_repeats) + 1):
+            repeats = max(self.min_repeats, math.ceil(self.min_span / period))
+            span = period * repeats
+            if span > len(tail):
+                continue
+            unit = tail[-period:]
+            if tail[-2 * period:-period] != unit:
+                continue
+            if tail[-span:] == unit * repeats and unit.strip():
+                self.reason = f"输出末尾 {span} 个字符为长度 {period} 的片段重复 {repeats} 次"
+                return True
+        return False
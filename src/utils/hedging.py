@@ -0,0 +1,96 @@
+"""
+对冲请求 (hedged requests) 策略模块
+
+按调用类别 (通常为调用阶段标签) 统计延迟分布；一次请求运行超过该类别观测到的 p95 时，
+允许再发出一个相同的请求，先返回者胜出、另一个被取消。对冲请求数占总请求数的比例受
+max_hedge_rate 限制，以控制额外成本。本模块只负责决策与统计，请求的发送由 src.llm 完成。
+"""
+import threading
+import collections
+from typing import Any, Dict, Optional
+
+from src.utils.concurrency import percentile
+
+
+class HedgePolicy:
+    """对冲决策与胜负统计，线程安全"""
+
+    def __init__(self,
+                 quantile: float = 0.95,
+                 max_hedge_rate: float = 0.05,
+                 min_samples: int = 20,
+                 window_size: int = 200,
+                 min_delay: float = 0.05):
+        """
+        Args:
+            quantile: 触发对冲的延迟分位数
+            max_hedge_rate: 对冲请求数占总请求数的上限
+            min_samples: 某类别样本数不足时不对冲
+            window_size: 每个类别保留的延迟样本数
+            min_delay: 对冲等待时间下限(秒)
+        """
+        self.quantile = quantile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.min_delay = min_delay
+        self._latencies: Dict[str, collections.deque] = {}
+        self._class_stats: Dict[str, Dict[str, int]] = {}
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "rate_capped": 0}
+        self._lock = threading.Lock()
+
+    def _entry(self, call_class: str) -> Dict[str, int]:
+        return self._class_stats.setdefault(call_class, {"requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0})
+
+    def start(self, call_class: str) -> Optional[float]:
+        """登记一次请求，返回等待多久后应考虑对冲；样本不足时返回 None"""
+        with self._lock:
+            self.stats["requests"] += 1
+            self._entry(call_class)["requests"] += 1
+            samples = self._latencies.get(call_class)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            return max(self.min_delay, percentile(list(samples), self.quantile))
+
+    def try_hedge(self, call_class: str) -> bool:
+        """请求超过等待时间后调用；未超出对冲比例上限时计入一次对冲并返回 True"""
+        with self._lock:
+            if self.stats["hedged"] + 1 > self.max_hedge_rate * self.stats["requests"]:
+                self.stats["rate_capped"] += 1
+                return False
+            self.stats["hedged"] += 1
+            self._entry(call_class)["hedged"] += 1
+            return True
+
+    def observe(self, call_class: str, latency: float, winner: Optional[str] = None) -> None:
+        """记录一次成功请求的耗时 (从首个请求发出起算)
+
+        Args:
+            call_class: 调用类别
+            latency: 调用方实际等待的耗时(秒)
+            winner: 发生对冲时的胜出方，"primary" 或 "hedge"
+        """
+        with self._lock:
+            samples = self._latencies.get(call_class)
+            if samples is None:
+                samples = self._latencies[call_class] = collections.deque(maxlen=self.window_size)
+            samples.append(latency)
+            if winner:
+                key = "hedge_wins" if winner == "hedge" else "primary_wins"
+                self.stats[key] += 1
+                self._entry(call_class)[key] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回总体及各类别的对冲比例、胜负次数与当前对冲阈值"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.stats)
+            stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0.0
+            classes = {}
+            for call_class, entry in self._class_stats.items():
+                samples = list(self._latencies.get(call_class, ()))
+                classes[call_class] = {
+                    **entry,
+                    "threshold": percentile(samples, self.quantile) if len(samples) >= self.min_samples else None,
+                }
+            stats["classes"] = classes
+        return stats
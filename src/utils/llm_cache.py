@@ -0,0 +1,161 @@
+"""
+LLM 响应缓存模块
+
+以请求内容的哈希为键，将 chat.completions 的完整响应持久化到本地 SQLite，
+支持按条目数 (LRU) 与存活时间 (TTL) 淘汰，用于避免对相同提示词重复付费。
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+# 不参与缓存键计算的请求参数
+_NON_KEY_PARAMS = {"stream", "timeout", "extra_headers", "extra_query", "extra_body"}
+
+
+def make_cache_key(request_params: Dict[str, Any]) -> str:
+    """根据已解析的模型 ID、消息、工具、response_format 及采样参数计算缓存键
+
+    Args:
+        request_params: 传给 chat.completions.create 的完整请求参数
+
+    Returns:
+        str: sha256 十六进制摘要
+    """
+    key_params = {k: v for k, v in request_params.items() if k not in _NON_KEY_PARAMS}
+    canonical = json.dumps(key_params, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic_request(request_params: Dict[str, Any]) -> bool:
+    """非流式且未显式指定 temperature > 0 的请求视为确定性请求"""
+    if request_params.get("stream"):
+        return False
+    temperature = request_params.get("temperature")
+    return temperature is None or temperature <= 0
+
+
+class LLMCache:
+    """基于 SQLite 的内容寻址 LLM 响应缓存
+
+    线程安全；命中时刷新访问时间，写入后按 max_entries 淘汰最久未访问的条目，
+    超过 ttl_seconds 的条目在读取或写入时清理。
+    """
+
+    def __init__(self,
+                 path: str = os.path.join("data", "llm_cache.sqlite"),
+                 max_entries: int = 100000,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 allow_sampling: bool = False):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite 文件路径
+            max_entries: 最大缓存条目数，超过后按 LRU 淘汰
+            ttl_seconds: 条目最长存活时间(秒)，None 表示不过期
+            allow_sampling: 是否缓存 temperature > 0 的请求 (默认跳过)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.allow_sampling = allow_sampling
+        self.stats = {"hits": 0, "misses": 0, "skipped": 0, "writes": 0, "evictions": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+        self._conn.commit()
+
+    def is_cacheable(self, request_params: Dict[str, Any]) -> bool:
+        """判断请求是否允许缓存
+
+        流式请求不缓存；显式指定 temperature > 0 的请求仅在 allow_sampling 时缓存。
+        未指定 temperature 的请求视为可缓存。
+        """
+        if request_params.get("stream"):
+            return False
+        return self.allow_sampling or is_deterministic_request(request_params)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的响应，未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["evictions"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, response: Dict[str, Any], model: Optional[str] = None) -> None:
+        """写入响应并执行淘汰"""
+        now = time.time()
+        payload = json.dumps(response, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, payload, now, now)
+            )
+            self.stats["writes"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def record_skip(self) -> None:
+        """记录一次因不可缓存而跳过的请求"""
+        with self._lock:
+            self.stats["skipped"] += 1
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.stats["evictions"] += max(cursor.rowcount, 0)
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.stats["evictions"] += max(cursor.rowcount, 0)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回命中统计，包含命中率"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
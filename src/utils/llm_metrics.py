@@ -0,0 +1,162 @@
+"""
+LLM 调用计量模块
+
+记录每次 LLM 调用的提示词/输出 token、延迟、模型、重试次数、来源 (接口/回放/批处理/缓存/合并)
+及提前中止原因，
+并按调用方提供的阶段标签 (如 atomic.brand_mentions、report.executive_summary) 汇总。
+记录会写入进程级 usage_tracker，以及当前上下文中通过 track_usage 激活的追踪器。
+"""
+import time
+import threading
+import contextlib
+import contextvars
+from typing import Any, Dict, Iterator, List, Optional
+
+# 当前上下文中激活的追踪器 (可嵌套)
+_active_trackers: contextvars.ContextVar = contextvars.ContextVar("llm_active_usage_trackers", default=())
+
+DEFAULT_LABEL = "unlabeled"
+
+
+class UsageTracker:
+    """线程安全的 LLM 调用记录集合，支持按阶段标签汇总"""
+
+    def __init__(self, max_records: Optional[int] = None):
+        """
+        Args:
+            max_records: 最多保留的记录数，None 表示不限制 (进程级追踪器需要设置上限)
+        """
+        self.max_records = max_records
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(record)
+            if self.max_records is not None and len(self.records) > self.max_records:
+                del self.records[:len(self.records) - self.max_records]
+
+    def summary_by_label(self) -> Dict[str, Dict[str, Any]]:
+        """按标签汇总调用次数、token、延迟、重试、缓存命中、错误与中止"""
+        with self._lock:
+            records = list(self.records)
+        summary: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            entry = summary.setdefault(record["label"], {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+                "latency": 0.0, "max_latency": 0.0, "retries": 0, "cache_hits": 0, "errors": 0,
+                "aborted": 0, "models": set(),
+            })
+            entry["calls"] += 1
+            entry["prompt_tokens"] += record["prompt_tokens"]
+            entry["completion_tokens"] += record["completion_tokens"]
+            entry["total_tokens"] += record["prompt_tokens"] + record["completion_tokens"]
+            entry["latency"] += record["latency"]
+            entry["max_latency"] = max(entry["max_latency"], record["latency"])
+            # retries 为该次尝试之前的重试次数，>0 即表示这是一次重试
+            entry["retries"] += 1 if record["retries"] else 0
+            entry["cache_hits"] += 1 if record["source"] in ("cache", "coalesced") else 0
+            entry["errors"] += 1 if record["error"] else 0
+            entry["aborted"] += 1 if record.get("aborted") else 0
+            entry["models"].add(record["model"])
+        for entry in summary.values():
+            entry["avg_latency"] = entry["latency"] / entry["calls"] if entry["calls"] else 0.0
+            entry["models"] = sorted(entry["models"])
+        return summary
+
+    def totals(self) -> Dict[str, Any]:
+        """所有记录的合计，适合放入运行摘要"""
+        totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+                  "latency": 0.0, "retries": 0, "cache_hits": 0, "errors": 0, "aborted": 0}
+        for entry in self.summary_by_label().values():
+            for key in totals:
+                totals[key] += entry[key]
+        totals["latency"] = round(totals["latency"], 2)
+        return totals
+
+    def format_table(self) -> str:
+        """生成 Markdown 格式的分阶段成本与延迟表"""
+        summary = self.summary_by_label()
+        if not summary:
+            return ""
+        lines = [
+            "| 阶段 | 调用数 | 输入tokens | 输出tokens | 总tokens | 累计耗时(秒) | 平均耗时(秒) | 最大耗时(秒) | 重试 | 缓存命中 | 错误 | 中止 |",
+            "|---|---|---|---|---|---|---|---|---|---|---|---|",
+        ]
+        for label, entry in sorted(summary.items(), key=lambda x: x[1]["total_tokens"], reverse=True):
+            lines.append(
+                f"| {label} | {entry['calls']} | {entry['prompt_tokens']} | {entry['completion_tokens']} | "
+                f"{entry['total_tokens']} | {entry['latency']:.2f} | {entry['avg_latency']:.2f} | "
+                f"{entry['max_latency']:.2f} | {entry['retries']} | {entry['cache_hits']} | {entry['errors']} | {entry['aborted']} |"
+            )
+        totals = self.totals()
+        lines.append(
+            f"| **合计** | {totals['calls']} | {totals['prompt_tokens']} | {totals['completion_tokens']} | "
+            f"{totals['total_tokens']} | {totals['latency']:.2f} | - | - | {totals['retries']} | "
+            f"{totals['cache_hits']} | {totals['errors']} | {totals['aborted']} |"
+        )
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records.clear()
+
+
+# 进程级追踪器，保留最近的调用记录
+usage_tracker = UsageTracker(max_records=100000)
+
+
+@contextlib.contextmanager
+def track_usage(tracker: UsageTracker) -> Iterator[UsageTracker]:
+    """在当前上下文中激活追踪器，期间 (含 batch_generate 的工作线程) 的 LLM 调用都会记录到其中"""
+    token = _active_trackers.set(_active_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _active_trackers.reset(token)
+
+
+def record_llm_call(label: Optional[str],
+                    model: str,
+                    prompt_tokens: int = 0,
+                    completion_tokens: int = 0,
+                    latency: float = 0.0,
+                    retries: int = 0,
+                    source: str = "api",
+                    error: Optional[str] = None,
+                    estimated: bool = False,
+                    aborted: Optional[str] = None) -> Dict[str, Any]:
+    """记录一次 LLM 调用
+
+    Args:
+        label: 调用方提供的阶段标签
+        model: 实际使用的模型 ID
+        prompt_tokens: 提示词 token 数 (缓存命中或合并时为 0)
+        completion_tokens: 输出 token 数
+        latency: 调用耗时(秒)
+        retries: 重试次数
+        source: 结果来源，api / replay (cassette 回放) / batch (离线批处理) / cache / coalesced
+        error: 调用失败时的错误信息
+        estimated: token 数是否为估算值 (流式响应没有 usage)
+        aborted: 输出被提前中止的原因，max_tokens (达到输出上限) / repetition (重复循环)
+
+    Returns:
+        写入的记录
+    """
+    record = {
+        "time": time.time(),
+        "label": label or DEFAULT_LABEL,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency": latency,
+        "retries": retries,
+        "source": source,
+        "error": error,
+        "estimated": estimated,
+        "aborted": aborted,
+    }
+    usage_tracker.add(record)
+    for tracker in _active_trackers.get():
+        tracker.add(record)
+    return record
@@ -0,0 +1,548 @@
+"""
+离线 OpenAI 兼容桩服务
+
+在本地模拟方舟 chat.completions 接口，用于无网络环境下的压测与 CI：
+支持普通/流式响应、工具调用与 response_format，可配置延迟、吞吐上限、429/5xx 注入，
+并对 atomic_insights.py 与 analysis_tools.py 中的提示词返回基于规则的 JSON 答案。
+另外实现了 Files 与 Batches 接口 (批处理任务，见 src.utils.batch_job)，错误注入对批次中的每条请求生效。
+
+启动:
+    python -m src.utils.llm_stub_server --port 8008 --latency 0.3 --error-429-rate 0.02
+
+让 LLM 指向桩服务:
+    LLM_BASE_URL=http://127.0.0.1:8008/api/v3 ARK_API_KEY=stub python main.py
+"""
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import collections
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from src.utils.rate_limiter import estimate_text_tokens
+
+# 默认配置，可通过 create_stub_app(config) 或命令行参数覆盖
+DEFAULT_STUB_CONFIG: Dict[str, Any] = {
+    "latency": 0.2,             # 基础延迟(秒)
+    "latency_jitter": 0.1,      # 在基础延迟上叠加 [0, jitter) 的随机延迟
+    "tokens_per_second": 0.0,   # 输出速度，>0 时按输出 token 数追加延迟 (流式时分摊到每个分片)
+    "max_concurrency": 0,       # 同时处理的请求上限，超出的请求排队；0 表示不限制
+    "rpm": 0,                   # 每分钟请求上限，超出时返回 429；0 表示不限制
+    "error_429_rate": 0.0,      # 随机返回 429 的比例
+    "error_5xx_rate": 0.0,      # 随机返回 500/502/503 的比例
+    "tool_call_mode": "all",    # 带 tools 的请求: all 调用全部工具 / first 只调用第一个 / none 不调用
+    "stream_chunk_chars": 8,    # 流式响应每个分片的字符数
+    "canned": [],               # 预置答案 [{"pattern": 正则, "response": 字符串或 JSON 对象}]，优先于规则
+    "seed": None,               # 随机种子，便于复现错误注入
+    "batch_delay": 1.0,         # 批处理任务从提交到完成的耗时(秒)
+}
+
+# 规则答案识别的品牌词表
+KNOWN_BRANDS = [
+    "小米", "特斯拉", "比亚迪", "蔚来", "理想", "小鹏", "问界", "极氪", "华为", "零跑",
+    "保时捷", "宝马", "奔驰", "奥迪", "大众", "丰田", "智界", "阿维塔",
+]
+_POSITIVE_WORDS = ["好", "不错", "喜欢", "推荐", "满意", "流畅", "舒服", "值"]
+_NEGATIVE_WORDS = ["差", "贵", "失望", "问题", "慢", "吐槽", "后悔", "缺点"]
+_DIMENSIONS = ["续航", "智能驾驶", "外观设计", "内饰做工", "价格", "空间", "操控", "售后服务"]
+
+
+def _count_brands(text: str) -> Dict[str, int]:
+    counts = {brand: text.count(brand) for brand in KNOWN_BRANDS}
+    return {brand: count for brand, count in counts.items() if count}
+
+
+def _stable_score(*parts: str) -> int:
+    """按文本得到稳定的 1~5 分，保证相同输入得到相同答案"""
+    return sum(ord(ch) for ch in "".join(parts)) % 5 + 1
+
+
+def _sentiment(text: str) -> str:
+    positive = sum(text.count(word) for word in _POSITIVE_WORDS)
+    negative = sum(text.count(word) for word in _NEGATIVE_WORDS)
+    if positive > negative:
+        return "positive"
+    if negative > positive:
+        return "negative"
+    return "neutral"
+
+
+def _section(text: str, start: str, end: str) -> str:
+    """截取 start 与 end 之间的内容，找不到时返回原文"""
+    begin = text.find(start)
+    if begin < 0:
+        return text
+    begin += len(start)
+    finish = text.find(end, begin)
+    return text[begin:finish if finish >= 0 else len(text)]
+
+
+def _brand_list(prompt: str) -> List[str]:
+    match = re.search(r"品牌列表：(.*)", prompt)
+    brands = [b.strip() for b in match.group(1).split(",")] if match else []
+    return [b for b in brands if b] or ["品牌A", "品牌B"]
+
+
+# ---- atomic_insights.py 的提示词 ----
+
+def _answer_packed_brand_mentions(prompt: str) -> List[Dict[str, Any]]:
+    body = prompt.split("请输出JSON数组")[0]
+    parts = re.split(r"^\s*\[(\d+)\]\s*$", body, flags=re.M)
+    # re.split 结果: [前缀, 序号1, 内容1, 序号2, 内容2, ...]
+    return [{"index": int(parts[i]), "brands": _count_brands(parts[i + 1])} for i in range(1, len(parts) - 1, 2)]
+
+
+def _answer_brand_mentions(prompt: str) -> Dict[str, int]:
+    return _count_brands(_section(prompt, "品牌及其频次", "请输出JSON格式"))
+
+
+def _answer_user_competition(prompt: str) -> Dict[str, Any]:
+    return _competition_for(_section(prompt, "用户竞争情况", "请分析所有品牌"))
+
+
+def _competition_for(content: str) -> Dict[str, Any]:
+    brands = sorted(_count_brands(content), key=content.find)
+    pairs = []
+    for source, target in zip(brands, brands[1:]):
+        pairs.append({
+            "type": "流出" if _sentiment(content) == "negative" else "摇摆",
+            "source_brand": source,
+            "target_brand": target,
+            "evidence": content.strip(" ：:\n\t")[:60],
+        })
+    return {"brand_pairs": pairs, "reason": f"内容中共提及 {len(brands)} 个品牌"}
+
+
+def _answer_brand_analysis(prompt: str, brand: str) -> Dict[str, Any]:
+    return _brand_analysis_for(_section(prompt, "品牌的评价", "请输出JSON格式"), brand)
+
+
+def _brand_analysis_for(content: str, brand: str) -> Dict[str, Any]:
+    dims = [d for d in _DIMENSIONS if d in content] or _DIMENSIONS[:2]
+    return {
+        "sentiment": _sentiment(content),
+        "features": {dim: "用户评价较好" if _stable_score(brand, dim) >= 3 else "用户有所不满" for dim in dims},
+        "strengths": [{"feature": dim, "description": f"{brand}的{dim}受到认可"} for dim in dims if _stable_score(brand, dim) >= 3],
+        "weaknesses": [{"feature": dim, "description": f"{brand}的{dim}存在吐槽"} for dim in dims if _stable_score(brand, dim) < 3],
+    }
+
+
+def _answer_fused(prompt: str) -> Dict[str, Any]:
+    content = _section(prompt, "分析以下内容", "请完成三项分析")
+    mentions = _count_brands(content)
+    top_brands = sorted(mentions, key=mentions.get, reverse=True)[:5]
+    return {
+        "brand_mentions": mentions,
+        "user_competition": _competition_for(content),
+        "brand_analysis": {brand: _brand_analysis_for(content, brand) for brand in top_brands},
+    }
+
+
+# ---- analysis_tools.py 的提示词 ----
+
+def _answer_feature_dimensions(prompt: str) -> Dict[str, Any]:
+    dims = _DIMENSIONS[:8] if "8个" in prompt else _DIMENSIONS[:5]
+    brands = _brand_list(prompt)
+    return {"特征维度分析": {
+        "发现的维度": dims,
+        "品牌维度得分": [{"品牌": b, "各维度得分": [_stable_score(b, d) for d in dims]} for b in brands],
+        "维度用户原声": [{"维度": d, "原声": [f"{d}方面体验不错", f"{d}还有提升空间"]} for d in dims],
+    }}
+
+
+def _answer_keywords(prompt: str) -> Dict[str, Any]:
+    brands = _brand_list(prompt)
+    return {"关键词分析": [{
+        "品牌": b,
+        "正面关键词": [{"text": f"{w}{i}", "weight": 10 - i % 10} for i, w in enumerate(_POSITIVE_WORDS * 3)][:20],
+        "负面关键词": [{"text": f"{w}{i}", "weight": 10 - i % 10} for i, w in enumerate(_NEGATIVE_WORDS * 3)][:20],
+        "原声示例": [
+            {"关键词": _POSITIVE_WORDS[0], "情感": "正面", "原声": [f"{b}真的很{_POSITIVE_WORDS[0]}"]},
+            {"关键词": _NEGATIVE_WORDS[0], "情感": "负面", "原声": [f"{b}有点{_NEGATIVE_WORDS[1]}"]},
+        ],
+    } for b in brands]}
+
+
+def _answer_competitors(prompt: str) -> Dict[str, Any]:
+    brands = _brand_list(prompt)
+    return {"竞争关系分析": {
+        "主要品牌": brands[0],
+        "竞争格局": [{
+            "竞品": b,
+            "竞争类型": "直接竞争",
+            "用户摇摆证据": [f"在{brands[0]}和{b}之间犹豫"],
+            "用户流出证据": [f"最后还是选了{b}"],
+            "竞争优劣势": {"优势": ["智能化"], "劣势": ["交付周期"]},
+        } for b in brands[1:]],
+        "用户决策因素": ["价格", "续航", "智能驾驶"],
+    }}
+
+
+def _answer_overview(prompt: str) -> Dict[str, Any]:
+    return {"综合分析": [{
+        "品牌": b,
+        "主要关注点": _DIMENSIONS[:3],
+        "独特表达": ["遥遥领先", "真香"],
+        "用户原声": [f"{b}整体体验不错"],
+    } for b in _brand_list(prompt)]}
+
+
+def rule_based_answer(prompt: str) -> Optional[Any]:
+    """按提示词特征返回规则答案，无法识别时返回 None"""
+    if "请完成三项分析" in prompt and "brand_analysis" in prompt:
+        return _answer_fused(prompt)
+    if "条独立的内容" in prompt and "index" in prompt:
+        return _answer_packed_brand_mentions(prompt)
+    if "提到的品牌及其频次" in prompt:
+        return _answer_brand_mentions(prompt)
+    if "用户竞争情况" in prompt:
+        return _answer_user_competition(prompt)
+    match = re.search(r'关于"(.+?)"品牌的评价', prompt)
+    if match:
+        return _answer_brand_analysis(prompt, match.group(1))
+    if "特征维度分析" in prompt:
+        return _answer_feature_dimensions(prompt)
+    if "关键词分析" in prompt:
+        return _answer_keywords(prompt)
+    if "竞争关系分析" in prompt:
+        return _answer_competitors(prompt)
+    if "综合分析" in prompt:
+        return _answer_overview(prompt)
+    if "content字段" in prompt:
+        return {"content": "离线桩服务生成的数据洞察。"}
+    return None
+
+
+def _schema_example(schema: Dict[str, Any]) -> Any:
+    """按 JSON Schema 生成最小示例值，用于工具调用参数"""
+    schema_type = schema.get("type")
+    if "enum" in schema:
+        return schema["enum"][0]
+    if schema_type == "object":
+        properties = schema.get("properties", {})
+        required = schema.get("required", list(properties))
+        return {name: _schema_example(properties[name]) for name in required if name in properties}
+    if schema_type == "array":
+        return [_schema_example(schema.get("items", {}))] if schema.get("items") else []
+    return {"string": "stub", "integer": 1, "number": 1.0, "boolean": True}.get(schema_type)
+
+
+class StubState:
+    """桩服务的配置、限流状态与统计"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULT_STUB_CONFIG, **(config or {})}
+        self.random = random.Random(self.config["seed"])
+        self.canned = [(re.compile(item["pattern"]), item["response"]) for item in self.config["canned"]]
+        self.semaphore = asyncio.Semaphore(self.config["max_concurrency"]) if self.config["max_concurrency"] else None
+        self.request_times: collections.deque = collections.deque()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"requests": 0, "streamed": 0, "tool_calls": 0, "rule_answers": 0, "canned_answers": 0,
+                      "rate_limited": 0, "injected_429": 0, "injected_5xx": 0, "batches": 0, "batch_requests": 0}
+
+    def injected_error(self) -> Optional[JSONResponse]:
+        """按 rpm 与错误注入比例决定是否返回错误"""
+        now = time.monotonic()
+        rpm = self.config["rpm"]
+        if rpm:
+            while self.request_times and now - self.request_times[0] > 60:
+                self.request_times.popleft()
+            if len(self.request_times) >= rpm:
+                self.stats["rate_limited"] += 1
+                return _error_response(429, "rate_limit_exceeded", "stub rpm limit exceeded")
+            self.request_times.append(now)
+        return self.random_error()
+
+    def random_error(self) -> Optional[JSONResponse]:
+        """按错误注入比例决定是否返回错误 (不受 rpm 限制)"""
+        roll = self.random.random()
+        if roll < self.config["error_429_rate"]:
+            self.stats["injected_429"] += 1
+            return _error_response(429, "rate_limit_exceeded", "injected 429")
+        if roll < self.config["error_429_rate"] + self.config["error_5xx_rate"]:
+            self.stats["injected_5xx"] += 1
+            return _error_response(self.random.choice([500, 502, 503]), "server_error", "injected 5xx")
+        return None
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        self.files[file_id] = {
+            "meta": {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                     "filename": filename, "purpose": purpose, "status": "processed"},
+            "content": content,
+        }
+        return self.files[file_id]["meta"]
+
+    def base_latency(self) -> float:
+        return self.config["latency"] + self.random.random() * self.config["latency_jitter"]
+
+    def output_latency(self, completion_tokens: int) -> float:
+        speed = self.config["tokens_per_second"]
+        return completion_tokens / speed if speed > 0 else 0.0
+
+    def answer(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """生成 assistant 消息 (content 或 tool_calls)"""
+        messages = body.get("messages", [])
+        prompt = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        tools = body.get("tools") or []
+        tool_choice = body.get("tool_choice", "auto")
+        mode = self.config["tool_call_mode"]
+
+        if tools and tool_choice != "none" and mode != "none":
+            if isinstance(tool_choice, dict):
+                name = tool_choice.get("function", {}).get("name")
+                selected = [t for t in tools if t.get("function", {}).get("name") == name]
+            else:
+                selected = tools if mode == "all" else tools[:1]
+            self.stats["tool_calls"] += 1
+            return {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": tool["function"]["name"],
+                    "arguments": json.dumps(_schema_example(tool["function"].get("parameters", {})), ensure_ascii=False),
+                },
+            } for tool in selected]}
+
+        for pattern, response in self.canned:
+            if pattern.search(prompt):
+                self.stats["canned_answers"] += 1
+                content = response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+                return {"role": "assistant", "content": content}
+
+        answer = rule_based_answer(prompt)
+        if answer is not None:
+            self.stats["rule_answers"] += 1
+            return {"role": "assistant", "content": json.dumps(answer, ensure_ascii=False)}
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return {"role": "assistant", "content": json.dumps({"content": "离线桩服务的模拟回复。"}, ensure_ascii=False)}
+        return {"role": "assistant", "content": "这是离线桩服务的模拟回复。"}
+
+
+def _error_response(status: int, code: str, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"error": {"message": message, "type": code, "code": code}})
+
+
+def _parse_multipart(content_type: str, payload: bytes) -> Dict[str, Any]:
+    """解析 multipart/form-data 请求体 (避免依赖 python-multipart)，文件字段返回 (文件名, 内容)"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + payload)
+    fields: Dict[str, Any] = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        data = part.get_payload(decode=True) or b""
+        filename = part.get_filename()
+        fields[name] = (filename, data) if filename else data.decode("utf-8")
+    return fields
+
+
+def _usage(body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, int]:
+    prompt_tokens = sum(estimate_text_tokens(m.get("content") or "") + 4 for m in body.get("messages", []))
+    output = message.get("content") or json.dumps(message.get("tool_calls") or [], ensure_ascii=False)
+    completion_tokens = estimate_text_tokens(output)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def create_stub_app(config: Optional[Dict[str, Any]] = None) -> FastAPI:
+    """创建桩服务应用
+
+    Args:
+        config: 覆盖 DEFAULT_STUB_CONFIG 的配置项
+
+    Returns:
+        FastAPI: 可用 uvicorn 运行的应用，app.state.stub 为 StubState
+    """
+    app = FastAPI(title="LLM Stub Server")
+    state = StubState(config)
+    app.state.stub = state
+
+    async def _stream(body: Dict[str, Any], message: Dict[str, Any], completion_id: str, created: int):
+        model = body.get("model", "stub")
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        if message.get("tool_calls"):
+            calls = [{**call, "index": i} for i, call in enumerate(message["tool_calls"])]
+            yield chunk({"tool_calls": calls})
+            finish_reason = "tool_calls"
+        else:
+            content = message["content"]
+            size = max(1, state.config["stream_chunk_chars"])
+            pieces = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+            delay = state.output_latency(estimate_text_tokens(content)) / len(pieces)
+            for piece in pieces:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield chunk({"content": piece})
+            finish_reason = "stop"
+        yield chunk({}, finish_reason)
+        yield "data: [DONE]\n\n"
+
+    async def _handle(body: Dict[str, Any]):
+        state.stats["requests"] += 1
+        error = state.injected_error()
+        if error is not None:
+            return error
+
+        await asyncio.sleep(state.base_latency())
+        message = state.answer(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        if body.get("stream"):
+            state.stats["streamed"] += 1
+            return StreamingResponse(_stream(body, message, completion_id, created), media_type="text/event-stream")
+
+        usage = _usage(body, message)
+        await asyncio.sleep(state.output_latency(usage["completion_tokens"]))
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": usage,
+        })
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if state.semaphore is None:
+            return await _handle(body)
+        async with state.semaphore:
+            # 流式响应在返回后继续输出，吞吐上限只约束首包前的处理
+            return await _handle(body)
+
+    def _completion_body(body: Dict[str, Any]) -> Dict[str, Any]:
+        message = state.answer(body)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:16]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": _usage(body, message),
+        }
+
+    async def _process_batch(batch: Dict[str, Any]) -> None:
+        """逐条处理批次中的请求，成功与失败的结果分别写入输出文件与错误文件"""
+        await asyncio.sleep(state.config["batch_delay"] / 2)
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = int(time.time())
+        lines = state.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        outputs, errors = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            state.stats["batch_requests"] += 1
+            record = {"id": f"batch_req_{uuid.uuid4().hex[:16]}", "custom_id": request["custom_id"], "error": None}
+            error = state.random_error()
+            if error is not None:
+                record["response"] = {"status_code": error.status_code, "body": json.loads(error.body)}
+                errors.append(record)
+            else:
+                record["response"] = {"status_code": 200, "body": _completion_body(request["body"])}
+                outputs.append(record)
+        await asyncio.sleep(state.config["batch_delay"] / 2)
+        for key, records in (("output_file_id", outputs), ("error_file_id", errors)):
+            if records:
+                content = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+                batch[key] = state.add_file(f"{batch['id']}-{key}.jsonl", "batch_output", content)["id"]
+        batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    async def upload_file(request: Request):
+        fields = _parse_multipart(request.headers.get("content-type", ""), await request.body())
+        filename, content = fields.get("file") or ("upload.jsonl", b"")
+        return state.add_file(filename, fields.get("purpose", "batch"), content)
+
+    async def file_content(file_id: str, prefix: str = ""):
+        if file_id not in state.files:
+            return _error_response(404, "not_found", f"file {file_id} not found")
+        return PlainTextResponse(state.files[file_id]["content"].decode("utf-8"))
+
+    async def create_batch(request: Request):
+        body = await request.json()
+        if body.get("input_file_id") not in state.files:
+            return _error_response(400, "invalid_request", "input_file_id not found")
+        state.stats["batches"] += 1
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:16]}",
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        state.batches[batch["id"]] = batch
+        asyncio.get_running_loop().create_task(_process_batch(batch))
+        return batch
+
+    async def retrieve_batch(batch_id: str, prefix: str = ""):
+        if batch_id not in state.batches:
+            return _error_response(404, "not_found", f"batch {batch_id} not found")
+        return state.batches[batch_id]
+
+    # 兼容 /v1、/api/v3、/api/v3/bots 等任意前缀
+    for route_prefix in ("", "/{prefix:path}"):
+        app.add_api_route(f"{route_prefix}/chat/completions", chat_completions, methods=["POST"])
+        app.add_api_route(f"{route_prefix}/files", upload_file, methods=["POST"])
+        app.add_api_route(f"{route_prefix}/files/{{file_id}}/content", file_content, methods=["GET"])
+        app.add_api_route(f"{route_prefix}/batches", create_batch, methods=["POST"])
+        app.add_api_route(f"{route_prefix}/batches/{{batch_id}}", retrieve_batch, methods=["GET"])
+
+    @app.get("/stats")
+    async def stats():
+        return state.stats
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="离线 OpenAI 兼容 LLM 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--latency", type=float, default=DEFAULT_STUB_CONFIG["latency"])
+    parser.add_argument("--latency-jitter", type=float, default=DEFAULT_STUB_CONFIG["latency_jitter"])
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_STUB_CONFIG["tokens_per_second"])
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_STUB_CONFIG["max_concurrency"])
+    parser.add_argument("--rpm", type=int, default=DEFAULT_STUB_CONFIG["rpm"])
+    parser.add_argument("--error-429-rate", type=float, default=DEFAULT_STUB_CONFIG["error_429_rate"])
+    parser.add_argument("--error-5xx-rate", type=float, default=DEFAULT_STUB_CONFIG["error_5xx_rate"])
+    parser.add_argument("--tool-call-mode", choices=["all", "first", "none"], default=DEFAULT_STUB_CONFIG["tool_call_mode"])
+    parser.add_argument("--canned", help="预置答案 JSON 文件: [{\"pattern\": 正则, \"response\": 答案}]")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch-delay", type=float, default=DEFAULT_STUB_CONFIG["batch_delay"])
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key in DEFAULT_STUB_CONFIG and value is not None}
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as f:
+            config["canned"] = json.load(f)
+
+    import uvicorn
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@ import os
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 
+from src.utils.llm_metrics import UsageTracker, track_usage
+
 
 def create_output_directory(query: str) -> str:
     """创建输出目录
@@ -62,6 +64,8 @@ class ExecutionLogger:
         # 记录查询和开始时间
         self.query = query
         self.start_time = time.time()
+        # 本次执行的 LLM 调用计量，在 track_llm_usage 范围内的调用会记录到这里
+        self.llm_usage = UsageTracker()
         self._write_log(f"# Cotex搜索执行日志\n\n## 开始时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         self._write_log(f"\n## 查询内容\n```\n{query}\n```\n")
     
@@ -185,6 +189,20 @@ class ExecutionLogger:
         """
         self._write_log(f"[DEBUG] {debug_message}")
     
+    def track_llm_usage(self):
+        """
+        返回上下文管理器，范围内的 LLM 调用 (含 batch_generate 的工作线程) 计入本次执行的统计
+        
+        注意：不要在生成器的 yield 之间持有该上下文
+        """
+        return track_usage(self.llm_usage)
+    
+    def log_llm_usage(self) -> None:
+        """记录按阶段汇总的 LLM token 与耗时统计表"""
+        table = self.llm_usage.format_table()
+        if table:
+            self._write_log(f"\n## LLM 调用统计\n{table}\n")
+    
     def finalize(self) -> tuple:
         """
         完成日志记录，写入文件
@@ -192,6 +210,8 @@ class ExecutionLogger:
         Returns:
             tuple: (日志文件路径, 总耗时)
         """
+        self.log_llm_usage()
+        
         # 记录总耗时
         total_time = time.time() - self.start_time
         self._write_log(f"\n## 总计\n### 总耗时: {total_time:.2f}秒\n")
@@ -0,0 +1,190 @@
+"""
+按条目流水线执行模块
+
+把多阶段的批量处理组织成按条目推进的流水线：每个阶段有自己的工作线程与有界输入队列，
+某个条目在上游阶段的结果一出来就进入下游阶段，而不是等上游阶段处理完全部条目。
+总耗时接近最慢的单条处理链，而不是各阶段整体耗时之和；有界队列在下游变慢时
+反压上游，避免大量中间结果堆积。
+"""
+import time
+import queue
+import logging
+import threading
+import contextvars
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable[..., Any], workers: int, after: List[str],
+                 groups: Optional[List[List[int]]], queue_size: int):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.after = after
+        self.groups = groups
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.downstream: List["_Stage"] = []
+        self.done = 0
+        self.busy_time = 0.0
+        self.errors = 0
+
+
+class Pipeline:
+    """按条目推进的多阶段流水线，阶段之间构成有向无环图
+
+    每个阶段的处理函数为 fn(index, upstream)，upstream 为该条目在依赖阶段的结果
+    {阶段名: 结果}；处理函数抛出异常时该条目在此阶段的结果为 None，下游阶段照常处理。
+    """
+
+    def __init__(self, num_items: int, queue_size: int = 64):
+        """
+        Args:
+            num_items: 条目数，各阶段结果按条目序号返回
+            queue_size: 每个阶段输入队列的容量
+        """
+        self.num_items = num_items
+        self.queue_size = queue_size
+        self.stages: Dict[str, _Stage] = {}
+        self.results: Dict[str, List[Any]] = {}
+        self.errors: Dict[str, Dict[int, str]] = {}
+        self.stats: Dict[str, Any] = {}
+        self._pending: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, fn: Callable[..., Any], workers: int = 8, after: Optional[List[str]] = None,
+                  groups: Optional[List[List[int]]] = None) -> None:
+        """添加阶段
+
+        Args:
+            name: 阶段名
+            fn: 处理函数 fn(index, upstream)；指定 groups 时为 fn(group)，返回 {序号: 结果}
+            workers: 工作线程数
+            after: 依赖的阶段名，须先添加
+            groups: 仅用于没有依赖的阶段：把条目分组处理 (如多条内容打包进一个提示词)，
+                    组内某个条目的结果一出来就整组进入下游
+        """
+        after = list(after or [])
+        for dependency in after:
+            if dependency not in self.stages:
+                raise ValueError(f"阶段 {name} 依赖的阶段 {dependency} 不存在")
+        if groups is not None and after:
+            raise ValueError(f"阶段 {name} 有上游依赖，不能分组处理")
+        stage = _Stage(name, fn, max(1, workers), after, groups, self.queue_size)
+        for dependency in after:
+            self.stages[dependency].downstream.append(stage)
+        self.stages[name] = stage
+        self.results[name] = [None] * self.num_items
+        self.errors[name] = {}
+        self._pending[name] = [len(after)] * self.num_items
+
+    def run(self) -> Dict[str, List[Any]]:
+        """执行流水线，返回 {阶段名: 按条目序号排列的结果列表}，阶段耗时统计记录在 self.stats 中"""
+        start_time = time.time()
+        threads = []
+        for stage in self.stages.values():
+            for _ in range(stage.workers):
+                # 每个线程复制调用方的上下文，使 track_usage 等上下文状态在工作线程中生效
+                thread = threading.Thread(target=contextvars.copy_context().run, args=(self._work, stage),
+                                          name=f"pipeline-{stage.name}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        roots = [stage for stage in self.stages.values() if not stage.after]
+        if self.num_items == 0:
+            for stage in self.stages.values():
+                self._stop(stage)
+        for stage in roots:
+            units = stage.groups if stage.groups is not None else range(self.num_items)
+            feeder = threading.Thread(target=self._feed, args=(stage, list(units)), daemon=True)
+            feeder.start()
+            threads.append(feeder)
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.time() - start_time
+        self.stats = {
+            "items": self.num_items,
+            "elapsed": elapsed,
+            "stages": {name: {"workers": stage.workers, "busy_time": round(stage.busy_time, 2), "errors": stage.errors}
+                       for name, stage in self.stages.items()},
+        }
+        logger.info(f"流水线完成: {self.num_items} 条, 耗时 {elapsed:.2f}秒, "
+                    + ", ".join(f"{name} 累计 {s['busy_time']}秒/错误 {s['errors']}"
+                                for name, s in self.stats["stages"].items()))
+        return self.results
+
+    @staticmethod
+    def _feed(stage: _Stage, units: List[Any]) -> None:
+        for unit in units:
+            stage.queue.put(unit)
+
+    def _stop(self, stage: _Stage) -> None:
+        for _ in range(stage.workers):
+            stage.queue.put(_STOP)
+
+    def _work(self, stage: _Stage) -> None:
+        while True:
+            unit = stage.queue.get()
+            if unit is _STOP:
+                return
+            started = time.time()
+            indexes = list(unit) if stage.groups is not None else [unit]
+            outputs: Dict[int, Any] = {}
+            try:
+                if stage.groups is not None:
+                    outputs = self._call_group(stage, unit)
+                else:
+                    upstream = {dependency: self.results[dependency][unit] for dependency in stage.after}
+                    outputs = {unit: self._call(stage, unit, upstream)}
+            finally:
+                # 无论处理是否成功都把条目计为完成，否则 run() 会一直等待这些条目
+                with self._lock:
+                    stage.busy_time += time.time() - started
+                for index, result in outputs.items():
+                    self.results[stage.name][index] = result
+                self._advance(stage, indexes)
+
+    def _call(self, stage: _Stage, index: int, upstream: Dict[str, Any]) -> Any:
+        try:
+            return stage.fn(index, upstream)
+        except BaseException as e:
+            # 包括 SystemExit 等非 Exception 的异常：只让当前条目失败，工作线程继续处理后续条目
+            self._record_error(stage, index, e)
+            return None
+
+    def _call_group(self, stage: _Stage, group: List[int]) -> Dict[int, Any]:
+        try:
+            outputs = stage.fn(group) or {}
+        except BaseException as e:
+            for index in group:
+                self._record_error(stage, index, e)
+            outputs = {}
+        return {index: outputs.get(index) for index in group}
+
+    def _record_error(self, stage: _Stage, index: int, error: BaseException) -> None:
+        with self._lock:
+            stage.errors += 1
+            self.errors[stage.name][index] = str(error) or type(error).__name__
+        logger.warning(f"流水线阶段 {stage.name} 第 {index} 条失败: {error!r}")
+
+    def _advance(self, stage: _Stage, indexes: List[int]) -> None:
+        """条目完成当前阶段：依赖已全部完成的下游阶段接收该条目；本阶段全部完成时停止其工作线程"""
+        ready = []
+        with self._lock:
+            for downstream in stage.downstream:
+                pending = self._pending[downstream.name]
+                for index in indexes:
+                    pending[index] -= 1
+                    if pending[index] == 0:
+                        ready.append((downstream, index))
+            stage.done += len(indexes)
+            finished = stage.done == self.num_items
+        for downstream, index in ready:
+            # 队列满时阻塞，对本阶段形成反压
+            downstream.queue.put(index)
+        if finished:
+            self._stop(stage)
@@ -0,0 +1,211 @@
+"""
+帖子分析结果存储模块
+
+每天抓取的帖子大量重叠，把每条帖子的原子化分析结果按 (帖子 URL, 内容哈希, 版本标签)
+持久化到本地 SQLite：内容未变化的帖子直接复用已有结果，只有新帖子或内容有变化的帖子
+需要重新调用 LLM。版本标签由调用方根据模型与提示词生成，提示词变化后旧结果自动失效。
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# 单条 SQL 中 IN 列表的最多参数数
+_QUERY_CHUNK_SIZE = 500
+
+# 查询状态：命中、同一 URL 的内容有变化、内容未变但版本标签不同、从未分析过
+LOOKUP_STATUSES = ("hit", "changed", "outdated", "new")
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# 进入提示词的评论字段 (见 atomic_insights.build_post_content)
+_COMMENT_FIELDS = ("comment_user_nick", "comment_content", "comment_location", "comment_date")
+
+
+def comments_fingerprint(comments: Any) -> str:
+    """评论列表的指纹：取进入提示词的评论字段并排序；点赞数只影响评论顺序，不参与"""
+    if isinstance(comments, str):
+        return _digest(comments)
+    rows = sorted(tuple(str(c.get(field) or "") for field in _COMMENT_FIELDS)
+                  for c in (comments or []) if isinstance(c, dict))
+    return _digest(rows)
+
+
+def post_content_hash(item: Dict[str, Any]) -> str:
+    """帖子内容哈希，覆盖提示词用到的作者名、标题、正文与评论指纹"""
+    return _digest([item.get("author_name") or "", item.get("title") or "", item.get("detail_desc") or "",
+                    comments_fingerprint(item.get("comments_data"))])
+
+
+def post_store_key(item: Dict[str, Any], content_hash: str) -> str:
+    """帖子在存储中的键：有 URL 时为 URL，否则退化为内容哈希"""
+    url = item.get("url")
+    return str(url) if url else f"sha256:{content_hash}"
+
+
+class PostResultStore:
+    """基于 SQLite 的帖子分析结果存储，线程安全
+
+    同一帖子 (URL) 在同一版本标签下只保留最新内容的结果；命中时刷新访问时间，
+    超过 ttl_seconds 未被访问的条目在写入时清理。
+    """
+
+    def __init__(self,
+                 path: str = os.path.join("data", "post_results.sqlite"),
+                 ttl_seconds: Optional[float] = 30 * 24 * 3600):
+        """
+        Args:
+            path: SQLite 文件路径
+            ttl_seconds: 条目最长未访问时间(秒)，None 表示不过期
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"lookups": 0, "writes": 0, "evictions": 0, **{status: 0 for status in LOOKUP_STATUSES}}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS post_results ("
+            "key TEXT NOT NULL, version TEXT NOT NULL, content_hash TEXT NOT NULL, fields TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (key, version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_post_results_accessed ON post_results(accessed_at)")
+        self._conn.commit()
+
+    def lookup(self, entries: List[Tuple[str, str]], version: str) -> Tuple[List[Optional[Dict[str, Any]]], List[str]]:
+        """批量查询帖子的已有结果
+
+        Args:
+            entries: (键, 内容哈希) 列表
+            version: 版本标签
+
+        Returns:
+            (结果列表，未命中为 None；查询状态列表，取值见 LOOKUP_STATUSES)，均与 entries 顺序一致
+        """
+        keys = list({key for key, _ in entries})
+        rows: Dict[str, List[Tuple[str, str, str]]] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _QUERY_CHUNK_SIZE):
+                chunk = keys[i:i + _QUERY_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                for key, row_version, content_hash, fields in self._conn.execute(
+                        f"SELECT key, version, content_hash, fields FROM post_results WHERE key IN ({placeholders})",
+                        chunk):
+                    rows.setdefault(key, []).append((row_version, content_hash, fields))
+
+            results: List[Optional[Dict[str, Any]]] = []
+            statuses: List[str] = []
+            touched = []
+            for key, content_hash in entries:
+                candidates = rows.get(key, [])
+                current = [fields for row_version, row_hash, fields in candidates
+                           if row_version == version and row_hash == content_hash]
+                if current:
+                    results.append(json.loads(current[0]))
+                    statuses.append("hit")
+                    touched.append((now, key, version))
+                    continue
+                results.append(None)
+                if any(row_version == version for row_version, _, _ in candidates):
+                    statuses.append("changed")
+                elif any(row_hash == content_hash for _, row_hash, _ in candidates):
+                    statuses.append("outdated")
+                else:
+                    statuses.append("new")
+
+            if touched:
+                self._conn.executemany("UPDATE post_results SET accessed_at = ? WHERE key = ? AND version = ?", touched)
+                self._conn.commit()
+            self.stats["lookups"] += len(entries)
+            for status in statuses:
+                self.stats[status] += 1
+        return results, statuses
+
+    def put_many(self, entries: List[Tuple[str, str, Dict[str, Any]]], version: str) -> None:
+        """写入帖子结果，覆盖同一键在该版本下的旧结果并执行过期清理
+
+        Args:
+            entries: (键, 内容哈希, 结果字段) 列表
+            version: 版本标签
+        """
+        if not entries:
+            return
+        now = time.time()
+        rows = [(key, version, content_hash, json.dumps(fields, ensure_ascii=False), now, now)
+                for key, content_hash, fields in entries]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO post_results (key, version, content_hash, fields, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.stats["writes"] += len(rows)
+            if self.ttl_seconds is not None:
+                cursor = self._conn.execute("DELETE FROM post_results WHERE accessed_at < ?", (now - self.ttl_seconds,))
+                self.stats["evictions"] += max(cursor.rowcount, 0)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """清空存储"""
+        with self._lock:
+            self._conn.execute("DELETE FROM post_results")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回累计查询统计，包含复用率"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM post_results").fetchone()[0]
+        stats["reuse_ratio"] = stats["hit"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# 进程级结果存储，atomic_insights 未单独指定存储时使用；默认关闭
+_default_store: Optional[PostResultStore] = None
+
+
+def enable_post_result_store(path: Optional[str] = None, **store_options: Any) -> PostResultStore:
+    """开启进程级帖子分析结果存储
+
+    Args:
+        path: SQLite 文件路径，默认 data/post_results.sqlite
+        **store_options: 传给 PostResultStore 的其他参数 (ttl_seconds)
+
+    Returns:
+        PostResultStore: 启用的存储实例
+    """
+    global _default_store
+    if path:
+        store_options["path"] = path
+    _default_store = PostResultStore(**store_options)
+    return _default_store
+
+
+def disable_post_result_store() -> None:
+    """关闭进程级帖子分析结果存储"""
+    global _default_store
+    _default_store = None
+
+
+def get_post_result_store() -> Optional[PostResultStore]:
+    """返回当前的进程级帖子分析结果存储 (未开启时为 None)"""
+    return _default_store
+
+
+if os.environ.get("POST_RESULT_STORE_PATH"):
+    enable_post_result_store(os.environ["POST_RESULT_STORE_PATH"])
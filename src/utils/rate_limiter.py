@@ -0,0 +1,208 @@
+"""
+LLM 调用限流模块
+
+按模型维护每分钟请求数 (RPM) 与每分钟 token 数 (TPM) 两个令牌桶。调用前按估算 token 数
+预扣，调用后按实际 usage 修正；额度不足时按先来先到排队等待，而不是失败后盲目重试。
+同步调用 (多线程) 与异步调用共享同一队列。
+"""
+import time
+import asyncio
+import threading
+import collections
+from typing import Dict, Any, Optional
+
+
+def estimate_text_tokens(text: str) -> int:
+    """粗略估算文本 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uf900' <= ch <= '\ufaff')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_request_tokens(request_params: Dict[str, Any], default_completion_tokens: int = 512) -> int:
+    """估算一次请求消耗的总 token 数 (提示词 + 预计输出)"""
+    prompt_tokens = 0
+    for message in request_params.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            prompt_tokens += estimate_text_tokens(content) + 4
+    completion_tokens = request_params.get("max_tokens") or default_completion_tokens
+    return prompt_tokens + completion_tokens
+
+
+class _Bucket:
+    """按分钟额度匀速补充的令牌桶，余额允许因事后修正变为负数"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # 单次请求超过桶容量时按满桶放行，避免永远等待
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+
+class Reservation:
+    """一次已获准的调用，用于事后按实际 token 数修正"""
+
+    def __init__(self, model_id: str, estimated_tokens: int, waited: float):
+        self.model_id = model_id
+        self.estimated_tokens = estimated_tokens
+        self.waited = waited
+
+
+class ModelRateLimiter:
+    """单个模型的 RPM/TPM 限流器，请求按到达顺序获得额度"""
+
+    def __init__(self, model_id: str, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.model_id = model_id
+        self.requests = _Bucket(rpm) if rpm else None
+        self.tokens = _Bucket(tpm) if tpm else None
+        self._cond = threading.Condition()
+        self._queue: collections.deque = collections.deque()
+        self.stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "token_corrections": 0}
+
+    def _try_acquire(self, ticket: object, estimated_tokens: int) -> float:
+        """队首且额度充足时扣减并返回 0，否则返回建议等待的秒数 (需持有锁)"""
+        if self._queue[0] is not ticket:
+            return 0.05
+        now = time.monotonic()
+        wait = 0.0
+        if self.requests:
+            self.requests.refill(now)
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens:
+            self.tokens.refill(now)
+            wait = max(wait, self.tokens.wait_time(estimated_tokens))
+        if wait > 0:
+            return wait
+        if self.requests:
+            self.requests.tokens -= 1
+        if self.tokens:
+            self.tokens.tokens -= estimated_tokens
+        self._queue.popleft()
+        self._cond.notify_all()
+        return 0.0
+
+    def _record(self, waited: float) -> None:
+        self.stats["acquired"] += 1
+        if waited > 0.001:
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] += waited
+
+    def acquire(self, estimated_tokens: int) -> Reservation:
+        """阻塞直到获得一次调用额度"""
+        start = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    wait = self._try_acquire(ticket, estimated_tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(timeout=wait)
+            except BaseException:
+                # 等待被中断 (如 KeyboardInterrupt) 时让出队列位置，否则后续请求永远排在它后面
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+                raise
+            waited = time.monotonic() - start
+            self._record(waited)
+        return Reservation(self.model_id, estimated_tokens, waited)
+
+    async def acquire_async(self, estimated_tokens: int) -> Reservation:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        start = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(ticket, estimated_tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            raise
+        waited = time.monotonic() - start
+        with self._cond:
+            self._record(waited)
+        return Reservation(self.model_id, estimated_tokens, waited)
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int]) -> None:
+        """按实际 token 数修正预扣额度 (多退少补)"""
+        if self.tokens is None or actual_tokens is None:
+            return
+        with self._cond:
+            self.tokens.tokens += reservation.estimated_tokens - actual_tokens
+            self.stats["token_corrections"] += 1
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """进程级限流器，按模型 ID 分发到各自的 ModelRateLimiter；未配置的模型不限流"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, int]]] = None):
+        """
+        Args:
+            limits: {模型ID: {"rpm": 每分钟请求数, "tpm": 每分钟token数}}
+        """
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, ModelRateLimiter] = {}
+        for model_id, limit in (limits or {}).items():
+            self.configure(model_id, **limit)
+
+    def configure(self, model_id: str, rpm: Optional[int] = None, tpm: Optional[int] = None) -> None:
+        """设置或替换某个模型的额度；rpm 与 tpm 均为空时取消限流"""
+        with self._lock:
+            if rpm or tpm:
+                self._limiters[model_id] = ModelRateLimiter(model_id, rpm=rpm, tpm=tpm)
+            else:
+                self._limiters.pop(model_id, None)
+
+    def get(self, model_id: str) -> Optional[ModelRateLimiter]:
+        return self._limiters.get(model_id)
+
+    def acquire(self, model_id: str, estimated_tokens: int) -> Optional[Reservation]:
+        limiter = self.get(model_id)
+        return limiter.acquire(estimated_tokens) if limiter else None
+
+    async def acquire_async(self, model_id: str, estimated_tokens: int) -> Optional[Reservation]:
+        limiter = self.get(model_id)
+        return await limiter.acquire_async(estimated_tokens) if limiter else None
+
+    def settle(self, reservation: Optional[Reservation], actual_tokens: Optional[int]) -> None:
+        if reservation is None:
+            return
+        limiter = self.get(reservation.model_id)
+        if limiter:
+            limiter.settle(reservation, actual_tokens)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各模型的排队统计与当前余额"""
+        stats = {}
+        for model_id, limiter in list(self._limiters.items()):
+            with limiter._cond:
+                entry = dict(limiter.stats)
+                entry["queued"] = len(limiter._queue)
+                if limiter.requests:
+                    entry["rpm_available"] = round(limiter.requests.tokens, 1)
+                if limiter.tokens:
+                    entry["tpm_available"] = round(limiter.tokens.tokens, 1)
+            stats[model_id] = entry
+        return stats
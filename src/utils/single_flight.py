@@ -0,0 +1,118 @@
+"""
+请求合并 (single-flight) 工具模块
+
+同一个键的调用在执行期间只会真正发出一次，其余并发调用者等待并复用第一次调用的结果
+(或异常)。同步调用跨线程共享，异步调用在同一事件循环内共享。
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+# 领头的协程被取消时交给等待者的结果，表示需要重新发起
+_RETRY = object()
+
+
+class _Call:
+    """一次在途调用的共享状态"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """按键合并并发的相同请求"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.stats = {"executed": 0, "coalesced": 0, "retried": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """执行 fn；若相同 key 的调用正在进行，则等待其结果
+
+        Args:
+            key: 请求键 (通常为缓存键)
+            fn: 无参可调用对象，实际发出请求
+
+        Returns:
+            fn 的返回值 (可能来自其他线程的同一次调用)
+
+        Raises:
+            fn 抛出的异常会传递给所有等待者
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """do 的异步版本，在当前事件循环内合并相同 key 的协程调用
+
+        领头的协程被取消时不把取消传给等待者：等待者重新查看在途调用，第一个重试的成为新的领头。
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        while True:
+            future = self._async_calls.get(flight_key)
+            if future is None:
+                break
+            self.stats["coalesced"] += 1
+            # shield: 某个等待者被取消时不影响其他等待者
+            result = await asyncio.shield(future)
+            if result is not _RETRY:
+                return result
+            self.stats["coalesced"] -= 1
+            self.stats["retried"] += 1
+
+        future = loop.create_future()
+        self._async_calls[flight_key] = future
+        self.stats["executed"] += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 无其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._async_calls.get(flight_key) is future:
+                del self._async_calls[flight_key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回执行次数、被合并的次数与领头调用被取消后重试的次数"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        return stats
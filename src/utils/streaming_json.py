@@ -0,0 +1,145 @@
+"""
+增量 JSON 解析模块
+
+流式输出时逐块喂入文本，顶层为数组时每个元素闭合即产出 (序号, 元素)，
+顶层为对象时每个键的值闭合即产出 (键, 值)，下游可以在模型仍在输出时开始处理。
+输出明显不合法 (迟迟不出现 JSON、元素无法解析) 时抛出 StreamingJSONError，
+调用方据此提前中止请求。
+"""
+import json
+from typing import Any, List, Optional, Tuple, Union
+
+from src.utils.extract_markdown import extract_json_from_markdown
+
+
+class StreamingJSONError(ValueError):
+    """流式输出不是预期的 JSON"""
+
+
+class IncrementalJSONParser:
+    """顶层数组/对象的增量解析器
+
+    与 extract_json_from_markdown 一致：跳过 JSON 之前的说明文字或 ```json 标记，
+    忽略 // 注释与多余的逗号；顶层闭合后其余输出被忽略。
+    """
+
+    def __init__(self, max_preamble_chars: int = 500):
+        """
+        Args:
+            max_preamble_chars: JSON 开始之前允许的最多字符数，超过视为输出不合法
+        """
+        self.max_preamble_chars = max_preamble_chars
+        self.buffer = ""
+        self.container: Optional[str] = None  # "array" / "object"
+        self.done = False
+        self.count = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element_start = 0
+        self._element_emitted = False
+
+    def feed(self, text: str) -> List[Tuple[Union[int, str], Any]]:
+        """喂入一段输出，返回本次新闭合的 (序号或键, 值) 列表"""
+        if self.done or not text:
+            return []
+        self.buffer += text
+        if self.container is None and not self._find_start():
+            return []
+        return self._scan()
+
+    def close(self) -> List[Tuple[Union[int, str], Any]]:
+        """输出结束时调用；顶层仍未闭合 (或从未出现 JSON) 时抛出 StreamingJSONError"""
+        if self.done:
+            return []
+        if self.container is None:
+            raise StreamingJSONError(f"输出中没有 JSON: {self.buffer[:100]!r}")
+        raise StreamingJSONError(f"JSON 输出被截断，已解析 {self.count} 个元素")
+
+    def _find_start(self) -> bool:
+        starts = [i for i in (self.buffer.find("{"), self.buffer.find("[")) if i >= 0]
+        if not starts:
+            if len(self.buffer) > self.max_preamble_chars:
+                raise StreamingJSONError(f"前 {len(self.buffer)} 个字符中没有 JSON: {self.buffer[:100]!r}")
+            return False
+        start = min(starts)
+        if start > self.max_preamble_chars:
+            raise StreamingJSONError(f"JSON 之前有 {start} 个字符的说明文字")
+        self.container = "array" if self.buffer[start] == "[" else "object"
+        self._pos = start + 1
+        self._depth = 1
+        self._element_start = self._pos
+        return True
+
+    def _scan(self) -> List[Tuple[Union[int, str], Any]]:
+        events = []
+        buffer = self.buffer
+        i, n = self._pos, len(buffer)
+        while i < n:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "/":
+                if i + 1 >= n:
+                    break  # 等待下一块以判断是否为注释
+                if buffer[i + 1] == "/":
+                    newline = buffer.find("\n", i)
+                    if newline < 0:
+                        break
+                    # 把注释从缓冲区中去掉，避免进入元素文本
+                    buffer = self.buffer = buffer[:i] + buffer[newline:]
+                    n = len(buffer)
+                    continue
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and not self._element_emitted:
+                    # 嵌套的值闭合，立即产出
+                    events.extend(self._emit(buffer[self._element_start:i + 1]))
+                    self._element_emitted = True
+                elif self._depth == 0:
+                    if not self._element_emitted:
+                        events.extend(self._emit(buffer[self._element_start:i]))
+                    self.done = True
+                    i += 1
+                    break
+            elif ch == "," and self._depth == 1:
+                if not self._element_emitted:
+                    events.extend(self._emit(buffer[self._element_start:i]))
+                self._element_start = i + 1
+                self._element_emitted = False
+            i += 1
+        self._pos = i
+        return events
+
+    def _emit(self, fragment: str) -> List[Tuple[Union[int, str], Any]]:
+        fragment = fragment.strip()
+        if not fragment:
+            # 多余的逗号
+            return []
+        text = fragment if self.container == "array" else "{" + fragment + "}"
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            # 元素内部可能有多余的逗号或注释
+            value = extract_json_from_markdown(text) if text[0] in "{[" else None
+            if value is None:
+                raise StreamingJSONError(f"第 {self.count} 个元素无法解析 ({e}): {fragment[:100]!r}")
+        if self.container == "object":
+            if not isinstance(value, dict) or len(value) != 1:
+                raise StreamingJSONError(f"第 {self.count} 个键值对无法解析: {fragment[:100]!r}")
+            (key, value), = value.items()
+            event = (key, value)
+        else:
+            event = (self.count, value)
+        self.count += 1
+        return [event]
@@ -0,0 +1,242 @@
+"""
+结构化输出校验与修复模块
+
+按 JSON Schema 的常用子集 (type、properties、required、items、additionalProperties、enum)
+校验 LLM 返回的 JSON；解析或校验失败时只把出错的片段与错误说明发给模型修复，
+而不是重跑携带完整上下文的原始请求。被截断的输出补齐后仍记为错误 (缺失的内容无法靠修复找回)。
+按调用阶段标签统计解析失败率、截断率与修复率。
+"""
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.utils.extract_markdown import extract_json_with_truncation
+
+logger = logging.getLogger(__name__)
+
+_TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+class StructuredOutputError(ValueError):
+    """修复后仍无法得到符合 schema 的结果"""
+
+    def __init__(self, label: Optional[str], errors: List[str], content: Optional[str]):
+        super().__init__(f"[{label or '-'}] 结构化输出不符合要求: {'; '.join(errors[:5])}")
+        self.label = label
+        self.errors = errors
+        self.content = content
+
+
+def validate_schema(data: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """按 schema 校验数据，返回错误列表 (为空表示通过)，每条错误以 JSON 路径开头"""
+    errors: List[str] = []
+    expected = schema.get("type")
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPE_CHECKS[t](data) for t in types):
+            return [f"{path}: 应为 {'/'.join(types)}，实际为 {type(data).__name__}"]
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: 取值应为 {schema['enum']} 之一")
+    if isinstance(data, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}.{key}: 缺少必填字段")
+        extra_schema = schema.get("additionalProperties")
+        for key, value in data.items():
+            if key in properties:
+                errors.extend(validate_schema(value, properties[key], f"{path}.{key}"))
+            elif isinstance(extra_schema, dict):
+                errors.extend(validate_schema(value, extra_schema, f"{path}.{key}"))
+    elif isinstance(data, list) and isinstance(schema.get("items"), dict):
+        for i, item in enumerate(data):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def parse_and_validate(content: Optional[str], schema: Dict[str, Any]) -> Tuple[Any, List[str], bool, bool]:
+    """解析并校验 LLM 输出；被截断的输出补齐后参与校验，并在错误列表开头记一条截断错误
+
+    Returns:
+        (解析结果, 错误列表, 是否解析失败, 是否被截断)；解析失败时结果为 None
+    """
+    data, truncated = extract_json_with_truncation(content) if content else (None, False)
+    if data is None:
+        return None, ["输出不是合法的 JSON"], True, False
+    errors = validate_schema(data, schema)
+    if truncated:
+        errors.insert(0, "$: 输出被截断，内容不完整")
+    return data, errors, False, truncated
+
+
+def _error_keys(errors: List[str]) -> Optional[List[str]]:
+    """出错的顶层字段；存在根级错误时返回 None"""
+    keys = []
+    for error in errors:
+        path = error.split(":", 1)[0]
+        if not path.startswith("$."):
+            return None
+        key = path[2:].split(".", 1)[0].split("[", 1)[0]
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def repair_fragment(data: Any, errors: List[str], schema: Dict[str, Any]) -> Tuple[Any, Dict[str, Any], Optional[List[str]]]:
+    """选出需要修复的最小片段
+
+    错误都落在顶层对象的某些字段内时只取这些字段；否则取整个结果。
+
+    Returns:
+        (片段, 片段的 schema, 片段对应的顶层字段；为 None 表示整体替换)
+    """
+    keys = _error_keys(errors) if isinstance(data, dict) else None
+    if not keys:
+        return data, schema, None
+    properties = schema.get("properties", {})
+    extra_schema = schema.get("additionalProperties")
+    fragment_schema = {
+        "type": "object",
+        "required": [k for k in keys if k in schema.get("required", [])],
+        "properties": {k: properties.get(k, extra_schema if isinstance(extra_schema, dict) else {}) for k in keys},
+    }
+    return {k: data.get(k) for k in keys}, fragment_schema, keys
+
+
+def build_repair_messages(fragment: Any, raw_content: Optional[str], errors: List[str],
+                          schema: Dict[str, Any]) -> List[Dict[str, str]]:
+    """构建修复请求：只包含出错的片段、错误说明与 schema，不包含原始输入"""
+    if fragment is None:
+        # 无法解析时发送原始输出中 JSON 开始之后的部分
+        text = raw_content or ""
+        starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+        fragment_text = text[min(starts):] if starts else text
+    else:
+        fragment_text = json.dumps(fragment, ensure_ascii=False)
+    prompt = f"""下面的 JSON 片段不符合要求，请修正后返回。
+
+错误:
+{chr(10).join('- ' + e for e in errors[:20])}
+
+要求的 JSON Schema:
+{json.dumps(schema, ensure_ascii=False)}
+
+待修正的片段:
+{fragment_text}
+
+只修正格式、类型和缺失字段 (缺失的字段用空值补齐)，不要编造新内容。只返回修正后的JSON，不要其他解释。"""
+    return [{"role": "user", "content": prompt}]
+
+
+class ExtractionStats:
+    """按调用阶段标签统计结构化输出的解析失败、校验失败与修复情况，线程安全"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, label: Optional[str], **counts: int) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(label or "unlabeled", {
+                "calls": 0, "parse_failures": 0, "truncated": 0, "validation_failures": 0,
+                "repairs": 0, "repaired": 0, "failed": 0,
+            })
+            for key, value in counts.items():
+                entry[key] += value
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各标签的计数及解析失败率、截断率、修复率 (需要修复的比例) 与修复成功率"""
+        with self._lock:
+            stats = {label: dict(entry) for label, entry in self._stats.items()}
+        for entry in stats.values():
+            calls = entry["calls"]
+            entry["parse_failure_rate"] = entry["parse_failures"] / calls if calls else 0.0
+            entry["truncation_rate"] = entry["truncated"] / calls if calls else 0.0
+            entry["repair_rate"] = entry["repairs"] / calls if calls else 0.0
+            entry["repair_success_rate"] = entry["repaired"] / entry["repairs"] if entry["repairs"] else 0.0
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# 进程级结构化输出统计
+extraction_stats = ExtractionStats()
+
+
+class StructuredRepair:
+    """一次结构化输出的校验与修复过程，只负责规划修复请求与合并结果，不发送请求
+
+    同步与异步客户端共用：调用方遍历 requests() 发送每个修复请求，把输出交给 apply()，
+    请求失败时调用 fail()，最后由 result() 返回结果。被截断的输出不发修复请求，直接视为失败。
+    """
+
+    def __init__(self, content: Optional[str], schema: Dict[str, Any], max_repairs: int, label: Optional[str]):
+        """
+        Args:
+            content: 原始请求的输出
+            schema: JSON Schema 子集，见 validate_schema
+            max_repairs: 最多修复次数
+            label: 调用阶段标签，用于统计与日志
+        """
+        self.content = content
+        self.schema = schema
+        self.max_repairs = max_repairs
+        self.label = label
+        self.repair_label = f"{label or 'unlabeled'}.repair"
+        self.repairs = 0
+        self.data, self.errors, self.parse_failed, self.truncated = parse_and_validate(content, schema)
+        self._fragment_schema = schema
+        self._keys: Optional[List[str]] = None
+        self._stopped = False
+        extraction_stats.add(label, calls=1, parse_failures=int(self.parse_failed), truncated=int(self.truncated),
+                             validation_failures=int(bool(self.errors) and not self.parse_failed and not self.truncated))
+
+    def requests(self) -> Iterator[Tuple[List[Dict[str, str]], Dict[str, Any]]]:
+        """依次产出 (修复请求消息, 片段 schema)，直到结果合规、达到修复次数上限或请求失败"""
+        # 截断丢失的内容修复请求补不回来，只会得到看似完整的部分结果
+        while self.errors and not self.truncated and self.repairs < self.max_repairs and not self._stopped:
+            self.repairs += 1
+            extraction_stats.add(self.label, repairs=1)
+            if self.parse_failed:
+                fragment, self._fragment_schema, self._keys = None, self.schema, None
+            else:
+                fragment, self._fragment_schema, self._keys = repair_fragment(self.data, self.errors, self.schema)
+            yield build_repair_messages(fragment, self.content, self.errors, self._fragment_schema), self._fragment_schema
+
+    def apply(self, repair_content: Optional[str]) -> None:
+        """合并修复请求的输出并重新校验；修复输出无法解析或被截断时保持原结果"""
+        repaired, _, repair_parse_failed, repair_truncated = parse_and_validate(repair_content, self._fragment_schema)
+        if repair_parse_failed or repair_truncated:
+            return
+        if self._keys is None:
+            self.data = repaired
+        elif isinstance(repaired, dict):
+            self.data = {**self.data, **{k: repaired[k] for k in self._keys if k in repaired}}
+        self.parse_failed = False
+        self.errors = validate_schema(self.data, self.schema)
+
+    def fail(self, error: Exception) -> None:
+        """修复请求失败，不再继续修复"""
+        logger.warning(f"[{self.label or '-'}] 结构化输出修复请求失败: {error}")
+        self._stopped = True
+
+    def result(self) -> Any:
+        """返回符合 schema 的结果并记录统计；修复后仍不合规时抛出 StructuredOutputError"""
+        if self.errors:
+            extraction_stats.add(self.label, failed=1)
+            logger.warning(f"[{self.label or '-'}] 结构化输出经 {self.repairs} 次修复仍不合规: {self.errors[:3]}")
+            raise StructuredOutputError(self.label, self.errors, self.content)
+        if self.repairs:
+            extraction_stats.add(self.label, repaired=1)
+        return self.data
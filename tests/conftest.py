@@ -0,0 +1,57 @@
+"""测试共用的离线桩服务：LLM / AsyncLLM 的请求经 ASGI 直接交给 create_stub_app，不走网络"""
+import httpx
+import pytest
+from openai import AsyncOpenAI, OpenAI
+from starlette.testclient import TestClient
+
+import src.llm as llm_module
+from src.utils.circuit_breaker import CircuitBreakerRegistry
+from src.utils.concurrency import ConcurrencyRegistry
+from src.utils.llm_stub_server import create_stub_app
+from src.utils.rate_limiter import RateLimiter
+
+
+class _StubClientRegistry(llm_module.ClientRegistry):
+    def __init__(self, http_client: TestClient):
+        super().__init__()
+        self.http_client = http_client
+
+    def _create_client(self, base_url: str, api_key: str) -> OpenAI:
+        # 错误注入的效果由调用方观察，不让 SDK 自动重试
+        return OpenAI(base_url=base_url, api_key=api_key, http_client=self.http_client, max_retries=0)
+
+
+class _AsyncStubClientRegistry(llm_module.AsyncClientRegistry):
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def _create_client(self, base_url: str, api_key: str) -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app))
+        return AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client, max_retries=0)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """返回 start(**config)：创建桩服务 (默认无延迟) 并让之后的 LLM 请求都发给它，返回 StubState
+
+    熔断器、并发控制器与限流器换成新实例，测试之间互不影响。
+    """
+    monkeypatch.setattr(llm_module, "circuit_breakers", CircuitBreakerRegistry())
+    monkeypatch.setattr(llm_module, "concurrency_controllers", ConcurrencyRegistry())
+    monkeypatch.setattr(llm_module, "rate_limiter", RateLimiter())
+    test_clients = []
+
+    def start(**config):
+        app = create_stub_app({"latency": 0.0, "latency_jitter": 0.0, **config})
+        # 以上下文管理器方式使用，所有请求共用一个事件循环，批处理任务的后台协程得以继续运行
+        test_client = TestClient(app)
+        test_client.__enter__()
+        test_clients.append(test_client)
+        monkeypatch.setattr(llm_module, "client_registry", _StubClientRegistry(test_client))
+        monkeypatch.setattr(llm_module, "async_client_registry", _AsyncStubClientRegistry(app))
+        return app.state.stub
+
+    yield start
+    for test_client in test_clients:
+        test_client.__exit__(None, None, None)
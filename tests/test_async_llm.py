@@ -0,0 +1,61 @@
+"""AsyncLLM 经桩服务的 generate / ask_tool / generate_stream / batch_generate"""
+import asyncio
+
+from src.llm import AsyncLLM
+
+TOOLS = [{"type": "function", "function": {
+    "name": "search", "parameters": {"type": "object", "properties": {"query": {"type": "string"}}}}}]
+
+
+def _user(content):
+    return [{"role": "user", "content": content}]
+
+
+def test_generate_and_json_output(stub):
+    stub(canned=[{"pattern": "品牌", "response": {"品牌": 1}}])
+
+    async def main():
+        llm = AsyncLLM(api_key="k")
+        return (await llm.generate(_user("你好")),
+                await llm.generate(_user("统计品牌"), json_output=True))
+
+    text, data = asyncio.run(main())
+    assert text == "这是离线桩服务的模拟回复。"
+    assert data == {"品牌": 1}
+
+
+def test_ask_tool_returns_tool_calls(stub):
+    stub(tool_call_mode="first")
+    message = asyncio.run(AsyncLLM(api_key="k").ask_tool(_user("查一下"), tools=TOOLS))
+    assert [call.function.name for call in message.tool_calls] == ["search"]
+
+
+def test_generate_stream_yields_the_whole_reply(stub):
+    stub(stream_chunk_chars=3)
+
+    async def main():
+        pieces = []
+        async for chunk in AsyncLLM(api_key="k").generate_stream(_user("你好")):
+            if chunk.choices and chunk.choices[0].delta.content:
+                pieces.append(chunk.choices[0].delta.content)
+        return pieces
+
+    pieces = asyncio.run(main())
+    assert len(pieces) > 1
+    assert "".join(pieces) == "这是离线桩服务的模拟回复。"
+
+
+def test_batch_generate_keeps_order_and_isolates_failures(stub):
+    canned = [{"pattern": f"^问题{i}$", "response": f"答案{i}"} for i in range(5)]
+    stub(latency=0.01, latency_jitter=0.03, canned=canned, seed=3)
+
+    class PartlyFailingLLM(AsyncLLM):
+        async def generate(self, messages, **kwargs):
+            if messages[-1]["content"] == "问题2":
+                raise RuntimeError("失败")
+            return await super().generate(messages, **kwargs)
+
+    llm = PartlyFailingLLM(api_key="k")
+    results = asyncio.run(llm.batch_generate([_user(f"问题{i}") for i in range(5)], batch_size=2))
+    assert results == ["答案0", "答案1", None, "答案3", "答案4"]
+    assert llm.last_batch_stats["failed"] == 1
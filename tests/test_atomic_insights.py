@@ -0,0 +1,196 @@
+"""atomic_insights：多帖子打包、融合分析、品牌分析线程池、结果存储 (只保存完整结果) 与近似重复标记"""
+import threading
+import time
+
+import pytest
+
+import src.tools.atomic_insights as atomic_module
+from src.llm import LLM
+from src.utils.post_store import PostResultStore
+
+COMPLETE = '{"brand_mentions": {}, "user_competition": {"brand_pairs": []}, "brand_analysis": {}}'
+# 截断在最后一个字段中间，补齐后仍符合 FUSED_ANALYSIS_SCHEMA
+TRUNCATED = '{"brand_mentions": {}, "user_competition": {"brand_pairs": []}, "brand_analysis": {'
+
+
+class FakeLLM(LLM):
+    """按提示词中的帖子标题返回预设输出，记录被分析的标题"""
+
+    def __init__(self, responses):
+        super().__init__(model="doubao-lite", routing=False)
+        self.responses = responses
+        self.calls = []
+
+    def generate(self, messages, label=None, **kwargs):
+        content = messages[-1]["content"]
+        title = next(title for title in self.responses if title in content)
+        self.calls.append(title)
+        return self.responses[title]
+
+
+def _post(title, detail_desc=None):
+    return {"url": f"https://example.com/{title}", "author_name": "作者", "title": title,
+            "detail_desc": detail_desc or f"{title}的正文", "comments_data": []}
+
+
+def _posts():
+    return [_post("帖子甲"), _post("帖子乙")]
+
+
+def _run(monkeypatch, store, responses, posts=None, **options):
+    llm = FakeLLM(responses)
+    monkeypatch.setattr(atomic_module, "LLM", lambda **kwargs: llm)
+    stats = {}
+    results = atomic_module.atomic_insights(posts or _posts(), fused=True, result_store=store,
+                                            store_stats=stats, **options)
+    return llm, results, stats
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PostResultStore(str(tmp_path / "post_results.sqlite"))
+
+
+def test_truncated_output_is_not_stored(monkeypatch, store):
+    _, results, stats = _run(monkeypatch, store, {"帖子甲": COMPLETE, "帖子乙": TRUNCATED})
+    assert stats["stored"] == 1
+    assert results[1]["user_competition"] == {}
+
+    # 下次运行只重新分析被截断的帖子
+    llm, _, stats = _run(monkeypatch, store, {"帖子甲": COMPLETE, "帖子乙": COMPLETE})
+    assert llm.calls == ["帖子乙"]
+    assert stats["hit"] == 1 and stats["stored"] == 1
+
+
+def _reposted_posts():
+    body = "".join(f"第{i}天使用这款耳机，降噪在地铁里表现很好，续航坚持了{i + 8}个小时。" for i in range(12))
+    return [_post("原帖", body), _post("转发", body + "转发"), _post("无关帖子")]
+
+
+def test_duplicate_of_marks_only_near_duplicates(monkeypatch):
+    responses = {"原帖": COMPLETE, "无关帖子": COMPLETE}
+    llm, results, _ = _run(monkeypatch, None, responses, posts=_reposted_posts(),
+                           dedupe_threshold=atomic_module.NEAR_DUPLICATE_THRESHOLD)
+    assert sorted(llm.calls) == ["原帖", "无关帖子"]
+    assert results[1]["duplicate_of"] == "https://example.com/原帖"
+    assert "duplicate_of" not in results[0] and "duplicate_of" not in results[2]
+
+
+def test_no_duplicate_of_without_dedupe(monkeypatch):
+    responses = {"原帖": COMPLETE, "转发": COMPLETE, "无关帖子": COMPLETE}
+    llm, results, _ = _run(monkeypatch, None, responses, posts=_reposted_posts())
+    assert len(llm.calls) == 3
+    assert all("duplicate_of" not in item for item in results)
+
+
+def test_pack_by_token_budget_respects_budget_and_max_items():
+    texts = ["短" * 10, "短" * 10, "长" * 100, "短" * 10, "短" * 10, "短" * 10]
+    # 每条的开销为估算 token 数加 8
+    assert atomic_module.pack_by_token_budget(texts, list(range(6)), 40, 10) == [[0, 1], [2], [3, 4], [5]]
+    assert atomic_module.pack_by_token_budget(texts, [0, 1, 3, 4, 5], 1000, 2) == [[0, 1], [3, 4], [5]]
+    assert atomic_module.pack_by_token_budget(texts, [], 40, 10) == []
+
+
+def test_unpack_brand_mentions_keeps_only_valid_group_members():
+    response = ('```json\n[{"index": 0, "brands": {"甲": 2}}, {"index": 9, "brands": {"乙": 1}},'
+                ' {"index": "1", "brands": {}}, {"index": 2, "brands": "坏"}, "坏"]\n```')
+    assert atomic_module._unpack_brand_mentions(response, [0, 1, 2]) == {0: {"甲": 2}, 1: {}}
+    wrapped = '{"results": [{"index": 3, "brands": {"丙": 1}}]}'
+    assert atomic_module._unpack_brand_mentions(wrapped, [3]) == {3: {"丙": 1}}
+    assert atomic_module._unpack_brand_mentions(None, [0]) == {}
+
+
+class PackedLLM(LLM):
+    """打包请求只回答第一条内容，单独请求按内容回答"""
+
+    def __init__(self):
+        super().__init__(model="doubao-lite", routing=False)
+        self.labels = []
+
+    def generate(self, messages, label=None, **kwargs):
+        self.labels.append(label)
+        if label == "atomic.brand_mentions.packed":
+            return '[{"index": 0, "brands": {"甲": 1}}]'
+        return '{"乙": 3}'
+
+
+def test_packed_brand_mentions_rerun_missing_items_individually():
+    llm = PackedLLM()
+    results = atomic_module._brand_mentions_for_group(["内容甲", "内容乙"], [0, 1], llm)
+    assert results == {0: {"甲": 1}, 1: {"乙": 3}}
+    assert llm.labels == ["atomic.brand_mentions.packed", "atomic.brand_mentions"]
+
+
+def test_split_fused_results_matches_the_stepwise_shape():
+    mentions = {f"品牌{i}": 10 - i for i in range(7)}
+    fused = {"brand_mentions": mentions, "user_competition": {"brand_pairs": []},
+             "brand_analysis": {"品牌0": {"sentiment": "positive"}, "品牌6": {"sentiment": "negative"}}}
+    brand_mentions, competitions, analyses = atomic_module.split_fused_results([fused, None])
+    assert brand_mentions == [mentions, None] and competitions == [{"brand_pairs": []}, None]
+    # 只保留提及最多的 5 个品牌，没有评价的品牌为 None
+    assert analyses[0] == {"品牌0": {"sentiment": "positive"}, "品牌1": None, "品牌2": None, "品牌3": None,
+                           "品牌4": None}
+    assert analyses[1] == {}
+
+
+def test_batch_fused_analysis_makes_one_call_per_post(stub):
+    state = stub()
+    contents = ["标题：小米和特斯拉对比\n正文：小米的续航不错，特斯拉的智能驾驶更好，最后选了小米",
+                "标题：随便聊聊\n正文：今天天气不错"]
+    brand_mentions, competitions, analyses = atomic_module.batch_fused_analysis(
+        contents, LLM(model="doubao-lite", routing=False), batch_size=2)
+    assert state.stats["requests"] == 2 and state.stats["rule_answers"] == 2
+    assert brand_mentions == [{"小米": 3, "特斯拉": 2}, {}]
+    assert [(p["source_brand"], p["target_brand"]) for p in competitions[0]["brand_pairs"]] == [("小米", "特斯拉")]
+    assert set(analyses[0]) == {"小米", "特斯拉"} and analyses[0]["小米"]["sentiment"] == "positive"
+    assert analyses[1] == {}
+
+
+class SlowBrandLLM(LLM):
+    """generate_structured 休眠一小段时间，记录同时在途的最大请求数；品牌为 "坏" 时抛错"""
+
+    def __init__(self):
+        super().__init__(model="doubao-lite", routing=False)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_structured(self, messages, schema, label=None, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.05)
+            if '关于"坏"品牌' in messages[-1]["content"]:
+                raise RuntimeError("修复后仍不合规")
+            return {"sentiment": "neutral", "label": label}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def test_brand_analysis_pool_caps_concurrency_across_posts():
+    llm = SlowBrandLLM()
+    with atomic_module.BrandAnalysisPool(llm, max_concurrency=3) as pool:
+        futures = [pool.submit(f"内容{i}", ["甲", "乙", "丙"]) for i in range(3)]
+        results = [pool.collect(i, f) for i, f in enumerate(futures)]
+    assert llm.max_in_flight == 3
+    assert all(r == {b: {"sentiment": "neutral", "label": "atomic.brand_analysis"} for b in "甲乙丙"}
+               for r in results)
+
+
+def test_brand_analysis_pool_isolates_failed_brands():
+    with atomic_module.BrandAnalysisPool(SlowBrandLLM(), max_concurrency=2) as pool:
+        results = pool.analyze(4, "内容", ["甲", "坏"])
+        assert pool.analyze(5, "内容", ["乙"])["乙"] is not None
+    assert results["甲"]["sentiment"] == "neutral" and results["坏"] is None
+    assert pool.errors == {4: {"坏": "修复后仍不合规"}}
+
+
+def test_model_change_invalidates_stored_results(monkeypatch, store):
+    responses = {"帖子甲": COMPLETE, "帖子乙": COMPLETE}
+    _run(monkeypatch, store, responses, model_id="doubao-lite")
+    llm, _, stats = _run(monkeypatch, store, responses, model_id="doubao-lite")
+    assert llm.calls == [] and stats["hit"] == 2
+    llm, _, stats = _run(monkeypatch, store, responses, model_id="deepseek-v3")
+    assert sorted(llm.calls) == ["帖子乙", "帖子甲"] and stats["outdated"] == 2
@@ -0,0 +1,68 @@
+"""LLM.batch_generate 的并发上限、结果顺序与单条失败隔离"""
+import threading
+import time
+
+from src.llm import LLM
+from src.utils.llm_metrics import UsageTracker, track_usage
+
+
+class SlowLLM(LLM):
+    """generate 休眠一小段时间后回显消息内容，记录同时在途的最大请求数；内容以 "失败" 开头时抛错"""
+
+    def __init__(self):
+        super().__init__(api_key="k")
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate(self, messages, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.05)
+            content = messages[-1]["content"]
+            if content.startswith("失败"):
+                raise RuntimeError(content)
+            return f"回复{content}"
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _messages(contents):
+    return [[{"role": "user", "content": content}] for content in contents]
+
+
+def test_in_flight_requests_are_bounded_by_batch_size():
+    llm = SlowLLM()
+    results = llm.batch_generate(_messages(str(i) for i in range(12)), batch_size=4)
+    assert results == [f"回复{i}" for i in range(12)]
+    assert 1 < llm.max_in_flight <= 4
+
+
+def test_failed_request_only_affects_its_own_slot():
+    llm = SlowLLM()
+    results = llm.batch_generate(_messages(["0", "失败1", "2", "失败3"]), batch_size=2)
+    assert results == ["回复0", None, "回复2", None]
+    stats = llm.last_batch_stats
+    assert (stats["total"], stats["succeeded"], stats["failed"]) == (4, 2, 2)
+    assert sorted(stats["errors"]) == [1, 3]
+
+
+def test_empty_batch():
+    llm = SlowLLM()
+    assert llm.batch_generate([]) == []
+    assert llm.last_batch_stats["total"] == 0
+
+
+def test_results_follow_input_order_and_worker_calls_are_tracked(stub):
+    canned = [{"pattern": f"^问题{i}$", "response": f"答案{i}"} for i in range(6)]
+    stub(latency=0.02, latency_jitter=0.05, canned=canned, seed=1)
+    tracker = UsageTracker()
+    with track_usage(tracker):
+        results = LLM(api_key="k").batch_generate(_messages(f"问题{i}" for i in range(6)), batch_size=3,
+                                                  label="test.batch")
+    assert results == [f"答案{i}" for i in range(6)]
+    # 工作线程继承调用方的上下文，调用记录到当前激活的追踪器
+    assert tracker.summary_by_label()["test.batch"]["calls"] == 6
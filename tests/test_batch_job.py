@@ -0,0 +1,89 @@
+"""离线批处理任务：经桩服务的 Files + Batches 接口提交与轮询、错误文件、失败请求的重新提交与中断恢复"""
+import json
+import os
+
+import pytest
+
+from src.llm import LLM
+from src.utils.batch_job import BatchJob, BatchJobError
+from src.utils.llm_metrics import UsageTracker, track_usage
+
+FAST = {"poll_interval": 0.01, "timeout": 10}
+CANNED = [{"pattern": f"^问题{i}$", "response": f"答案{i}"} for i in range(6)]
+
+
+def _messages(n):
+    return [[{"role": "user", "content": f"问题{i}"}] for i in range(n)]
+
+
+def _job(llm, job_dir, **config):
+    return BatchJob(str(job_dir), llm._get_client_for_model(llm.model), label="test.batch", **{**FAST, **config})
+
+
+def _requests(n):
+    return {f"req-{i}": {"model": "m", "messages": [{"role": "user", "content": f"问题{i}"}]} for i in range(n)}
+
+
+def test_generate_batch_job_returns_results_in_order(stub, tmp_path):
+    state = stub(batch_delay=0.02, canned=CANNED)
+    tracker = UsageTracker()
+    llm = LLM(api_key="k")
+    # 重复的请求只提交一次
+    message_lists = _messages(4) + _messages(1)
+    with track_usage(tracker):
+        results = llm.generate_batch_job(str(tmp_path), message_lists, label="test.batch", batch_job_options=FAST)
+    assert results == ["答案0", "答案1", "答案2", "答案3", "答案0"]
+    assert llm.last_batch_job_stats["submitted"] == 4 and llm.last_batch_job_stats["batches"] == 1
+    assert state.stats["batch_requests"] == 4
+    assert {r["source"] for r in tracker.records} == {"batch"} and len(tracker.records) == 4
+
+    # 同一任务目录重新运行时直接复用结果，不再提交
+    assert llm.generate_batch_job(str(tmp_path), message_lists, batch_job_options=FAST) == results
+    assert llm.last_batch_job_stats["reused"] == 4 and state.stats["batches"] == 1
+
+
+def test_failed_requests_go_to_the_error_file_and_are_resubmitted(stub, tmp_path):
+    state = stub(batch_delay=0.02, error_5xx_rate=0.5, seed=6)
+    llm = LLM(api_key="k")
+    job = _job(llm, tmp_path, max_rounds=1)
+    results = job.run(_requests(6))
+    errors = [json.loads(line) for line in open(os.path.join(tmp_path, "errors.jsonl"), encoding="utf-8")]
+    assert 0 < len(errors) < 6 and len(results) == 6 - len(errors)
+    assert job.stats["failed"] == len(errors) == state.stats["injected_5xx"]
+    assert all(e["response"]["status_code"] in (500, 502, 503) for e in errors)
+
+    # 重新运行只提交失败的请求
+    stub(batch_delay=0.02)
+    job = _job(llm, tmp_path)
+    assert set(job.run(_requests(6))) == set(_requests(6))
+    assert job.stats["reused"] == 6 - len(errors) and job.stats["submitted"] == len(errors)
+
+
+def test_failed_rounds_are_retried_within_one_run(stub, tmp_path):
+    stub(batch_delay=0.02, error_5xx_rate=0.5, seed=6)
+    job = _job(LLM(api_key="k"), tmp_path, max_rounds=5)
+    assert len(job.run(_requests(6))) == 6
+    assert job.stats["batches"] > 1 and job.stats["failed"] == 0
+
+
+def test_interrupted_job_collects_the_in_flight_batch(stub, tmp_path):
+    state = stub(batch_delay=0.1)
+    llm = LLM(api_key="k")
+    with pytest.raises(BatchJobError):
+        _job(llm, tmp_path, timeout=0).run(_requests(3))
+    batches = json.load(open(os.path.join(tmp_path, "batches.json"), encoding="utf-8"))
+    assert len(batches) == 1 and batches[0]["collected"] is False
+
+    job = _job(llm, tmp_path)
+    assert len(job.run(_requests(3))) == 3
+    # 上次提交的批次被收取，没有重复提交
+    assert state.stats["batches"] == 1 and job.stats["submitted"] == 0 and job.stats["reused"] == 3
+
+
+def test_generate_batch_job_validates_schema(stub, tmp_path):
+    stub(batch_delay=0.02, canned=[{"pattern": "^问题0$", "response": {"score": 4}},
+                                   {"pattern": "^问题1$", "response": "不是JSON"}])
+    schema = {"type": "object", "required": ["score"], "properties": {"score": {"type": "integer"}}}
+    results = LLM(api_key="k").generate_batch_job(str(tmp_path), _messages(2), schema=schema, max_repairs=0,
+                                                  batch_job_options=FAST)
+    assert results == [{"score": 4}, None]
@@ -0,0 +1,76 @@
+"""录制/回放 cassette：经桩服务录制，回放时不访问接口，流式响应与重复请求的回放顺序"""
+import pytest
+
+from src.llm import LLM
+from src.utils.cassette import Cassette, CassetteMiss
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+REQUEST = {"model": "m", "messages": MESSAGES}
+
+
+def _stream_text(llm):
+    pieces = []
+    for chunk in llm.generate_stream(MESSAGES):
+        if chunk.choices and chunk.choices[0].delta.content:
+            pieces.append(chunk.choices[0].delta.content)
+    return "".join(pieces)
+
+
+@pytest.mark.parametrize("filename", ["calls.jsonl", "calls.jsonl.gz"])
+def test_record_then_replay_without_the_api(stub, tmp_path, filename):
+    path = str(tmp_path / filename)
+    stub(canned=[{"pattern": "你好", "response": "录制时的回复"}], stream_chunk_chars=2)
+    recorder = Cassette(path, mode="record")
+    llm = LLM(api_key="k", cassette=recorder)
+    assert llm.generate(MESSAGES) == "录制时的回复"
+    assert _stream_text(llm) == "录制时的回复"
+    recorder.close()
+    assert recorder.get_stats()["recorded"] == 2
+
+    # 回放时接口的回复已经变了，仍得到录制的内容且接口未收到请求
+    state = stub(canned=[{"pattern": "你好", "response": "接口的新回复"}])
+    player = Cassette(path, mode="replay", latency="zero")
+    llm = LLM(api_key="k", cassette=player)
+    assert llm.generate(MESSAGES) == "录制时的回复"
+    assert _stream_text(llm) == "录制时的回复"
+    assert state.stats["requests"] == 0
+    assert player.get_stats()["replayed"] == 2
+
+
+def test_unrecorded_request_raises_cassette_miss(stub, tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    Cassette(path, mode="record").close()
+    player = Cassette(path, mode="replay")
+    with pytest.raises(CassetteMiss):
+        LLM(api_key="k", cassette=player).generate(MESSAGES)
+    assert player.get_stats()["misses"] == 1
+
+
+def test_repeated_request_replays_in_order_then_repeats_the_last(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    recorder = Cassette(path, mode="record")
+    for i in range(2):
+        recorder.record(REQUEST, {"answer": i}, latency=0.5)
+    recorder.close()
+    player = Cassette(path, mode="replay")
+    assert [player.replay(REQUEST) for _ in range(3)] == [({"answer": 0}, 0.5), ({"answer": 1}, 0.5),
+                                                          ({"answer": 1}, 0.5)]
+    # 流式与非流式请求分开录制
+    with pytest.raises(CassetteMiss):
+        player.replay({**REQUEST, "stream": True})
+
+
+def test_zero_latency_replay(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    recorder = Cassette(path, mode="record")
+    recorder.record_stream(REQUEST, [(0.1, {"n": 0}), (0.3, {"n": 1})])
+    recorder.close()
+    assert Cassette(path).replay_stream(REQUEST) == [(0.1, {"n": 0}), (0.3, {"n": 1})]
+    assert Cassette(path, latency="zero").replay_stream(REQUEST) == [(0.0, {"n": 0}), (0.0, {"n": 1})]
+
+
+def test_invalid_modes_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "calls.jsonl"), mode="rewind")
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "calls.jsonl"), mode="record", latency="slow")
@@ -0,0 +1,110 @@
+"""熔断器：closed -> open -> half_open -> closed 的状态转换、经桩服务的快速失败与 /health 接口"""
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from openai import BadRequestError, InternalServerError
+from starlette.testclient import TestClient
+
+import src.llm as llm_module
+from app.routes import router
+from src.llm import LLM
+from src.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+REQUEST = {"model": llm_module.MODEL_MAP["deepseek-v3"], "messages": [{"role": "user", "content": "你好"}]}
+
+
+def _response(status):
+    return httpx.Response(status, request=httpx.Request("POST", "http://stub/chat/completions"))
+
+
+def _health_app():
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+def _fail(breaker, times=1):
+    for _ in range(times):
+        breaker.acquire()
+        breaker.record_failure()
+
+
+def test_opens_when_failure_rate_reaches_threshold():
+    breaker = CircuitBreaker("m", failure_rate_threshold=0.5, min_calls=4, open_seconds=60)
+    breaker.acquire()
+    breaker.record_success()
+    _fail(breaker, 2)
+    # 调用数不足 min_calls 时不判定
+    assert breaker.state == CLOSED
+    _fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.acquire()
+    assert 0 < excinfo.value.retry_after <= 60
+    snapshot = breaker.snapshot()
+    assert snapshot["failure_rate"] == 0.75 and snapshot["stats"]["rejected"] == 1 and snapshot["stats"]["opened"] == 1
+
+
+def test_half_open_probe_success_closes():
+    breaker = CircuitBreaker("m", min_calls=1, open_seconds=0.05)
+    _fail(breaker)
+    time.sleep(0.06)
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    # 探测名额已满时其他请求仍快速失败
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.snapshot()["window_calls"] == 1
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = CircuitBreaker("m", min_calls=1, open_seconds=0.05)
+    _fail(breaker)
+    time.sleep(0.06)
+    _fail(breaker)
+    assert breaker.state == OPEN and breaker.stats["opened"] == 2
+
+
+def test_ignored_probe_releases_its_slot():
+    breaker = CircuitBreaker("m", min_calls=1, open_seconds=0.05)
+    _fail(breaker)
+    time.sleep(0.06)
+    breaker.acquire()
+    breaker.record_ignored()
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+
+
+def test_only_endpoint_failures_count():
+    breaker = CircuitBreaker("m", min_calls=1)
+    bad_request = BadRequestError("bad", response=_response(400), body=None)
+    llm_module._record_breaker_outcome(breaker, bad_request)
+    assert breaker.state == CLOSED and breaker.stats["failures"] == 0
+    llm_module._record_breaker_outcome(breaker, InternalServerError("boom", response=_response(500), body=None))
+    assert breaker.state == OPEN
+
+
+def test_open_breaker_fails_fast_without_calling_the_endpoint(stub):
+    state = stub(error_5xx_rate=1.0, seed=1)
+    llm_module.configure_circuit_breaker(min_calls=2, open_seconds=60)
+    llm = LLM(api_key="k")
+    for _ in range(2):
+        with pytest.raises(InternalServerError):
+            llm._send_request(REQUEST)
+    with pytest.raises(CircuitOpenError):
+        llm._send_request(REQUEST)
+    assert state.stats["requests"] == 2
+
+
+def test_health_reports_degraded_while_a_breaker_is_open(stub):
+    stub()
+    client = TestClient(_health_app())
+    assert client.get("/health").json()["status"] == "ok"
+    breaker = llm_module.circuit_breakers.get("m")
+    _fail(breaker, 10)
+    body = client.get("/health").json()
+    assert body["status"] == "degraded"
+    assert body["circuit_breakers"]["m"]["state"] == OPEN and body["circuit_breakers"]["m"]["failure_rate"] == 1.0
@@ -0,0 +1,52 @@
+"""共享 OpenAI 客户端注册表：按 (base_url, api_key) 复用，异步客户端按事件循环区分"""
+import asyncio
+
+import httpx
+import pytest
+
+import src.llm as llm_module
+from src.llm import LLM, AsyncClientRegistry, ClientRegistry
+
+BASE_URL = "http://127.0.0.1:1/api/v3"
+
+
+def test_clients_are_shared_per_base_url_and_key():
+    registry = ClientRegistry()
+    client = registry.get(BASE_URL, "k1")
+    assert registry.get(BASE_URL, "k1") is client
+    assert registry.get(BASE_URL, "k2") is not client
+    assert registry.get("http://127.0.0.1:2/api/v3", "k1") is not client
+    registry.close()
+
+
+def test_llm_instances_share_one_client(monkeypatch):
+    monkeypatch.setattr(llm_module, "client_registry", ClientRegistry())
+    first, second = LLM(api_key="k"), LLM(api_key="k")
+    assert first._get_client_for_model(first.model) is second._get_client_for_model(second.model)
+
+
+def test_configure_rebuilds_clients_with_new_pool_settings():
+    registry = ClientRegistry()
+    client = registry.get(BASE_URL, "k")
+    registry.configure(max_connections=7, timeout=7.0)
+    rebuilt = registry.get(BASE_URL, "k")
+    assert rebuilt is not client
+    assert rebuilt.timeout == httpx.Timeout(7.0)
+    registry.close()
+
+
+def test_configure_rejects_unknown_options():
+    with pytest.raises(ValueError):
+        ClientRegistry().configure(max_conections=7)
+
+
+def test_async_clients_are_shared_within_an_event_loop_only():
+    registry = AsyncClientRegistry()
+
+    async def get_twice():
+        return registry.get(BASE_URL, "k"), registry.get(BASE_URL, "k")
+
+    first, same = asyncio.run(get_twice())
+    other, _ = asyncio.run(get_twice())
+    assert first is same
+    assert other is not first
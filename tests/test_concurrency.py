@@ -0,0 +1,118 @@
+"""AIMDController 的加性增、乘性减、冷却时间与异步等待者的先来先到"""
+import asyncio
+import threading
+
+from src.utils.concurrency import AIMDController, ConcurrencyRegistry, percentile
+
+
+def _complete(controller, latency, times=1):
+    for _ in range(times):
+        controller.acquire()
+        controller.release(latency)
+
+
+def test_percentile():
+    assert percentile([], 0.9) == 0.0
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile(list(range(11)), 0.9) == 9
+
+
+def test_stable_latency_increases_limit_by_one_per_round():
+    controller = AIMDController("m", initial_limit=4, max_limit=5)
+    _complete(controller, 0.1, times=4)
+    assert controller.limit == 5
+    assert controller.decisions[-1]["action"] == "increase"
+    # 已到上界，不再增加
+    _complete(controller, 0.1, times=10)
+    assert controller.limit == 5
+
+
+def test_rate_limit_halves_limit_once_per_cooldown():
+    controller = AIMDController("m", initial_limit=16, cooldown=60)
+    for _ in range(3):
+        controller.acquire()
+        controller.release(None, rate_limited=True)
+    assert controller.limit == 8
+    assert controller.stats["rate_limited"] == 3 and controller.stats["decreases"] == 1
+
+
+def test_limit_never_drops_below_min_limit():
+    controller = AIMDController("m", initial_limit=2, min_limit=1, cooldown=0)
+    for _ in range(5):
+        controller.acquire()
+        controller.release(None, rate_limited=True)
+    assert controller.limit == 1
+
+
+def test_latency_spike_decreases_limit():
+    controller = AIMDController("m", initial_limit=4, min_samples=4, cooldown=0)
+    _complete(controller, 0.1, times=8)
+    limit = controller.limit
+    _complete(controller, 1.0)
+    assert controller.limit == limit / 2
+    assert controller.stats["latency_spikes"] == 1
+    assert controller.decisions[-1]["reason"].startswith("latency_spike")
+
+
+def test_listeners_receive_snapshots():
+    snapshots = []
+    registry = ConcurrencyRegistry(initial_limit=8, cooldown=0)
+    registry.add_listener(snapshots.append)
+    controller = registry.get("m")
+    assert registry.get("m") is controller
+    controller.acquire()
+    controller.release(None, rate_limited=True)
+    assert snapshots[-1]["name"] == "m" and snapshots[-1]["limit"] == 4
+
+
+def test_acquire_blocks_at_limit():
+    controller = AIMDController("m", initial_limit=1)
+    controller.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+    controller.release(0.1)
+    assert acquired.wait(1)
+    thread.join()
+    assert controller.in_flight == 1
+
+
+def test_async_waiters_are_granted_in_arrival_order():
+    controller = AIMDController("m", initial_limit=1)
+    order = []
+
+    async def worker(i):
+        await controller.acquire_async()
+        order.append(i)
+        await asyncio.sleep(0.01)
+        controller.release(0.01)
+
+    async def main():
+        await controller.acquire_async()
+        tasks = []
+        for i in range(4):
+            tasks.append(asyncio.ensure_future(worker(i)))
+            await asyncio.sleep(0)
+        controller.release(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == [0, 1, 2, 3]
+    assert controller.in_flight == 0
+
+
+def test_cancelled_async_waiter_does_not_leak_a_slot():
+    controller = AIMDController("m", initial_limit=1)
+
+    async def main():
+        await controller.acquire_async()
+        waiter = asyncio.ensure_future(controller.acquire_async())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        controller.release(0.01)
+
+    asyncio.run(main())
+    snapshot = controller.snapshot()
+    assert snapshot["in_flight"] == 0 and snapshot["async_waiters"] == 0
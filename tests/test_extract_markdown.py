@@ -0,0 +1,72 @@
+"""extract_json_from_markdown 单遍扫描器的表驱动测试"""
+import time
+
+import pytest
+
+from src.utils.extract_markdown import extract_json_from_markdown
+
+# (输入, 期望结果)：完整的输出，是否允许截断都不影响结果
+COMPLETE_CASES = [
+    # 嵌套
+    ('{"a": {"b": [1, {"c": 2}]}}', {"a": {"b": [1, {"c": 2}]}}),
+    ('[{"a": 1}, {"b": [2, 3]}]', [{"a": 1}, {"b": [2, 3]}]),
+    ('说明: {"a": {"b": [1, 2]}} 结束', {"a": {"b": [1, 2]}}),
+    ('{"a": "x,}", "b": 1,}', {"a": "x,}", "b": 1}),
+    ('{"a": "he said \\"}\\"", "b": 1}', {"a": 'he said "}"', "b": 1}),
+    ('{"a": 1} {"b": 2}', {"a": 1}),
+    # 代码块
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('前言\n```json\n{"a": [1, 2]}\n```\n后记', {"a": [1, 2]}),
+    ('```\n[1, 2]\n```', [1, 2]),
+    # 多余的逗号与注释
+    ('```json\n{"a": 1,}\n```', {"a": 1}),
+    ('{"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}),
+    ('{"a": 1, // 注释\n "b": 2}', {"a": 1, "b": 2}),
+    # 正文中的杂散括号
+    ('[图片] 正文 {"a": 1}', {"a": 1}),
+    ('{占位 {"a": 1}', {"a": 1}),
+    # 正文中不成对的引号不应吞掉后面的 JSON
+    ('{ 说明 "引号 } {"a": 1}', {"a": 1}),
+    # 没有 JSON；正文中只查找对象
+    ("no json here", None),
+    ("", None),
+    (None, None),
+    ("正文 [1, 2] 之后", None),
+]
+
+# (输入, 默认结果, allow_truncated=True 时的结果)：被截断的输出默认不接受
+TRUNCATED_CASES = [
+    ('{"a": 1, "b": "unterm', None, {"a": 1, "b": "unterm"}),
+    ('{"a": [1, 2', None, {"a": [1, 2]}),
+    ('{"a": 1, "b":', None, {"a": 1}),
+    ('{"a": 1, "b": 12', None, {"a": 1, "b": 12}),
+    ('{"a": 1, "b": tr', None, {"a": 1}),
+    ('```json\n{"a": 1', None, {"a": 1}),
+    ('```json\n{"a": [1, 2', None, {"a": [1, 2]}),
+]
+
+
+@pytest.mark.parametrize("text, expected", COMPLETE_CASES)
+@pytest.mark.parametrize("allow_truncated", [False, True])
+def test_complete_output(text, expected, allow_truncated):
+    assert extract_json_from_markdown(text, allow_truncated=allow_truncated) == expected
+
+
+@pytest.mark.parametrize("text, strict, repaired", TRUNCATED_CASES)
+def test_truncated_output_requires_opt_in(text, strict, repaired):
+    assert extract_json_from_markdown(text) == strict
+    assert extract_json_from_markdown(text, allow_truncated=True) == repaired
+
+
+def test_truncated_array_drops_incomplete_element():
+    text = '{"items": [{"x": 1}, {"x": 2}, {"x"'
+    assert extract_json_from_markdown(text, allow_truncated=True) == {"items": [{"x": 1}, {"x": 2}]}
+
+
+@pytest.mark.parametrize("noise", ["说明 {占位", "[图片] ", '说明 "引号 {'])
+def test_stray_openers_are_scanned_once(noise):
+    # 大量不闭合的括号曾导致平方级的重复扫描
+    text = noise * 8000 + '{"a": 1}'
+    start = time.perf_counter()
+    assert extract_json_from_markdown(text) == {"a": 1}
+    assert time.perf_counter() - start < 2
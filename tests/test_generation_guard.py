@@ -0,0 +1,97 @@
+"""失控生成防护：按标签学习的输出上限 OutputBudgets，以及流式输出的重复循环检测"""
+import pytest
+
+import src.llm as llm_module
+from src.llm import LLM
+from src.utils.generation_guard import OutputBudgets, RepetitionDetector
+from src.utils.llm_metrics import UsageTracker, track_usage
+
+LOOP = "关键词：续航、智能驾驶、外观设计；"
+VARIED = "".join(f"第{i}条评论说续航{i * 7 % 13}公里，" for i in range(60))
+
+
+def _budgets(**options):
+    return OutputBudgets(**{"min_samples": 5, "quantile": 0.9, "headroom": 1.5, "floor": 16, "step": 16, **options})
+
+
+def test_no_limit_until_enough_samples():
+    budgets = _budgets()
+    for tokens in range(100, 104):
+        budgets.observe("t", tokens)
+    assert budgets.max_tokens_for("t") is None
+    budgets.observe("t", 104)
+    # p90 = 104，放宽 1.5 倍后向上取整到 16 的倍数
+    assert budgets.max_tokens_for("t") == 160
+    assert budgets.max_tokens_for(None) is None
+    assert budgets.get_stats()["t"] == {"observed": 5, "capped": 1, "truncated": 0, "max_tokens": 160}
+
+
+def test_limit_is_clamped_and_truncated_samples_are_not_observed():
+    budgets = _budgets(ceiling=128)
+    for _ in range(5):
+        budgets.observe("long", 1000)
+        budgets.observe("short", 1)
+        budgets.observe("short", 5000, truncated=True)
+    assert budgets.max_tokens_for("long") == 128
+    assert budgets.max_tokens_for("short") == 16
+    assert budgets.get_stats()["short"]["truncated"] == 5
+
+
+def test_samples_survive_save_and_load(tmp_path):
+    path = str(tmp_path / "budgets" / "output_budgets.json")
+    budgets = _budgets()
+    for _ in range(5):
+        budgets.observe("t", 100)
+    budgets.save(path)
+    restored = _budgets()
+    restored.load(path)
+    restored.load(str(tmp_path / "missing.json"))
+    assert restored.max_tokens_for("t") == budgets.max_tokens_for("t")
+
+
+def test_repetition_detector_flags_a_loop():
+    detector = RepetitionDetector()
+    assert not any(detector.feed(VARIED[i:i + 10]) for i in range(0, len(VARIED), 10))
+    for _ in range(20):
+        if detector.feed(LOOP):
+            break
+    assert detector.reason is not None and f"长度 {len(LOOP)}" in detector.reason
+    # 检测到后一直返回 True
+    assert detector.feed("新的内容")
+
+
+def test_whitespace_repetition_is_ignored():
+    detector = RepetitionDetector(check_interval=1)
+    assert not detector.feed(" " * 1000)
+
+
+def test_learned_limit_is_applied_to_requests(monkeypatch):
+    budgets = _budgets()
+    for _ in range(5):
+        budgets.observe("t", 100)
+    monkeypatch.setattr(llm_module, "output_budgets", budgets)
+    monkeypatch.setattr(llm_module, "_output_budgets_enabled", True)
+    llm = LLM(api_key="k")
+    assert llm._build_request_params([{"role": "user", "content": "你好"}], label="t")["max_tokens"] == 160
+    # 显式指定或没有样本的标签不受影响
+    assert llm._build_request_params([], label="t", max_tokens=10)["max_tokens"] == 10
+    assert "max_tokens" not in llm._build_request_params([], label="other")
+
+
+@pytest.mark.parametrize("detect_repetition", [False, True])
+def test_stream_is_aborted_when_it_loops(stub, monkeypatch, detect_repetition):
+    monkeypatch.setattr(llm_module, "output_budgets", _budgets())
+    stub(canned=[{"pattern": "关键词", "response": LOOP * 100}], stream_chunk_chars=16)
+    tracker = UsageTracker()
+    with track_usage(tracker):
+        chunks = list(LLM(api_key="k").generate_stream([{"role": "user", "content": "列出关键词"}], label="kw",
+                                                       detect_repetition=detect_repetition))
+    text = "".join(c.choices[0].delta.content or "" for c in chunks if c.choices)
+    record = tracker.records[-1]
+    if detect_repetition:
+        assert len(text) < len(LOOP * 100) and record["aborted"] == "repetition"
+        # 中止的流不计入输出长度分布
+        assert "kw" not in llm_module.output_budgets.get_stats()
+    else:
+        assert text == LOOP * 100 and record["aborted"] is None
+        assert llm_module.output_budgets.get_stats()["kw"]["observed"] == 1
@@ -0,0 +1,126 @@
+"""对冲请求：HedgePolicy 的阈值与比例上限，以及 LLM / AsyncLLM 中先返回者胜出、落败者被取消"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+import src.llm as llm_module
+from src.llm import LLM, AsyncLLM
+from src.utils.hedging import HedgePolicy
+
+REQUEST = {"model": "m", "messages": [{"role": "user", "content": "你好"}]}
+
+
+def _warmed_policy(latency=0.05, **options):
+    """已有足够样本的策略，p95 约为 latency"""
+    policy = HedgePolicy(min_samples=5, max_hedge_rate=1.0, **options)
+    for _ in range(5):
+        policy.start("test")
+        policy.observe("test", latency)
+    return policy
+
+
+def test_no_hedging_until_enough_samples():
+    policy = HedgePolicy(min_samples=3)
+    for _ in range(3):
+        assert policy.start("test") is None
+        policy.observe("test", 0.2)
+    assert policy.start("test") == pytest.approx(0.2)
+    assert policy.get_stats()["classes"]["test"]["threshold"] == pytest.approx(0.2)
+
+
+def test_hedge_rate_is_capped():
+    policy = HedgePolicy(max_hedge_rate=0.1)
+    for _ in range(10):
+        policy.start("test")
+    assert policy.try_hedge("test") is True
+    assert policy.try_hedge("test") is False
+    stats = policy.get_stats()
+    assert stats["hedged"] == 1 and stats["rate_capped"] == 1 and stats["hedge_rate"] == pytest.approx(0.1)
+
+
+def test_winners_are_counted_per_class():
+    policy = HedgePolicy()
+    policy.observe("a", 0.1, winner="hedge")
+    policy.observe("a", 0.1, winner="primary")
+    policy.observe("a", 0.1)
+    assert policy.get_stats()["hedge_wins"] == 1 and policy.get_stats()["primary_wins"] == 1
+
+
+class SlowFirstLLM(LLM):
+    """第一个请求耗时 1 秒，之后的请求立即返回"""
+
+    def __init__(self):
+        super().__init__(api_key="k")
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _send_request(self, request_params):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            time.sleep(1.0)
+            return "primary"
+        return "hedge"
+
+
+def test_sync_hedge_wins_when_primary_is_slow(monkeypatch):
+    policy = _warmed_policy()
+    monkeypatch.setattr(llm_module, "_hedge_policy", policy)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(llm_module, "_hedge_executor", executor)
+    start = time.time()
+    assert SlowFirstLLM()._send_hedged(REQUEST, "test") == "hedge"
+    # 不等待仍在运行的主请求
+    assert time.time() - start < 0.8
+    executor.shutdown(wait=False)
+    assert policy.get_stats()["hedge_wins"] == 1
+
+
+class SlowFirstAsyncLLM(AsyncLLM):
+    """第一个请求耗时 1 秒 (记录是否被取消)，之后的请求立即返回"""
+
+    def __init__(self):
+        super().__init__(api_key="k")
+        self.calls = 0
+        self.cancelled = []
+
+    async def _send_request(self, request_params):
+        self.calls += 1
+        role = "primary" if self.calls == 1 else "hedge"
+        try:
+            await asyncio.sleep(1.0 if role == "primary" else 0)
+        except asyncio.CancelledError:
+            self.cancelled.append(role)
+            raise
+        return role
+
+
+def test_async_hedge_wins_and_the_loser_is_cancelled(monkeypatch):
+    policy = _warmed_policy()
+    monkeypatch.setattr(llm_module, "_hedge_policy", policy)
+    llm = SlowFirstAsyncLLM()
+
+    async def main():
+        result = await llm._send_hedged(REQUEST, "test")
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "hedge"
+    assert llm.cancelled == ["primary"]
+    assert policy.get_stats()["hedge_wins"] == 1
+
+
+def test_async_fast_primary_is_not_hedged(monkeypatch):
+    policy = _warmed_policy(latency=0.5)
+    monkeypatch.setattr(llm_module, "_hedge_policy", policy)
+
+    class FastAsyncLLM(AsyncLLM):
+        async def _send_request(self, request_params):
+            return "primary"
+
+    assert asyncio.run(FastAsyncLLM(api_key="k")._send_hedged(REQUEST, "test")) == "primary"
+    assert policy.get_stats()["hedged"] == 0
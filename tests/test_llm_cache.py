@@ -0,0 +1,91 @@
+"""LLMCache 的 LRU 与 TTL 淘汰"""
+import types
+
+import pytest
+
+from src.utils import llm_cache
+from src.utils.llm_cache import LLMCache, make_cache_key
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+def _cache(tmp_path, **options):
+    return LLMCache(str(tmp_path / "cache.sqlite"), **options)
+
+
+def test_lru_evicts_least_recently_accessed(tmp_path, clock):
+    cache = _cache(tmp_path, max_entries=2, ttl_seconds=None)
+    cache.set("a", {"v": "a"})
+    clock.now += 1
+    cache.set("b", {"v": "b"})
+    clock.now += 1
+    # 读取 a 刷新访问时间，b 成为最久未访问的条目
+    assert cache.get("a") == {"v": "a"}
+    clock.now += 1
+    cache.set("c", {"v": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": "a"}
+    assert cache.get("c") == {"v": "c"}
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.get_stats()["entries"] == 2
+
+
+def test_ttl_expires_entries_on_read(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.set("a", {"v": "a"})
+    clock.now += 59
+    assert cache.get("a") == {"v": "a"}
+    # 访问不延长存活时间，TTL 从写入时算起
+    clock.now += 2
+    assert cache.get("a") is None
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 0
+
+
+def test_ttl_purges_expired_entries_on_write(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.set("old", {"v": 1})
+    clock.now += 61
+    cache.set("new", {"v": 2})
+    assert cache.get_stats()["entries"] == 1
+    assert cache.get("new") == {"v": 2}
+
+
+def test_hit_rate_and_persistence(tmp_path, clock):
+    cache = _cache(tmp_path)
+    assert cache.get("a") is None
+    cache.set("a", {"v": "a"})
+    assert cache.get("a") == {"v": "a"}
+    assert cache.get_stats()["hit_rate"] == 0.5
+    cache.close()
+    assert _cache(tmp_path).get("a") == {"v": "a"}
+
+
+def test_only_deterministic_requests_are_cacheable(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.is_cacheable({"messages": []})
+    assert cache.is_cacheable({"messages": [], "temperature": 0})
+    assert not cache.is_cacheable({"messages": [], "temperature": 0.7})
+    assert not cache.is_cacheable({"messages": [], "stream": True})
+    assert _cache(tmp_path, allow_sampling=True).is_cacheable({"messages": [], "temperature": 0.7})
+
+
+def test_cache_key_ignores_transport_params():
+    params = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    assert make_cache_key(params) == make_cache_key({**params, "timeout": 30, "stream": False})
+    assert make_cache_key(params) != make_cache_key({**params, "model": "other"})
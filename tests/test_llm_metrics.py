@@ -0,0 +1,66 @@
+"""LLM 调用计量：按阶段标签汇总、嵌套追踪器，以及经桩服务的真实调用记录"""
+import pytest
+
+from src.llm import LLM
+from src.utils.llm_metrics import UsageTracker, record_llm_call, track_usage
+
+
+def test_summary_by_label_and_totals():
+    tracker = UsageTracker()
+    with track_usage(tracker):
+        record_llm_call("a", "m1", prompt_tokens=10, completion_tokens=5, latency=0.5)
+        record_llm_call("a", "m2", prompt_tokens=20, completion_tokens=5, latency=1.5, retries=1)
+        record_llm_call("b", "m1", source="cache", latency=0.0)
+        record_llm_call(None, "m1", error="boom", aborted="max_tokens")
+    summary = tracker.summary_by_label()
+    assert summary["a"]["calls"] == 2 and summary["a"]["total_tokens"] == 40
+    assert summary["a"]["avg_latency"] == pytest.approx(1.0) and summary["a"]["max_latency"] == 1.5
+    assert summary["a"]["retries"] == 1 and summary["a"]["models"] == ["m1", "m2"]
+    assert summary["b"]["cache_hits"] == 1
+    assert summary["unlabeled"]["errors"] == 1 and summary["unlabeled"]["aborted"] == 1
+    totals = tracker.totals()
+    assert totals["calls"] == 4 and totals["total_tokens"] == 40 and totals["latency"] == 2.0
+
+
+def test_format_table_lists_labels_by_token_cost():
+    tracker = UsageTracker()
+    assert tracker.format_table() == ""
+    with track_usage(tracker):
+        record_llm_call("cheap", "m", prompt_tokens=1)
+        record_llm_call("expensive", "m", prompt_tokens=100)
+    rows = tracker.format_table().splitlines()
+    assert rows[2].startswith("| expensive |") and rows[3].startswith("| cheap |")
+    assert rows[-1].startswith("| **合计** | 2 | 101 |")
+
+
+def test_nested_trackers_both_receive_records():
+    outer, inner = UsageTracker(), UsageTracker()
+    with track_usage(outer):
+        record_llm_call("x", "m")
+        with track_usage(inner):
+            record_llm_call("y", "m")
+    assert len(outer.records) == 2 and [r["label"] for r in inner.records] == ["y"]
+
+
+def test_max_records_keeps_the_latest():
+    tracker = UsageTracker(max_records=2)
+    for i in range(3):
+        tracker.add({"i": i})
+    assert [r["i"] for r in tracker.records] == [1, 2]
+
+
+def test_llm_calls_are_recorded_with_usage(stub):
+    stub()
+    tracker = UsageTracker()
+    llm = LLM(api_key="k")
+    with track_usage(tracker):
+        llm.generate([{"role": "user", "content": "你好"}], label="test.generate")
+        list(llm.generate_stream([{"role": "user", "content": "你好"}], label="test.stream"))
+    records = {r["label"]: r for r in tracker.records}
+    generated = records["test.generate"]
+    assert generated["source"] == "api" and generated["error"] is None
+    assert generated["prompt_tokens"] > 0 and generated["completion_tokens"] > 0
+    assert generated["model"] == llm.model
+    # 流式响应没有 usage，token 数为估算值
+    assert records["test.stream"]["estimated"] is True
+    assert records["test.stream"]["completion_tokens"] > 0
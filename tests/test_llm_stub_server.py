@@ -0,0 +1,80 @@
+"""离线桩服务：规则答案、预置答案、工具调用、流式输出、错误注入与 rpm 限流"""
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+from src.utils.llm_stub_server import create_stub_app, rule_based_answer
+
+TOOLS = [{"type": "function", "function": {"name": "search", "parameters": {
+    "type": "object", "properties": {"query": {"type": "string"}, "top_k": {"type": "integer"}}}}},
+         {"type": "function", "function": {"name": "open", "parameters": {"type": "object", "properties": {}}}}]
+
+
+@pytest.fixture
+def client():
+    """返回 start(**config)，创建无延迟的桩服务并返回 TestClient"""
+    def start(**config):
+        return TestClient(create_stub_app({"latency": 0.0, "latency_jitter": 0.0, **config}))
+    return start
+
+
+def _chat(test_client, content, path="/api/v3/chat/completions", **body):
+    return test_client.post(path, json={"model": "m", "messages": [{"role": "user", "content": content}], **body})
+
+
+def test_rule_based_brand_mentions():
+    prompt = "请找出以下内容中提到的品牌及其频次：\n小米和特斯拉比，小米更便宜\n请输出JSON格式"
+    assert rule_based_answer(prompt) == {"小米": 2, "特斯拉": 1}
+    assert rule_based_answer("随便聊聊") is None
+
+
+def test_default_canned_and_rule_answers(client):
+    test_client = client(canned=[{"pattern": "^天气", "response": {"天气": "晴"}}])
+    default = _chat(test_client, "你好").json()
+    assert default["choices"][0]["message"]["content"] == "这是离线桩服务的模拟回复。"
+    assert default["usage"]["completion_tokens"] > 0
+    assert json.loads(_chat(test_client, "天气如何").json()["choices"][0]["message"]["content"]) == {"天气": "晴"}
+    rule = _chat(test_client, "提到的品牌及其频次：蔚来\n请输出JSON格式", path="/v1/chat/completions").json()
+    assert json.loads(rule["choices"][0]["message"]["content"]) == {"蔚来": 1}
+    stats = test_client.get("/stats").json()
+    assert stats["requests"] == 3 and stats["canned_answers"] == 1 and stats["rule_answers"] == 1
+
+
+@pytest.mark.parametrize("mode, names", [("all", ["search", "open"]), ("first", ["search"])])
+def test_tool_calls_follow_the_mode(client, mode, names):
+    message = _chat(client(tool_call_mode=mode), "查一下", tools=TOOLS).json()["choices"][0]["message"]
+    assert [call["function"]["name"] for call in message["tool_calls"]] == names
+    # 参数按 JSON Schema 生成示例值
+    assert json.loads(message["tool_calls"][0]["function"]["arguments"]) == {"query": "stub", "top_k": 1}
+
+
+def test_tool_choice_none_returns_text(client):
+    message = _chat(client(), "查一下", tools=TOOLS, tool_choice="none").json()["choices"][0]["message"]
+    assert message["content"] == "这是离线桩服务的模拟回复。" and "tool_calls" not in message
+
+
+def test_stream_splits_content_into_chunks(client):
+    response = _chat(client(stream_chunk_chars=4), "你好", stream=True)
+    events = [line[len("data: "):] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    pieces = [c["choices"][0]["delta"].get("content", "") for c in chunks]
+    assert "".join(pieces) == "这是离线桩服务的模拟回复。"
+    assert all(len(piece) <= 4 for piece in pieces)
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+
+
+def test_injected_errors_are_counted(client):
+    test_client = client(error_429_rate=1.0, seed=1)
+    response = _chat(test_client, "你好")
+    assert response.status_code == 429 and response.json()["error"]["message"] == "injected 429"
+    test_client = client(error_5xx_rate=1.0, seed=1)
+    assert _chat(test_client, "你好").status_code in (500, 502, 503)
+    assert test_client.get("/stats").json()["injected_5xx"] == 1
+
+
+def test_rpm_limit(client):
+    test_client = client(rpm=2)
+    assert [_chat(test_client, "你好").status_code for _ in range(3)] == [200, 200, 429]
+    assert test_client.get("/stats").json()["rate_limited"] == 1
@@ -0,0 +1,85 @@
+"""ModelRouter 的档位选择与 LLM 按回退链切换到下一档模型"""
+import httpx
+import pytest
+from openai import APIConnectionError
+
+import src.llm as llm_module
+from src.llm import LLM, MODEL_CONTEXT_WINDOWS, MODEL_MAP, MODEL_TIERS, ModelRouter
+
+CHEAP, STRONG = MODEL_MAP["doubao-lite"], MODEL_MAP["deepseek-v3"]
+RULES = {
+    "extraction": {"tiers": ["cheap", "strong"], "max_prompt_tokens": 100, "latency_budget": 30},
+    "report": {"tiers": ["strong", "cheap"]},
+}
+
+
+def _params(content, **extra):
+    return {"model": STRONG, "messages": [{"role": "user", "content": content}], **extra}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = ModelRouter(RULES, MODEL_TIERS, MODEL_CONTEXT_WINDOWS)
+    monkeypatch.setattr(llm_module, "model_router", router)
+    return router
+
+
+def test_route_follows_tier_order(router):
+    decision = router.route("extraction", _params("短"))
+    assert decision["models"] == [CHEAP, STRONG]
+    assert decision["latency_budget"] == 30
+    assert router.route("report", _params("短"))["models"] == [STRONG, CHEAP]
+
+
+def test_large_prompt_skips_the_first_tier(router):
+    decision = router.route("extraction", _params("长" * 200))
+    assert decision["models"] == [STRONG]
+    assert "跳过 cheap 档" in decision["reason"]
+
+
+def test_models_whose_context_window_is_too_small_are_skipped(router):
+    # 提示词放不进 doubao-lite 的 32k 上下文，但放得进 deepseek-v3 的 64k
+    decision = router.route("report", _params("长" * 20000, max_tokens=16000))
+    assert decision["models"] == [STRONG]
+
+
+def test_unknown_task_class_keeps_the_requested_model(router):
+    assert router.route("unknown", _params("短")) is None
+    llm = LLM(api_key="k")
+    candidates, routed_class = llm._route_candidates(_params("短"), None, "unknown", None)
+    assert [c["model"] for c in candidates] == [STRONG] and routed_class is None
+
+
+def test_candidates_carry_the_latency_budget_as_timeout(router):
+    llm = LLM(api_key="k")
+    candidates, routed_class = llm._route_candidates(_params("短"), None, "extraction", None)
+    assert [(c["model"], c["timeout"]) for c in candidates] == [(CHEAP, 30), (STRONG, 30)]
+    assert routed_class == "extraction"
+    # 显式指定模型或关闭路由时不路由
+    assert len(llm._route_candidates(_params("短"), "deepseek-v3", "extraction", None)[0]) == 1
+    assert len(LLM(api_key="k", routing=False)._route_candidates(_params("短"), None, "extraction", None)[0]) == 1
+
+
+class CheapTierDownLLM(LLM):
+    """cheap 档模型的请求都连接失败"""
+
+    def _send_request(self, request_params):
+        if request_params["model"] == CHEAP:
+            raise APIConnectionError(request=httpx.Request("POST", "http://stub/chat/completions"))
+        return super()._send_request(request_params)
+
+
+def test_failed_primary_falls_back_to_the_next_tier(stub, router):
+    stub()
+    completion = CheapTierDownLLM(api_key="k").generate([{"role": "user", "content": "你好"}],
+                                                        task_class="extraction", return_content_only=False)
+    assert completion.content == "这是离线桩服务的模拟回复。"
+    assert router.get_stats()["fallbacks"] == {"extraction": {f"{CHEAP}->{STRONG}": 1}}
+    assert router.get_stats()["routed"] == {"extraction": {CHEAP: 1}}
+
+
+def test_last_candidate_error_is_raised(stub, router):
+    stub()
+    router.configure("extraction", tiers=["cheap"])
+    with pytest.raises(APIConnectionError):
+        CheapTierDownLLM(api_key="k").generate([{"role": "user", "content": "你好"}], task_class="extraction")
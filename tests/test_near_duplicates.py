@@ -0,0 +1,138 @@
+"""近似重复检测在固定样本上的召回率、精确率，以及 A≈B≈C 串联时的行为"""
+import random
+
+import numpy as np
+import pytest
+
+from src.utils.near_duplicates import (NearDuplicateIndex, find_near_duplicates, lsh_bands,
+                                       minhash_signature, minhash_signatures)
+
+
+def _text(rng, length):
+    return "".join(chr(0x4E00 + rng.randrange(3000)) for _ in range(length))
+
+
+def _jaccard(a, b, k=5):
+    def shingles(text):
+        text = "".join(text.split()).lower()
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def _fixture():
+    """60 条互不相关的原文；前 40 条各有一条近似重复，后 20 条各有一条改动了 40 个字的相关文本
+
+    Returns:
+        (文本列表, 每条文本应指向的原文序号，不是重复时为 None)
+    """
+    rng = random.Random(7)
+    originals = [_text(rng, 300) for _ in range(60)]
+    duplicates = []
+    for i, original in enumerate(originals[:40]):
+        kind = i % 4
+        if kind == 0:
+            # 只改空白
+            duplicate = " ".join(original[j:j + 20] for j in range(0, 300, 20))
+        elif kind == 1:
+            # 替换一个字
+            p = rng.randrange(300)
+            duplicate = original[:p] + _text(rng, 1) + original[p + 1:]
+        elif kind == 2:
+            # 转发时追加标签
+            duplicate = original + " #转发"
+        else:
+            # 删掉几个字
+            p = rng.randrange(290)
+            duplicate = original[:p] + original[p + 3:]
+        duplicates.append(duplicate)
+    related = []
+    for original in originals[40:]:
+        p = rng.randrange(200)
+        related.append(original[:p] + _text(rng, 40) + original[p + 40:])
+    texts = originals + duplicates + related
+    truth = [None] * 60 + list(range(40)) + [None] * 20
+    return texts, truth
+
+
+def test_fixture_labels_match_true_jaccard():
+    texts, truth = _fixture()
+    duplicate_similarities = [_jaccard(texts[source], text) for text, source in zip(texts, truth) if source is not None]
+    related_similarities = [_jaccard(texts[40 + i], texts[100 + i]) for i in range(20)]
+    assert min(duplicate_similarities) > 0.95
+    assert max(related_similarities) < 0.8
+
+
+def test_recall_and_precision_on_fixture():
+    texts, truth = _fixture()
+    found = find_near_duplicates(texts, threshold=0.9)
+    true_positives = sum(1 for f, t in zip(found, truth) if f is not None and f == t)
+    flagged = sum(1 for f in found if f is not None)
+    assert true_positives / 40 >= 0.95
+    assert flagged and true_positives / flagged == 1.0
+    # 原文都是代表
+    assert found[:60] == [None] * 60
+
+
+def test_order_decides_representative():
+    texts, truth = _fixture()
+    pair = [texts[0], texts[60]]
+    assert find_near_duplicates(pair) == [None, 0]
+    assert find_near_duplicates(pair, order=[1, 0]) == [1, None]
+    # 不在 order 中的文本不参与
+    assert find_near_duplicates(pair, order=[1]) == [None, None]
+
+
+def _chain():
+    """10 段文本：B 替换 A 的第 1 段，C 再替换 B 的第 2 段；A≈B、B≈C 约 0.8，A 与 C 约 0.66"""
+    rng = random.Random(11)
+    segments = [_text(rng, 40) for _ in range(10)]
+    a = "".join(segments)
+    b = _text(rng, 40) + "".join(segments[1:])
+    c = b[:40] + _text(rng, 40) + "".join(segments[2:])
+    return a, b, c
+
+
+def test_chain_is_not_merged_transitively():
+    a, b, c = _chain()
+    assert _jaccard(a, b) > 0.8 and _jaccard(b, c) > 0.79 and _jaccard(a, c) < 0.67
+    # B 被判为 A 的重复后不进入索引，与 A 差异较大的 C 不会经由 B 归到 A 名下
+    assert find_near_duplicates([a, b, c], threshold=0.75, num_perm=256) == [None, 0, None]
+    # B 为代表时 C 是它的重复
+    assert find_near_duplicates([b, c], threshold=0.75, num_perm=256) == [None, 0]
+
+
+def test_index_stats():
+    a, b, c = _chain()
+    index = NearDuplicateIndex(threshold=0.75, num_perm=256)
+    assert [index.add(i, text) for i, text in enumerate([a, b, c])] == [None, 0, None]
+    assert index.stats["added"] == 3
+    assert index.stats["duplicates"] == 1
+
+
+def test_signature_ignores_whitespace_and_case():
+    assert np.array_equal(minhash_signature("Hello World 你好"), minhash_signature("hello  world\n你好"))
+
+
+def test_batch_signatures_match_single_signatures():
+    rng = random.Random(3)
+    # 600 条跨越批量计算的分块边界 (num_perm=128 时每块 512 条)，包含空文本与短于 k 的文本
+    texts = [_text(rng, rng.randrange(0, 30)) for _ in range(600)]
+    batch = minhash_signatures(texts)
+    for i in (0, 1, 2, 511, 512, 599):
+        assert np.array_equal(batch[i], minhash_signature(texts[i]))
+    empty = [i for i, text in enumerate(texts) if not text]
+    assert empty and (batch[empty] == np.iinfo(np.uint32).max).all()
+
+
+def test_lsh_bands_cover_threshold():
+    for threshold in (0.5, 0.75, 0.9):
+        bands, rows = lsh_bands(threshold, 128)
+        assert bands * rows == 128
+        assert (1 / bands) ** (1 / rows) <= threshold
+
+
+@pytest.mark.parametrize("options", [{"threshold": 0}, {"threshold": 1.5}, {"num_perm": 100}])
+def test_invalid_config(options):
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(**options)
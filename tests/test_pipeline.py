@@ -0,0 +1,143 @@
+"""Pipeline 的结果顺序、反压与单条失败的传递"""
+import time
+import random
+import threading
+
+import pytest
+
+from src.utils.pipeline import Pipeline
+
+
+def _run(pipeline, timeout=10):
+    """在线程中执行流水线，超时视为卡死"""
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(pipeline.run()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "流水线没有结束"
+    return results
+
+
+def test_results_are_ordered_by_item_index():
+    rng = random.Random(0)
+    delays = [rng.uniform(0, 0.01) for _ in range(30)]
+    pipeline = Pipeline(30, queue_size=4)
+    pipeline.add_stage("a", lambda i, upstream: time.sleep(delays[i]) or i * 10, workers=4)
+    pipeline.add_stage("b", lambda i, upstream: upstream["a"] + 1, workers=3, after=["a"])
+    pipeline.add_stage("c", lambda i, upstream: -upstream["a"], workers=2, after=["a"])
+    pipeline.add_stage("d", lambda i, upstream: (upstream["b"], upstream["c"]), workers=2, after=["b", "c"])
+    results = _run(pipeline)
+    assert results["a"] == [i * 10 for i in range(30)]
+    assert results["d"] == [(i * 10 + 1, -i * 10) for i in range(30)]
+    assert pipeline.stats["items"] == 30
+
+
+def test_downstream_starts_before_upstream_finishes():
+    events = []
+    lock = threading.Lock()
+
+    def record(name):
+        def fn(i, upstream):
+            with lock:
+                events.append((name, i))
+            time.sleep(0.005)
+            return i
+        return fn
+
+    pipeline = Pipeline(10)
+    pipeline.add_stage("a", record("a"), workers=1)
+    pipeline.add_stage("b", record("b"), workers=1, after=["a"])
+    _run(pipeline)
+    # 第 0 条进入下游时上游还没有处理完全部条目 (没有阶段之间的屏障)
+    assert events.index(("b", 0)) < events.index(("a", 9))
+
+
+def test_bounded_queue_applies_backpressure():
+    state = {"produced": 0, "consumed": 0, "max_lead": 0}
+    lock = threading.Lock()
+
+    def produce(i, upstream):
+        with lock:
+            state["produced"] += 1
+            state["max_lead"] = max(state["max_lead"], state["produced"] - state["consumed"])
+        return i
+
+    def consume(i, upstream):
+        with lock:
+            state["consumed"] += 1
+        time.sleep(0.005)
+        return i
+
+    pipeline = Pipeline(40, queue_size=1)
+    pipeline.add_stage("fast", produce, workers=1)
+    pipeline.add_stage("slow", consume, workers=1, after=["fast"])
+    results = _run(pipeline)
+    assert results["slow"] == list(range(40))
+    # 上游最多领先：下游正在处理的 1 条 + 队列中的 1 条 + 阻塞在入队的 1 条
+    assert state["max_lead"] <= 3
+
+
+def test_failed_item_does_not_affect_others():
+    def flaky(i, upstream):
+        if i == 3:
+            raise ValueError("bad item")
+        return i
+
+    seen = {}
+    pipeline = Pipeline(6)
+    pipeline.add_stage("a", flaky, workers=2)
+    pipeline.add_stage("b", lambda i, upstream: seen.setdefault(i, upstream["a"]), workers=2, after=["a"])
+    results = _run(pipeline)
+    assert results["a"] == [0, 1, 2, None, 4, 5]
+    # 失败条目照常进入下游，上游结果为 None
+    assert seen[3] is None
+    assert results["b"] == [0, 1, 2, None, 4, 5]
+    assert pipeline.errors["a"] == {3: "bad item"}
+    assert pipeline.errors["b"] == {}
+    assert pipeline.stats["stages"]["a"]["errors"] == 1
+
+
+@pytest.mark.parametrize("error", [SystemExit(3), KeyboardInterrupt()])
+def test_base_exception_is_recorded_without_hanging(error):
+    def fn(i, upstream):
+        if i == 1:
+            raise error
+        return i
+
+    pipeline = Pipeline(4, queue_size=1)
+    pipeline.add_stage("a", fn, workers=1)
+    pipeline.add_stage("b", lambda i, upstream: upstream["a"], workers=1, after=["a"])
+    results = _run(pipeline)
+    assert results["b"] == [0, None, 2, 3]
+    assert set(pipeline.errors["a"]) == {1}
+
+
+def test_group_failure_is_recorded_for_every_member():
+    def analyze(group):
+        if 2 in group:
+            raise RuntimeError("packed call failed")
+        # 组内缺失的条目结果为 None
+        return {index: index for index in group if index != 0}
+
+    pipeline = Pipeline(6)
+    pipeline.add_stage("a", analyze, workers=2, groups=[[0, 1], [2, 3], [4, 5]])
+    pipeline.add_stage("b", lambda i, upstream: upstream["a"], workers=2, after=["a"])
+    results = _run(pipeline)
+    assert results["b"] == [None, 1, None, None, 4, 5]
+    assert set(pipeline.errors["a"]) == {2, 3}
+
+
+def test_empty_pipeline():
+    pipeline = Pipeline(0)
+    pipeline.add_stage("a", lambda i, upstream: i)
+    pipeline.add_stage("b", lambda i, upstream: i, after=["a"])
+    assert _run(pipeline) == {"a": [], "b": []}
+
+
+def test_invalid_stage_definitions():
+    pipeline = Pipeline(2)
+    with pytest.raises(ValueError):
+        pipeline.add_stage("b", lambda i, upstream: i, after=["missing"])
+    pipeline.add_stage("a", lambda i, upstream: i)
+    with pytest.raises(ValueError):
+        pipeline.add_stage("c", lambda group: {}, after=["a"], groups=[[0, 1]])
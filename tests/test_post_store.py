@@ -0,0 +1,69 @@
+"""帖子分析结果存储：查询状态、版本标签变化使旧结果失效、内容哈希与过期清理"""
+import pytest
+
+import src.tools.atomic_insights as atomic_module
+from src.utils.post_store import PostResultStore, comments_fingerprint, post_content_hash, post_store_key
+
+V1, V2 = "v1", "v2"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PostResultStore(str(tmp_path / "post_results.sqlite"))
+    yield store
+    store.close()
+
+
+def test_lookup_statuses(store):
+    store.put_many([("a", "h1", {"x": 1}), ("b", "h2", {"x": 2})], V1)
+    results, statuses = store.lookup([("a", "h1"), ("a", "h9"), ("c", "h3")], V1)
+    assert results == [{"x": 1}, None, None]
+    assert statuses == ["hit", "changed", "new"]
+    stats = store.get_stats()
+    assert stats["lookups"] == 3 and stats["hit"] == 1 and stats["reuse_ratio"] == pytest.approx(1 / 3)
+
+
+def test_version_change_invalidates_old_results(store):
+    store.put_many([("a", "h1", {"x": 1})], V1)
+    assert store.lookup([("a", "h1")], V2) == ([None], ["outdated"])
+    store.put_many([("a", "h1", {"x": 2})], V2)
+    # 每个版本各自保留结果
+    assert store.lookup([("a", "h1")], V2)[0] == [{"x": 2}]
+    assert store.lookup([("a", "h1")], V1)[0] == [{"x": 1}]
+
+
+def test_newer_content_replaces_the_old_result(store):
+    store.put_many([("a", "h1", {"x": 1})], V1)
+    store.put_many([("a", "h2", {"x": 2})], V1)
+    assert store.lookup([("a", "h1"), ("a", "h2")], V1) == ([None, {"x": 2}], ["changed", "hit"])
+    assert store.get_stats()["entries"] == 1
+
+
+def test_entries_not_accessed_within_ttl_are_evicted(tmp_path):
+    store = PostResultStore(str(tmp_path / "post_results.sqlite"), ttl_seconds=0)
+    store.put_many([("a", "h1", {"x": 1})], V1)
+    store.put_many([("b", "h2", {"x": 2})], V1)
+    assert store.get_stats()["evictions"] >= 1 and store.lookup([("a", "h1")], V1)[1] == ["new"]
+    store.close()
+
+
+def test_content_hash_ignores_comment_likes_and_order():
+    comment = {"comment_user_nick": "甲", "comment_content": "续航不错", "comment_like_count": 1}
+    other = {"comment_user_nick": "乙", "comment_content": "太贵了", "comment_like_count": 5}
+    post = {"url": "https://example.com/1", "title": "标题", "detail_desc": "正文", "comments_data": [comment, other]}
+    same = {**post, "comments_data": [{**other, "comment_like_count": 50}, comment]}
+    assert post_content_hash(post) == post_content_hash(same)
+    assert post_content_hash(post) != post_content_hash({**post, "detail_desc": "改过的正文"})
+    assert comments_fingerprint('[{"a": 1}]') != comments_fingerprint("[]")
+    content_hash = post_content_hash(post)
+    assert post_store_key(post, content_hash) == "https://example.com/1"
+    assert post_store_key({**post, "url": None}, content_hash) == f"sha256:{content_hash}"
+
+
+def test_store_version_tracks_model_mode_and_prompts(monkeypatch):
+    version = atomic_module.atomic_store_version("m", fused=True)
+    assert version == atomic_module.atomic_store_version("m", fused=True)
+    assert version != atomic_module.atomic_store_version("other", fused=True)
+    assert version != atomic_module.atomic_store_version("m", fused=False)
+    monkeypatch.setattr(atomic_module, "POST_CONTENT_TOKEN_BUDGET", atomic_module.POST_CONTENT_TOKEN_BUDGET + 1)
+    assert version != atomic_module.atomic_store_version("m", fused=True)
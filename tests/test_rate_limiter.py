@@ -0,0 +1,147 @@
+"""ModelRateLimiter 的先来先到排队与 TPM 事后修正"""
+import time
+import asyncio
+import threading
+
+import pytest
+
+from src.utils.rate_limiter import ModelRateLimiter, RateLimiter
+
+
+def _drained(rpm=None, tpm=None):
+    """额度清零的限流器，之后的请求都需要排队等待补充"""
+    limiter = ModelRateLimiter("m", rpm=rpm, tpm=tpm)
+    for bucket in (limiter.requests, limiter.tokens):
+        if bucket is not None:
+            bucket.tokens = 0.0
+    return limiter
+
+
+def _start_in_order(limiter, amounts):
+    """按顺序启动线程排队，返回线程与获得额度的顺序"""
+    order = []
+    threads = []
+    for i, amount in enumerate(amounts):
+        thread = threading.Thread(target=lambda i=i, amount=amount: (limiter.acquire(amount), order.append(i)))
+        thread.start()
+        threads.append(thread)
+        # 等该线程进入队列后再启动下一个
+        deadline = time.monotonic() + 2
+        while len(limiter._queue) < i + 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+    return threads, order
+
+
+def test_requests_are_granted_in_arrival_order():
+    limiter = _drained(rpm=1200)  # 每 50ms 补充一次请求额度
+    threads, order = _start_in_order(limiter, [1] * 5)
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2, 3, 4]
+    assert limiter.stats["acquired"] == 5
+    assert not limiter._queue
+
+
+def test_small_request_does_not_overtake_large_one():
+    # 队首的大请求需要等待更久，后到的小请求也不能插队
+    limiter = _drained(tpm=6000)  # 每秒补充 100 token
+    threads, order = _start_in_order(limiter, [30, 1])
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1]
+
+
+def test_async_requests_are_granted_in_arrival_order():
+    limiter = _drained(rpm=1200)
+
+    async def main():
+        order = []
+
+        async def acquire(i):
+            await limiter.acquire_async(1)
+            order.append(i)
+
+        tasks = []
+        for i in range(4):
+            tasks.append(asyncio.ensure_future(acquire(i)))
+            await asyncio.sleep(0)
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+        return order
+
+    assert asyncio.run(main()) == [0, 1, 2, 3]
+
+
+def test_settle_refunds_overestimated_tokens():
+    limiter = ModelRateLimiter("m", tpm=1000)
+    reservation = limiter.acquire(400)
+    assert limiter.tokens.tokens == pytest.approx(600, abs=1)
+    limiter.settle(reservation, 100)
+    assert limiter.tokens.tokens == pytest.approx(900, abs=1)
+    assert limiter.stats["token_corrections"] == 1
+
+
+def test_settle_charges_underestimated_tokens_and_delays_next_request():
+    limiter = ModelRateLimiter("m", tpm=600)
+    reservation = limiter.acquire(100)
+    limiter.settle(reservation, 700)
+    # 余额允许为负，后续请求要等欠下的额度补回
+    assert limiter.tokens.tokens == pytest.approx(-100, abs=1)
+    assert limiter.tokens.wait_time(1) > 10
+
+
+def test_settle_without_usage_keeps_estimate():
+    limiter = ModelRateLimiter("m", tpm=1000)
+    reservation = limiter.acquire(400)
+    limiter.settle(reservation, None)
+    assert limiter.tokens.tokens == pytest.approx(600, abs=1)
+    assert limiter.stats["token_corrections"] == 0
+
+
+def test_interrupted_acquire_leaves_the_queue():
+    limiter = _drained(rpm=1200)
+
+    def interrupted_wait(timeout=None):
+        raise KeyboardInterrupt
+
+    limiter._cond.wait = interrupted_wait
+    with pytest.raises(KeyboardInterrupt):
+        limiter.acquire(1)
+    assert not limiter._queue
+
+
+def test_cancelled_async_acquire_leaves_the_queue():
+    limiter = _drained(rpm=60)
+
+    async def main():
+        task = asyncio.ensure_future(limiter.acquire_async(1))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert not limiter._queue
+
+
+def test_unconfigured_model_is_not_limited():
+    limiter = RateLimiter({"m": {"rpm": 10}})
+    assert limiter.acquire("other", 100) is None
+    assert limiter.acquire("m", 100) is not None
+    limiter.configure("m")
+    assert limiter.get("m") is None
+
+
+def test_interrupted_concurrency_wait_refunds_reservation(monkeypatch):
+    import src.llm as llm_module
+
+    class InterruptedController:
+        def acquire(self):
+            raise KeyboardInterrupt
+
+    limiter = RateLimiter({"m": {"tpm": 10000}})
+    monkeypatch.setattr(llm_module, "rate_limiter", limiter)
+    monkeypatch.setattr(llm_module.concurrency_controllers, "get", lambda model_id: InterruptedController())
+    request_params = {"model": "m", "messages": [{"role": "user", "content": "你好"}], "max_tokens": 100}
+    with pytest.raises(KeyboardInterrupt):
+        llm_module.LLM(api_key="k")._send_request(request_params)
+    assert limiter.get("m").tokens.tokens == pytest.approx(10000, abs=1)
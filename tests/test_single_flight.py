@@ -0,0 +1,163 @@
+"""SingleFlight 合并在途的相同请求，领头调用的结果与异常传给所有等待者"""
+import time
+import asyncio
+import threading
+
+import pytest
+
+from src.utils.single_flight import SingleFlight
+
+
+def _run_followers(flight, key, count, fn):
+    """在领头调用执行期间启动 count 个相同 key 的调用，返回各线程的结果或异常"""
+    outcomes = [None] * count
+
+    def follower(i):
+        try:
+            outcomes[i] = flight.do(key, fn)
+        except BaseException as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=follower, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 2
+    while flight.stats["coalesced"] < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return threads, outcomes
+
+
+def test_concurrent_calls_execute_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    leader = threading.Thread(target=flight.do, args=("k", fn))
+    leader.start()
+    while not calls:
+        time.sleep(0.001)
+    threads, outcomes = _run_followers(flight, "k", 4, fn)
+    release.set()
+    for thread in threads + [leader]:
+        thread.join(5)
+
+    assert calls == [1]
+    assert outcomes == ["result"] * 4
+    assert flight.stats == {"executed": 1, "coalesced": 4, "retried": 0}
+
+
+def test_leader_error_propagates_to_all_waiters():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+    error = ValueError("upstream failed")
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise error
+
+    leader_outcome = []
+
+    def leader():
+        try:
+            flight.do("k", fn)
+        except ValueError as e:
+            leader_outcome.append(e)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    started.wait(5)
+    threads, outcomes = _run_followers(flight, "k", 3, fn)
+    release.set()
+    for thread in threads + [leader_thread]:
+        thread.join(5)
+
+    assert leader_outcome == [error]
+    assert all(outcome is error for outcome in outcomes)
+    # 失败的调用不会留在在途表中，下一次调用重新执行
+    assert flight.do("k", lambda: "retried") == "retried"
+    assert flight.get_stats()["in_flight"] == 0
+
+
+def test_async_leader_error_propagates_to_all_waiters():
+    flight = SingleFlight()
+
+    async def main():
+        release = asyncio.Event()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            raise ValueError("upstream failed")
+
+        tasks = [asyncio.ensure_future(flight.do_async("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        return calls, outcomes
+
+    calls, outcomes = asyncio.run(main())
+    assert calls == [1]
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flight.stats == {"executed": 1, "coalesced": 2, "retried": 0}
+
+
+def test_cancelled_async_waiter_does_not_cancel_others():
+    flight = SingleFlight()
+
+    async def main():
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flight.do_async("k", fn))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do_async("k", fn))
+        other = asyncio.ensure_future(flight.do_async("k", fn))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader, await other
+
+    assert asyncio.run(main()) == ("result", "result")
+
+
+def test_cancelled_async_leader_hands_over_to_waiter():
+    flight = SingleFlight()
+
+    async def main():
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                # 领头的调用一直挂起，直到被取消
+                await asyncio.Event().wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flight.do_async("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # 等待者没有被取消，而是重新发起调用
+        return await asyncio.wait_for(follower, 1), calls
+
+    result, calls = asyncio.run(main())
+    assert result == "result"
+    assert calls == [1, 1]
+    assert flight.stats == {"executed": 2, "coalesced": 0, "retried": 1}
+    assert flight.get_stats()["in_flight"] == 0
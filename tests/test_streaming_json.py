@@ -0,0 +1,83 @@
+"""IncrementalJSONParser 的逐元素产出与 StreamingJSONError"""
+import pytest
+
+from src.utils.streaming_json import IncrementalJSONParser, StreamingJSONError
+
+
+def _feed_all(parser, chunks):
+    """逐块喂入，返回每块产出的事件列表"""
+    return [parser.feed(chunk) for chunk in chunks]
+
+
+def test_array_elements_are_yielded_as_they_close():
+    parser = IncrementalJSONParser()
+    events = _feed_all(parser, ['[{"a": 1}', ', 2', ', [3, 4]', ', "x"', "]"])
+    # 嵌套的值在闭合时产出；标量要等到后面的逗号或右括号
+    assert events == [[(0, {"a": 1})], [], [(1, 2), (2, [3, 4])], [], [(3, "x")]]
+    assert parser.done
+    assert parser.close() == []
+
+
+def test_object_values_are_yielded_as_they_close():
+    parser = IncrementalJSONParser()
+    events = _feed_all(parser, ['{"x": [1, ', '2], "y": ', '3', "}"])
+    assert events == [[], [("x", [1, 2])], [], [("y", 3)]]
+    assert parser.done
+
+
+def test_character_by_character_feed_matches_whole_feed():
+    text = '说明\n```json\n[{"a": "},]"}, {"b": [1, 2]}, 3]\n```'
+    whole = IncrementalJSONParser().feed(text)
+    parser = IncrementalJSONParser()
+    pieces = [event for ch in text for event in parser.feed(ch)]
+    assert pieces == whole == [(0, {"a": "},]"}), (1, {"b": [1, 2]}), (2, 3)]
+
+
+def test_comments_and_trailing_commas_are_ignored():
+    parser = IncrementalJSONParser()
+    events = _feed_all(parser, ["[1, /", "/ 注释\n 2,", ' {"c": 3,},', "]"])
+    assert [event for chunk in events for event in chunk] == [(0, 1), (1, 2), (2, {"c": 3})]
+
+
+def test_output_after_top_level_closes_is_ignored():
+    parser = IncrementalJSONParser()
+    assert parser.feed("[1] 以上是结果 [2]") == [(0, 1)]
+    assert parser.feed(", 3]") == []
+
+
+def test_no_json_within_preamble_limit():
+    parser = IncrementalJSONParser(max_preamble_chars=20)
+    assert parser.feed("x" * 20) == []
+    with pytest.raises(StreamingJSONError):
+        parser.feed("x")
+
+
+def test_json_starting_after_preamble_limit():
+    parser = IncrementalJSONParser(max_preamble_chars=20)
+    with pytest.raises(StreamingJSONError):
+        parser.feed("x" * 21 + "[1]")
+
+
+@pytest.mark.parametrize("chunks", [
+    ["[1, foo, 3]"],
+    ['[{"a": 1}, ', "{bad}", "]"],
+    ['{"a" 1, "b": 2}'],
+])
+def test_unparsable_element(chunks):
+    parser = IncrementalJSONParser()
+    with pytest.raises(StreamingJSONError):
+        _feed_all(parser, chunks)
+
+
+def test_close_when_truncated():
+    parser = IncrementalJSONParser()
+    assert parser.feed('[{"a": 1}, {"b"') == [(0, {"a": 1})]
+    with pytest.raises(StreamingJSONError, match="截断"):
+        parser.close()
+
+
+def test_close_when_no_json_appeared():
+    parser = IncrementalJSONParser()
+    parser.feed("抱歉，我无法回答")
+    with pytest.raises(StreamingJSONError, match="没有 JSON"):
+        parser.close()
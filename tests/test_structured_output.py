@@ -0,0 +1,130 @@
+"""结构化输出：schema 校验、只修复出错片段并合并回结果、截断输出不修复，以及按标签的统计"""
+import asyncio
+import json
+
+import pytest
+
+import src.utils.structured_output as structured_output
+from src.llm import LLM, AsyncLLM
+from src.utils.structured_output import (ExtractionStats, StructuredOutputError, repair_fragment,
+                                         validate_schema)
+
+SCHEMA = {
+    "type": "object",
+    "required": ["sentiment", "features", "score"],
+    "properties": {
+        "sentiment": {"type": "string", "enum": ["positive", "negative", "neutral"]},
+        "features": {"type": "object", "additionalProperties": {"type": "string"}},
+        "score": {"type": "integer"},
+    },
+}
+VALID = {"sentiment": "positive", "features": {"续航": "好"}, "score": 4}
+MESSAGES = [{"role": "user", "content": "分析"}]
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = ExtractionStats()
+    monkeypatch.setattr(structured_output, "extraction_stats", stats)
+    return stats
+
+
+class ScriptedLLM(LLM):
+    """按顺序返回预设输出，并记录每次调用的消息与标签"""
+
+    def __init__(self, outputs):
+        super().__init__(api_key="k")
+        self.outputs = list(outputs)
+        self.calls = []
+
+    def generate(self, messages, label=None, **kwargs):
+        self.calls.append({"messages": messages, "label": label, **kwargs})
+        output = self.outputs.pop(0)
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+
+def test_validate_schema_reports_paths():
+    data = {"sentiment": "great", "features": {"续航": 1}, "score": "4", "extra": True}
+    assert validate_schema(data, SCHEMA) == [
+        "$.sentiment: 取值应为 ['positive', 'negative', 'neutral'] 之一",
+        "$.features.续航: 应为 string，实际为 int",
+        "$.score: 应为 integer，实际为 str",
+    ]
+    assert validate_schema([], SCHEMA) == ["$: 应为 object，实际为 list"]
+    assert validate_schema(VALID, SCHEMA) == []
+
+
+def test_repair_fragment_selects_only_the_failing_fields():
+    data = {**VALID, "score": "4"}
+    fragment, fragment_schema, keys = repair_fragment(data, validate_schema(data, SCHEMA), SCHEMA)
+    assert fragment == {"score": "4"} and keys == ["score"]
+    assert fragment_schema["properties"] == {"score": {"type": "integer"}}
+    # 根级错误时整体替换
+    assert repair_fragment(data, ["$: 应为 object"], SCHEMA)[2] is None
+
+
+def test_valid_output_needs_no_repair(stats):
+    llm = ScriptedLLM([json.dumps(VALID)])
+    assert llm.generate_structured(MESSAGES, SCHEMA, label="t") == VALID
+    assert len(llm.calls) == 1 and llm.calls[0]["response_format"] == {"type": "json_object"}
+    assert stats.get_stats()["t"]["calls"] == 1 and stats.get_stats()["t"]["repairs"] == 0
+
+
+def test_invalid_fields_are_repaired_and_merged(stats):
+    broken = {**VALID, "score": "四分", "sentiment": "好"}
+    llm = ScriptedLLM([json.dumps(broken, ensure_ascii=False), '{"score": 4, "sentiment": "positive"}'])
+    assert llm.generate_structured(MESSAGES, SCHEMA, label="t") == VALID
+    repair_call = llm.calls[1]
+    assert repair_call["label"] == "t.repair"
+    # 修复请求只包含出错的片段，不包含原始输入与未出错的字段
+    prompt = repair_call["messages"][0]["content"]
+    assert '"score": "四分"' in prompt and "续航" not in prompt and "分析" not in prompt
+    entry = stats.get_stats()["t"]
+    assert entry["validation_failures"] == 1 and entry["repairs"] == 1 and entry["repaired"] == 1
+    assert entry["repair_success_rate"] == 1.0
+
+
+def test_unparseable_output_is_replaced_by_the_repair(stats):
+    llm = ScriptedLLM(["好的，结果如下：没有JSON", json.dumps(VALID)])
+    assert llm.generate_structured(MESSAGES, SCHEMA, label="t") == VALID
+    assert stats.get_stats()["t"]["parse_failure_rate"] == 1.0
+
+
+def test_failed_repairs_raise(stats):
+    llm = ScriptedLLM([json.dumps({**VALID, "score": "四"}, ensure_ascii=False), '{"score": "还是四"}',
+                       '{"score": "仍然是四"}'])
+    with pytest.raises(StructuredOutputError) as excinfo:
+        llm.generate_structured(MESSAGES, SCHEMA, max_repairs=2, label="t")
+    assert excinfo.value.errors == ["$.score: 应为 integer，实际为 str"]
+    assert stats.get_stats()["t"]["repairs"] == 2 and stats.get_stats()["t"]["failed"] == 1
+
+
+def test_repair_request_error_stops_repairing(stats):
+    llm = ScriptedLLM([json.dumps({**VALID, "score": "四"}, ensure_ascii=False), RuntimeError("超时")])
+    with pytest.raises(StructuredOutputError):
+        llm.generate_structured(MESSAGES, SCHEMA, max_repairs=3, label="t")
+    assert len(llm.calls) == 2
+
+
+def test_truncated_output_is_an_error_without_repair(stats):
+    truncated = json.dumps(VALID, ensure_ascii=False)[:-8]
+    llm = ScriptedLLM([truncated])
+    with pytest.raises(StructuredOutputError) as excinfo:
+        llm.generate_structured(MESSAGES, SCHEMA, label="t")
+    assert excinfo.value.errors[0] == "$: 输出被截断，内容不完整"
+    assert len(llm.calls) == 1
+    entry = stats.get_stats()["t"]
+    assert entry["truncated"] == 1 and entry["truncation_rate"] == 1.0 and entry["repairs"] == 0
+
+
+def test_async_generate_structured_repairs(stats):
+    outputs = [json.dumps({**VALID, "score": "四"}, ensure_ascii=False), '{"score": 4}']
+
+    class ScriptedAsyncLLM(AsyncLLM):
+        async def generate(self, messages, label=None, **kwargs):
+            return outputs.pop(0)
+
+    assert asyncio.run(ScriptedAsyncLLM(api_key="k").generate_structured(MESSAGES, SCHEMA, label="t")) == VALID
+    assert stats.get_stats()["t"]["repaired"] == 1
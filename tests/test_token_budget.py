@@ -0,0 +1,68 @@
+"""TokenBudgeter：按 token 截取前缀、按优先级装入片段，以及按上下文窗口裁剪请求"""
+from src.llm import MODEL_MAP, TokenBudgeter
+
+MODEL = MODEL_MAP["doubao-lite"]
+
+
+def _budgeter(window=1000):
+    return TokenBudgeter({MODEL: window})
+
+
+def test_truncate_keeps_the_longest_prefix_within_budget():
+    budgeter = _budgeter()
+    text = "续航表现很不错，" * 50
+    truncated = budgeter.truncate(text, 40)
+    assert text.startswith(truncated)
+    assert budgeter.count(truncated) <= 40 < budgeter.count(text[:len(truncated) + 1])
+    assert budgeter.stats["truncated"] == 1
+    # 未超出预算时原样返回
+    assert budgeter.truncate("短文本", 40) == "短文本"
+    assert budgeter.truncate(text, 0) == ""
+
+
+def test_counts_are_cached():
+    budgeter = _budgeter()
+    budgeter.count("同一段帖子内容")
+    budgeter.count("同一段帖子内容")
+    assert budgeter.stats["hits"] == 1 and budgeter.stats["misses"] == 1
+    small = TokenBudgeter({}, max_cache_entries=1)
+    small.count("甲")
+    small.count("乙")
+    assert small.get_stats()["cached"] == 1
+
+
+def test_fit_sections_keeps_priority_order_and_display_order():
+    budgeter = _budgeter()
+    title, body, comment = "标题", "正文" * 30, "评论" * 30
+    budget = budgeter.count(title) + budgeter.count(comment) + 2 * budgeter.count("\n")
+    # 正文优先级低于评论时被丢弃，评论仍放在原来的位置
+    fitted = budgeter.fit_sections([(0, title), (2, body), (1, comment)], budget)
+    assert fitted == f"{title}\n{comment}"
+    # 预算足够时全部保留
+    assert budgeter.fit_sections([(0, title), (1, body)], 1000) == f"{title}\n{body}"
+
+
+def test_fit_sections_truncates_the_first_overflowing_section():
+    budgeter = _budgeter()
+    body = "正文内容" * 50
+    fitted = budgeter.fit_sections([(0, "标题"), (1, body), (2, "评论")], 40, min_partial_tokens=4)
+    title, partial = fitted.split("\n")
+    assert title == "标题" and body.startswith(partial) and 0 < len(partial) < len(body)
+    # 剩余预算不足 min_partial_tokens 时丢弃而不截断
+    assert budgeter.fit_sections([(0, "标题"), (1, body)], 40, min_partial_tokens=100) == "标题"
+
+
+def test_fit_request_trims_the_longest_non_system_message():
+    budgeter = _budgeter(window=300)
+    system = {"role": "system", "content": "系统提示" * 20}
+    params = {"model": MODEL, "max_tokens": 100,
+              "messages": [system, {"role": "user", "content": "帖子" * 400}]}
+    fitted = budgeter.fit_request(params)
+    assert fitted is not params and fitted["messages"][0] == system
+    total = sum(budgeter.count(m["content"]) + 4 for m in fitted["messages"])
+    assert total <= budgeter.budget_for(MODEL, 100) == 200
+    # 未超出预算或模型未知时原样返回
+    short = {"model": MODEL, "max_tokens": 100, "messages": [{"role": "user", "content": "你好"}]}
+    assert budgeter.fit_request(short) is short
+    unknown = {**params, "model": "unknown-model"}
+    assert budgeter.fit_request(unknown) is unknown